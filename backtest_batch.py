@@ -0,0 +1,111 @@
+from typing import Dict, Union
+
+import pandas as pd
+
+from backtest_components import DuckDBDataHandler
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_REPORT, VERBOSITY_SILENT
+from data_manager import DataManager
+from events import Event
+
+
+class _FanOutQueue:
+    """把共享数据处理器发出的 MarketEvent 同时放入每个策略栈自己的事件队列。"""
+    def __init__(self):
+        self.queues = []
+
+    def put(self, event: Event):
+        for queue in self.queues:
+            queue.put(event)
+
+
+class MultiStrategyBacktester:
+    """
+    在同一段数据上同时回测多个策略（或同一策略的多组参数）。
+    - 数据和品种规格只从DuckDB加载一次，所有策略共享同一个数据处理器和同一组K线游标。
+    - 每个策略拥有独立的事件队列、投资组合、执行处理器和网关（即一个完整的 EventDrivenBacktester），
+      主循环每推进一根K线，就把同一个 MarketEvent 依次交给每个策略栈处理完毕，再推进下一根。
+    - 某个策略抛出异常时只停止该策略，其余策略继续运行，异常信息记录在结果的 error 列中。
+    """
+    def __init__(self, strategies: Dict[str, Union[type, tuple]], symbol: str, timeframe: str, start_date: str,
+                 end_date: str, initial_cash: float = 10000.0, bars=None, extra_symbols: list = None,
+                 symbol_specs: dict = None, verbosity: int = VERBOSITY_SILENT, **engine_kwargs):
+        """
+        :param strategies: {名称: 策略类} 或 {名称: (策略类, 参数字典)}，名称作为结果表的索引。
+        :param bars: 可选，已加载好的RatesDTO数组（或 {symbol: 数组} 字典），提供时不访问DuckDB。
+        :param engine_kwargs: 传给每个 EventDrivenBacktester 的其他参数，例如 intrabar、intrabar_rule。
+        """
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.start_date = start_date
+        self.end_date = end_date
+        self.initial_cash = initial_cash
+        symbols = [symbol] + [s for s in (extra_symbols or []) if s != symbol]
+
+        verbose = verbosity >= VERBOSITY_REPORT
+        self._fan_out = _FanOutQueue()
+        self.data_handler = DuckDBDataHandler(self._fan_out, symbols, timeframe, start_date, end_date, bars=bars,
+                                              verbose=verbose)
+        if symbol_specs is None:
+            symbol_specs = DataManager(verbose=verbose).get_symbol_specs(symbols) if bars is None else {}
+
+        self.backtesters: Dict[str, EventDrivenBacktester] = {}
+        for name, spec in strategies.items():
+            strategy_class, params = spec if isinstance(spec, tuple) else (spec, None)
+            backtester = EventDrivenBacktester(strategy_class, symbol, timeframe, start_date, end_date, initial_cash,
+                                               params=params, extra_symbols=extra_symbols, verbosity=verbosity,
+                                               symbol_specs=symbol_specs, data_handler=self.data_handler,
+                                               **engine_kwargs)
+            self.backtesters[name] = backtester
+            self._fan_out.queues.append(backtester.events)
+        self.errors: Dict[str, str] = {}
+
+    def run(self) -> pd.DataFrame:
+        """
+        运行全部策略。
+        :return: 每行一个策略的结果表（列同 EventDrivenBacktester.get_results()），以策略名称为索引。
+                 各策略的净值曲线和交易明细可通过 self.backtesters[名称] 获取。
+        """
+        active = dict(self.backtesters)
+        for name, backtester in list(active.items()):
+            self._guard(name, active, backtester._start)
+
+        data_handler = self.data_handler
+        while active and data_handler.update_bars():
+            for name, backtester in list(active.items()):
+                try:
+                    backtester.events.drain()
+                except Exception as e:
+                    self._stop(name, active, e)
+
+        for name, backtester in list(active.items()):
+            self._guard(name, active, backtester._finish)
+
+        rows = {}
+        for name, backtester in self.backtesters.items():
+            row = backtester.get_results() if name not in self.errors else {}
+            row['error'] = self.errors.get(name)
+            rows[name] = row
+        results = pd.DataFrame.from_dict(rows, orient='index')
+        results.index.name = 'strategy'
+        return results
+
+    def _guard(self, name: str, active: dict, step):
+        try:
+            step()
+        except Exception as e:
+            self._stop(name, active, e)
+
+    def _stop(self, name: str, active: dict, error: Exception):
+        active.pop(name, None)
+        self._fan_out.queues.remove(self.backtesters[name].events)
+        self.errors[name] = f"{type(error).__name__}: {error}"
+
+    def get_equity_curves(self) -> pd.DataFrame:
+        """返回每列一个策略的净值曲线表（出错停止的策略除外），所有策略共享同一时间索引。"""
+        curves = {name: backtester.get_equity_curve()['equity']
+                  for name, backtester in self.backtesters.items() if name not in self.errors}
+        if not curves:
+            return pd.DataFrame()
+        index = next(iter(curves.values())).index
+        return pd.DataFrame({name: curve.to_numpy() for name, curve in curves.items()}, index=index)
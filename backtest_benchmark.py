@@ -0,0 +1,258 @@
+"""
+回测引擎基准测试。
+
+在临时DuckDB文件中按 DataManager 的表结构生成可复现的合成K线，
+依次测量数据加载、K线推进、每个内置策略的完整回测以及网关方法的单次调用耗时，
+结果保存为JSON，便于与之前版本的结果对比以发现性能回退。
+
+用法::
+
+    python backtest_benchmark.py --bars 10000 1000000 --output bench.json
+    python backtest_benchmark.py --bars 100000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import timeit
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from backtest_components import BarCursor, DuckDBDataHandler
+from backtest_dispatcher import EventDispatcher
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_SILENT
+from data_manager import DataManager, SYMBOL_SPECS_TABLE
+from data_sync import timeframe_seconds
+from strategies.advanced_martingale_v2 import AdvancedMartingaleV2
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from strategies.eurusd_one_click_with_stops import OneClickWithStopsStrategy
+from strategies.lottery_ticket_strategy import LotteryTicketStrategy
+
+BUNDLED_STRATEGIES = (DualMaCrossoverStrategy, AdvancedMartingaleV2, LotteryTicketStrategy, OneClickWithStopsStrategy)
+_WRITE_CHUNK = 1_000_000
+
+
+def synthetic_rates(n_bars: int, timeframe: str = 'M1', seed: int = 0, start: str = '2000-01-03',
+                    offset: int = 0) -> pd.DataFrame:
+    """
+    生成 n_bars 根随机游走K线，列与DuckDB中的K线表一致（time 为 datetime64 列）。
+    相同的 seed 和 offset 总是生成相同的数据；offset 用于分块生成时衔接时间轴和随机流。
+    """
+    rng = np.random.default_rng((seed, offset))
+    step = timeframe_seconds(timeframe)
+    first = int(pd.Timestamp(start).timestamp()) + offset * step
+    close = 1.1 + np.cumsum(rng.normal(0, 0.0002, n_bars))  # 每块都从1.1附近开始游走，价格保持为正
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, 0.0001, (2, n_bars)))
+    return pd.DataFrame({
+        'time': pd.to_datetime(first + np.arange(n_bars, dtype=np.int64) * step, unit='s'),
+        'open': open_,
+        'high': np.maximum(open_, close) + wick[0],
+        'low': np.minimum(open_, close) - wick[1],
+        'close': close,
+        'tick_volume': rng.integers(50, 500, n_bars),
+        'spread': rng.integers(0, 20, n_bars).astype(np.int32),
+        'real_volume': np.zeros(n_bars, dtype=np.int64),
+    })
+
+
+def write_synthetic_data(data_path: str, symbol: str, timeframe: str, n_bars: int, seed: int = 0) -> tuple:
+    """
+    按 DataManager 的表结构把合成K线和品种规格写入 data_path，返回数据的 (起始时间, 结束时间)。
+    数据按块生成和写入，生成千万根K线时内存占用也保持在一块的大小。
+    """
+    manager = DataManager(data_path)
+    table_name = manager._get_table_name(symbol, timeframe)
+    with manager._get_connection() as conn:
+        manager._create_rates_table(conn, table_name)
+        for offset in range(0, n_bars, _WRITE_CHUNK):
+            chunk = synthetic_rates(min(_WRITE_CHUNK, n_bars - offset), timeframe, seed, offset=offset)
+            conn.register('chunk_df', chunk)
+            conn.execute(f"INSERT INTO {table_name} SELECT * FROM chunk_df ON CONFLICT(time) DO NOTHING")
+            conn.unregister('chunk_df')
+        manager._create_symbol_specs_table(conn)
+        conn.execute(f"INSERT OR REPLACE INTO {SYMBOL_SPECS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     [symbol, 0.00001, 5, 100000.0, 0.01, 100.0, 0.01, symbol[:3]])
+        first, last = conn.execute(f"SELECT MIN(time), MAX(time) FROM {table_name}").fetchone()
+    return first, last
+
+
+def _best_of(func, repeat: int) -> float:
+    """运行 repeat 次，返回最短耗时（秒）。"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_data_load(data_path: str, symbol: str, timeframe: str, start, end, repeat: int = 3) -> tuple:
+    """从DuckDB加载整段K线并转换为列式游标的耗时，返回 (指标字典, 加载的K线)。"""
+    manager = DataManager(data_path)
+    result = {}
+
+    def load():
+        result['bars'] = BarCursor.from_dataframe(manager.get_data(symbol, timeframe, start, end)).bars
+    seconds = _best_of(load, repeat)
+    n = len(result['bars'])
+    return {'seconds': seconds, 'bars': n, 'bars_per_sec': n / seconds}, result['bars']
+
+
+def bench_bar_iteration(bars: np.ndarray, symbol: str, timeframe: str, repeat: int = 3) -> dict:
+    """只推进K线游标并分发（无处理函数的）市场事件，衡量主循环本身的开销。"""
+    def iterate():
+        events = EventDispatcher()
+        handler = DuckDBDataHandler(events, [symbol], timeframe, '', '', bars=bars)
+        while handler.update_bars():
+            events.drain()
+    seconds = _best_of(iterate, repeat)
+    return {'seconds': seconds, 'bars': len(bars), 'bars_per_sec': len(bars) / seconds}
+
+
+def bench_strategy(strategy_class, bars: np.ndarray, symbol: str, timeframe: str, symbol_specs: dict,
+                   repeat: int = 1) -> dict:
+    """一个策略的完整事件驱动回测（含组件初始化）。"""
+    def run():
+        random.seed(0)  # LotteryTicketStrategy 随机选择方向
+        EventDrivenBacktester(strategy_class, symbol, timeframe, '', '', 10000.0, bars=bars,
+                              symbol_specs=symbol_specs, verbosity=VERBOSITY_SILENT).run_backtest()
+    seconds = _best_of(run, repeat)
+    return {'seconds': seconds, 'bars': len(bars), 'bars_per_sec': len(bars) / seconds}
+
+
+def bench_gateway(bars: np.ndarray, symbol: str, timeframe: str, symbol_specs: dict, number: int = 10000,
+                  repeat: int = 3) -> Dict[str, dict]:
+    """在回测进行到一半、持有若干持仓时，对网关的常用方法逐一做微基准测试。"""
+    backtester = EventDrivenBacktester(AdvancedMartingaleV2, symbol, timeframe, '', '', 10000.0,
+                                       bars=bars[:len(bars) // 2], symbol_specs=symbol_specs,
+                                       verbosity=VERBOSITY_SILENT)
+    backtester.run_backtest()
+    gateway = backtester.strategy.gateway
+    price = float(bars['close'][len(bars) // 2 - 1])
+    calls = {
+        'account_info': lambda: gateway.account_info(),
+        'symbol_info': lambda: gateway.symbol_info(symbol),
+        'symbol_info_tick': lambda: gateway.symbol_info_tick(symbol),
+        'copy_rates_from_pos': lambda: gateway.copy_rates_from_pos(symbol, 16385, 0, 100),
+        'positions_get': lambda: gateway.positions_get(symbol=symbol),
+        'order_calc_margin': lambda: gateway.order_calc_margin(0, symbol, 1.0, price),
+    }
+    results = {}
+    for name, call in calls.items():
+        seconds = min(timeit.repeat(call, number=number, repeat=repeat)) / number
+        results[name] = {'us_per_call': seconds * 1e6}
+    results['positions_get']['positions'] = len(backtester.portfolio.positions)
+    return results
+
+
+def run_benchmarks(n_bars: int, timeframe: str = 'M1', symbol: str = 'EURUSD', seed: int = 0,
+                   strategy_bars: Optional[int] = 100_000, strategies: Iterable = BUNDLED_STRATEGIES,
+                   repeat: int = 3, data_path: Optional[str] = None) -> dict:
+    """
+    生成 n_bars 根合成K线并运行全部基准测试。
+    :param strategy_bars: 策略回测只使用前 strategy_bars 根K线（None为全部），避免千万级数据下策略回测耗时过长。
+    :param data_path: DuckDB文件路径，默认在临时目录中创建，结束后删除。
+    :return: 可直接保存为JSON的结果字典：meta 为运行环境，results 为 {基准名称: 指标字典}。
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = data_path or os.path.join(tmp, 'bench.duckdb')
+        start = time.perf_counter()
+        first, last = write_synthetic_data(path, symbol, timeframe, n_bars, seed)
+        results = {'write': {'seconds': time.perf_counter() - start, 'bars': n_bars}}
+
+        results['data_load'], bars = bench_data_load(path, symbol, timeframe, first, last, repeat)
+        manager = DataManager(path)
+        specs = manager.get_symbol_specs([symbol])
+        manager.pool.close(path)  # 释放连接池中的连接，临时文件才能被删除
+    results['bar_iteration'] = bench_bar_iteration(bars, symbol, timeframe, repeat)
+
+    strategy_data = bars if strategy_bars is None else bars[:strategy_bars]
+    for strategy_class in strategies:
+        results[f'strategy.{strategy_class.__name__}'] = bench_strategy(strategy_class, strategy_data, symbol,
+                                                                        timeframe, specs)
+    for name, values in bench_gateway(strategy_data, symbol, timeframe, specs, repeat=repeat).items():
+        results[f'gateway.{name}'] = values
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'n_bars': n_bars,
+            'timeframe': timeframe,
+            'seed': seed,
+            'strategy_bars': len(strategy_data),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'duckdb': duckdb.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def save_results(results: dict, path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float = 0.10) -> pd.DataFrame:
+    """
+    对比两次基准测试结果。吞吐量类指标（bars_per_sec）越高越好，耗时类指标（us_per_call）越低越好。
+    :param tolerance: 变慢超过该比例的基准在 regression 列中标记为True。
+    :return: 每行一个两次都存在的基准：baseline、current、speedup（>1为变快）、regression。
+    """
+    rows = []
+    for name, values in current['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            continue
+        for metric, higher_is_better in (('bars_per_sec', True), ('us_per_call', False)):
+            if metric in values and metric in old:
+                speedup = values[metric] / old[metric] if higher_is_better else old[metric] / values[metric]
+                rows.append({'benchmark': name, 'metric': metric, 'baseline': old[metric],
+                             'current': values[metric], 'speedup': speedup,
+                             'regression': speedup < 1 - tolerance})
+    return pd.DataFrame(rows, columns=['benchmark', 'metric', 'baseline', 'current', 'speedup', 'regression'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回测引擎基准测试")
+    parser.add_argument('--bars', type=int, nargs='+', default=[10_000], help="合成K线数量，可指定多个")
+    parser.add_argument('--timeframe', default='M1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategy-bars', type=int, default=100_000, help="策略回测使用的K线数上限，0为不限")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="结果JSON路径；指定多个 --bars 时在文件名后追加K线数量")
+    parser.add_argument('--baseline', help="用于对比的历史结果JSON")
+    args = parser.parse_args(argv)
+
+    for n_bars in args.bars:
+        results = run_benchmarks(n_bars, args.timeframe, seed=args.seed, strategy_bars=args.strategy_bars or None,
+                                 repeat=args.repeat)
+        print(f"\n--- Benchmark: {n_bars:,} bars ({args.timeframe}) ---")
+        for name, values in results['results'].items():
+            print(f"  {name:<40}" + "  ".join(f"{k}={v:,.2f}" for k, v in values.items()))
+        if args.output:
+            root, ext = os.path.splitext(args.output)
+            save_results(results, args.output if len(args.bars) == 1 else f"{root}_{n_bars}{ext or '.json'}")
+        if args.baseline:
+            comparison = compare_results(results, load_results(args.baseline))
+            print(comparison.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,22 @@
+import heapq
+import logging
+import queue
+import threading
 from abc import ABC, abstractmethod
-from queue import Queue
+from typing import Dict, Iterable, Iterator, Optional, Union
+import numpy as np
 import pandas as pd
 
 from events import MarketEvent, SignalEvent, OrderEvent, FillEvent
+from backtest_dispatcher import EventQueue
+from backtest_ledger import PositionLedger, POSITION_FIELDS, INTRABAR_RULES, INTRABAR_SL_FIRST
+from backtest_orders import PendingOrderBook
+from backtest_symbols import SymbolSpecCache
 from data_manager import DataManager
+from mt5_types import RatesDTO
+
+# Portfolio 按K线记录的账户历史列，对应 <name>_history 数组
+_HISTORY_COLUMNS = ('time', 'equity', 'balance', 'margin', 'exposure')
 
 class DataHandler(ABC):
     """
@@ -11,8 +24,13 @@ class DataHandler(ABC):
     负责提供市场数据，并在回测中生成MarketEvent心跳。
     """
     @abstractmethod
-    def get_latest_bar(self, symbol: str) -> pd.Series:
-        """获取指定品种的最新K线数据。"""
+    def get_latest_bar(self, symbol: str) -> Optional[np.void]:
+        """获取指定品种的最新K线数据（RatesDTO记录，可按字段名访问）。"""
+        pass
+
+    @abstractmethod
+    def get_rates_from_pos(self, symbol: str, start_pos: int, count: int) -> Optional[np.ndarray]:
+        """按MT5 copy_rates_from_pos的语义，获取截止到当前K线的历史数据。"""
         pass
 
     @abstractmethod
@@ -22,62 +40,357 @@ class DataHandler(ABC):
         """
         pass
 
+class BarCursor:
+    """
+    列式K线游标。
+    将整段K线保存为一个连续的RatesDTO结构化数组，并用一个整数位置表示“当前K线”。
+    前进游标只是整数加一，返回的K线是数组中的一条记录(np.void)，
+    可以像Series一样用 bar['close'] 访问字段，但不会为每根K线分配新的pandas对象。
+    """
+    __slots__ = ('bars', 'length', 'position')
+
+    def __init__(self, bars: np.ndarray):
+        self.bars = np.ascontiguousarray(bars, dtype=RatesDTO).view()
+        # 设为只读，之后的所有切片视图也都是只读的，策略无法篡改历史数据
+        self.bars.flags.writeable = False
+        self.length = len(self.bars)
+        self.position = -1  # 尚未开始
+
+    @classmethod
+    def from_dataframe(cls, data: pd.DataFrame) -> 'BarCursor':
+        """
+        从DataManager.get_data()返回的DataFrame（以time为索引）构建游标。
+        time列被转换为MT5格式的Unix秒。
+        """
+        bars = np.empty(len(data), dtype=RatesDTO)
+        bars['time'] = data.index.values.astype('datetime64[s]').astype(np.int64)
+        for name in RatesDTO.names[1:]:
+            bars[name] = data[name].to_numpy()
+        return cls(bars)
+
+    @property
+    def current(self) -> Optional[np.void]:
+        """当前K线记录，游标尚未开始时返回None。"""
+        if self.position < 0:
+            return None
+        return self.bars[self.position]
+
+    @property
+    def total(self) -> int:
+        """整段数据的K线数量。"""
+        return self.length
+
+    def advance(self) -> bool:
+        """将游标前移一根K线。数据结束时返回False。"""
+        if self.position + 1 >= self.length:
+            return False
+        self.position += 1
+        return True
+
+    def peek_time(self) -> Optional[int]:
+        """下一根K线的时间，数据结束时返回None。"""
+        if self.position + 1 >= self.length:
+            return None
+        return int(self.bars['time'][self.position + 1])
+
+    def seek(self, time: Optional[int]) -> bool:
+        """把游标移到时间为 time 的K线上（None 表示尚未开始）。找不到该K线时返回False。"""
+        if time is None:
+            self.position = -1
+            return True
+        times = self.bars['time']
+        self.position = int(np.searchsorted(times, time, side='right')) - 1
+        return self.position >= 0 and times[self.position] == time
+
+    def window(self, start_pos: int, count: int) -> Optional[np.ndarray]:
+        """
+        按MT5 copy_rates_from_pos的语义返回截止到当前游标的K线。
+        start_pos=0表示当前K线，结果按时间从旧到新排列，只包含游标之前（含）的数据，
+        因此不存在前视偏差。返回的是只读视图，不复制数据。
+        :return: RatesDTO数组视图；参数无效或没有可用数据时返回None。
+        """
+        if start_pos < 0 or count <= 0:
+            return None
+        end = self.position - start_pos + 1
+        if end <= 0:
+            return None
+        return self.bars[max(0, end - count):end]
+
+
+class ChunkPrefetcher:
+    """
+    在后台线程中迭代数据块，提前取出最多 depth 块放入有界队列，使数据库读取与回测计算重叠。
+    迭代器中的异常在消费端重新抛出；close() 通知后台线程在放下一块之前退出。
+    """
+    _END = object()
+
+    def __init__(self, chunks: Iterable[np.ndarray], depth: int = 2):
+        self._queue = queue.Queue(maxsize=depth)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(iter(chunks),), name='bar-prefetch', daemon=True)
+        self._thread.start()
+
+    def _run(self, chunks: Iterator[np.ndarray]):
+        try:
+            for chunk in chunks:
+                if not self._put(chunk):
+                    return
+        except BaseException as e:
+            self._put(e)
+            return
+        self._put(self._END)
+
+    def _put(self, item) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> np.ndarray:
+        if self._stopped.is_set():
+            raise StopIteration
+        item = self._queue.get()
+        if item is self._END:
+            self._stopped.set()
+            raise StopIteration
+        if isinstance(item, BaseException):
+            self._stopped.set()
+            raise item
+        return item
+
+    def close(self):
+        self._stopped.set()
+
+
+class StreamingBarCursor(BarCursor):
+    """
+    分块加载的K线游标，接口与 BarCursor 相同，用于数据放不进内存的长周期回测。
+    bars 只保存回看窗口（当前K线及之前的 lookback 根）和当前数据块中尚未处理的K线；
+    当前块处理完时丢弃窗口之前的K线并接上下一块（由 ChunkPrefetcher 在后台预取），
+    因此 bars 数组对象会被替换，position 始终是当前K线在 bars 中的位置，内存占用与回测长度无关。
+    lookback 会随策略通过 window()（copy_rates_from_pos）请求过的最大K线数自动增大。
+    """
+    __slots__ = ('lookback', '_total', '_chunks')
+
+    def __init__(self, chunks: Iterable[np.ndarray], total: int, lookback: int = 1000):
+        """
+        :param chunks: 按时间顺序的RatesDTO数组块（例如 DataManager.iter_data() 经 ChunkPrefetcher 预取）。
+        :param total: 整段数据的K线数量（DataManager.count_data()），用于预分配账户历史。
+        """
+        self._chunks = iter(chunks)
+        self._total = total
+        self.lookback = lookback
+        super().__init__(next(self._chunks, np.empty(0, dtype=RatesDTO)))
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    def _refill(self) -> bool:
+        """接上下一块数据，没有更多数据时返回False。"""
+        for chunk in self._chunks:
+            if len(chunk) == 0:
+                continue
+            keep = max(0, self.position + 1 - self.lookback)
+            bars = np.concatenate([self.bars[keep:], chunk])
+            bars.flags.writeable = False
+            self.bars = bars
+            self.length = len(bars)
+            self.position -= keep
+            return True
+        return False
+
+    def advance(self) -> bool:
+        if self.position + 1 >= self.length and not self._refill():
+            return False
+        self.position += 1
+        return True
+
+    def peek_time(self) -> Optional[int]:
+        if self.position + 1 >= self.length and not self._refill():
+            return None
+        return int(self.bars['time'][self.position + 1])
+
+    def window(self, start_pos: int, count: int) -> Optional[np.ndarray]:
+        if start_pos + count > self.lookback:
+            self.lookback = start_pos + count
+        return super().window(start_pos, count)
+
+    def seek(self, time: Optional[int]) -> bool:
+        """向前读取数据块直到 time 所在的块（只能向前，用于从检查点恢复）。"""
+        if time is not None:
+            while self.length and int(self.bars['time'][-1]) < time:
+                self.position = self.length - 1
+                if not self._refill():
+                    break
+        return super().seek(time)
+
+
 class DuckDBDataHandler(DataHandler):
     """
     从DuckDB加载数据，并在内存中进行回测的数据处理器。
+    支持多个品种：每个品种各自持有一个BarCursor，通过按时间戳排序的k路堆合并，
+    使MarketEvent按全局时间顺序发出（时间相同时按symbols中的顺序）。
     """
-    def __init__(self, events_queue: Queue, symbols: list[str], timeframe: str, start_date: str, end_date: str):
+    def __init__(self, events_queue: EventQueue, symbols: list[str], timeframe: str, start_date: str, end_date: str,
+                 bars: Union[np.ndarray, Dict[str, np.ndarray], None] = None, chunk_rows: Optional[int] = None,
+                 prefetch: int = 2, verbose: bool = True, warmup_bars: int = 0):
         """
         :param events_queue: 事件队列。
-        :param symbols: 要交易的品种列表 (当前版本简化为单个symbol)。
+        :param symbols: 要交易的品种列表，第一个为主品种。
         :param timeframe: K线周期。
         :param start_date: 回测开始日期。
         :param end_date: 回测结束日期。
+        :param bars: 可选，已加载好的RatesDTO数组（例如优化器放在共享内存中的数据），
+                     可以是主品种的单个数组，也可以是 {symbol: 数组} 字典。
+                     提供了数据的品种不再访问DuckDB。
+        :param chunk_rows: 可选，流式加载：从DuckDB读取的品种每次只读 chunk_rows 根K线（StreamingBarCursor），
+                           后台线程预取之后的 prefetch 块，内存占用与回测长度无关。默认一次性加载全部数据。
+        :param verbose: 为False时 DataManager 不输出读取数据时的警告（静默回测）。
+        :param warmup_bars: 主品种开头的这么多根K线只作为预热历史：游标开始时已位于其末尾，
+                            策略可以通过 copy_rates_from_pos 回看，但它们不产生市场事件。
+                            其他品种不晚于最后一根预热K线的数据同样只作为历史。
         """
         self.events = events_queue
-        # TODO: 当前简化为只处理第一个symbol
         self.symbol = symbols[0]
-        self.data_manager = DataManager()
+        self.symbols = list(symbols)
+        self.timeframe = timeframe
+        self.start_date = start_date
+        self.end_date = end_date
+        self.chunk_rows = chunk_rows
+        self._data_manager = None
 
-        # 将所有数据一次性加载到内存
-        self.all_data = self.data_manager.get_data(self.symbol, timeframe, start_date, end_date)
-        if self.all_data is None or self.all_data.empty:
-            raise ValueError(f"无法从DataManager获取到 {self.symbol} 的数据，请检查数据是否存在或时间范围是否正确。")
+        if bars is not None and not isinstance(bars, dict):
+            bars = {self.symbol: bars}
+        bars = bars or {}
 
-        self.latest_symbol_data = {self.symbol: None}
-        self._data_iterator = self.all_data.iterrows()
-        self.continue_backtest = True
+        data_manager = None
+        self.cursors: Dict[str, BarCursor] = {}
+        # 品种 -> 回测区间内尚未同步覆盖的时间范围（见 DataManager.get_missing_ranges()），只记录有缺失的品种
+        self.missing_ranges: Dict[str, list] = {}
+        for symbol in self.symbols:
+            if symbol in bars:
+                self.cursors[symbol] = BarCursor(bars[symbol])
+                continue
+
+            data_manager = self._data_manager = data_manager or DataManager(verbose=verbose)
+            if chunk_rows:
+                chunks = ChunkPrefetcher(data_manager.iter_data(symbol, timeframe, start_date, end_date, chunk_rows),
+                                         depth=prefetch)
+                cursor = StreamingBarCursor(chunks, data_manager.count_data(symbol, timeframe, start_date, end_date))
+            else:
+                # 将所有数据一次性加载到内存
+                data = data_manager.get_data(symbol, timeframe, start_date, end_date)
+                # 转换为列式游标，回测主循环只在NumPy数组上移动整数位置
+                cursor = BarCursor.from_dataframe(data) if data is not None else None
+            if cursor is None or cursor.length == 0:
+                raise ValueError(f"无法从DataManager获取到 {symbol} 的数据，请检查数据是否存在或时间范围是否正确。")
+            self.cursors[symbol] = cursor
+            missing = data_manager.get_missing_ranges(symbol, timeframe, start_date, end_date)
+            if missing:
+                self.missing_ranges[symbol] = missing
+
+        # 主品种的游标，单品种回测时即唯一的游标
+        self.cursor = self.cursors[self.symbol]
+
+        if warmup_bars > 0:
+            for _ in range(warmup_bars):
+                self.cursor.advance()
+            warm_until = int(self.cursor.current['time'])
+            for symbol, cursor in self.cursors.items():
+                if cursor is not self.cursor:
+                    cursor.seek(warm_until)
+        self._rebuild_heap()
+
+    def count_timestamps(self) -> int:
+        """
+        合并后时间线上不同K线时间的数量。多个品种在同一时间的市场事件只占账户历史的一行。
+        有流式加载的品种时无法提前得到全部时间，返回各品种K线数之和作为上限。
+        """
+        cursors = list(self.cursors.values())
+        if len(cursors) == 1 or any(isinstance(cursor, StreamingBarCursor) for cursor in cursors):
+            return sum(cursor.total for cursor in cursors)
+        return len(np.unique(np.concatenate([cursor.bars['time'] for cursor in cursors])))
 
-    def get_latest_bar(self, symbol: str) -> pd.Series:
+    def iter_bars(self, symbol: str) -> Iterable[np.ndarray]:
+        """
+        按时间顺序返回品种的整段K线（RatesDTO数组块），用于回测结束后的统计（例如MAE/MFE）。
+        流式加载的品种重新从DuckDB分块读取，否则只有一块，即游标中的数组。
+        """
+        cursor = self.cursors[symbol]
+        if isinstance(cursor, StreamingBarCursor):
+            return self._data_manager.iter_data(symbol, self.timeframe, self.start_date, self.end_date, self.chunk_rows)
+        return (cursor.bars,)
+
+    def get_latest_bar(self, symbol: str) -> Optional[np.void]:
         """
         返回最新的K线数据。在事件驱动模型中，这应该是当前MarketEvent所指向的K线。
+        对于其他品种，返回其时间不晚于当前事件的最近一根K线。
         """
-        if symbol in self.latest_symbol_data:
-            return self.latest_symbol_data[symbol]
-        return None
+        cursor = self.cursors.get(symbol)
+        return cursor.current if cursor is not None else None
+
+    def get_rates_from_pos(self, symbol: str, start_pos: int, count: int) -> Optional[np.ndarray]:
+        """返回截止到当前K线的只读RatesDTO视图。"""
+        cursor = self.cursors.get(symbol)
+        return cursor.window(start_pos, count) if cursor is not None else None
 
     def update_bars(self) -> bool:
         """
-        从数据迭代器中获取下一条记录，更新latest_symbol_data，
+        取出全局时间最早的下一根K线，将其所属品种的游标前移，
         并向事件队列中放入一个新的MarketEvent。
         """
-        try:
-            index, bar = next(self._data_iterator)
-            bar.name = index # 将时间戳赋给Series的name属性
-            self.latest_symbol_data[self.symbol] = bar
-            
-            # 创建并推送市场事件
-            market_event = MarketEvent(
-                symbol=self.symbol,
-                time=int(bar.name.timestamp()) # 使用K线的时间戳
-            )
-            self.events.put(market_event)
-            return True
-        except StopIteration:
-            # 数据结束
+        if not self._heap:
+            # 所有品种的数据都已结束
             self.continue_backtest = False
             return False
 
+        bar_time, order, symbol = heapq.heappop(self._heap)
+        cursor = self.cursors[symbol]
+        cursor.advance()
+        next_time = cursor.peek_time()
+        if next_time is not None:
+            heapq.heappush(self._heap, (next_time, order, symbol))
+
+        # 创建并推送市场事件
+        market_event = MarketEvent(
+            symbol=symbol,
+            time=bar_time # 使用K线的时间戳
+        )
+        self.events.put(market_event)
+        return True
+
+    def get_state(self) -> dict:
+        """返回每个品种最后处理的K线时间（尚未开始为None），供检查点保存。"""
+        return {symbol: int(cursor.bars['time'][cursor.position]) if cursor.position >= 0 else None
+                for symbol, cursor in self.cursors.items()}
+
+    def set_state(self, state: dict):
+        """
+        把各品种游标移到检查点记录的K线上并重建堆，之后 update_bars() 从其后的新K线继续。
+        游标按时间定位而不是按下标，因此数据可以在检查点之后追加了新K线。
+        """
+        for symbol, cursor in self.cursors.items():
+            if not cursor.seek(state.get(symbol)):
+                raise ValueError(f"{symbol} 的数据中找不到检查点所在的K线，数据起点或内容与保存时不一致。")
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        """按各品种游标的下一根K线重建堆，堆元素: (下一根K线的时间, 品种序号, 品种)。"""
+        self._heap = []
+        for order, (symbol, cursor) in enumerate(self.cursors.items()):
+            next_time = cursor.peek_time()
+            if next_time is not None:
+                self._heap.append((next_time, order, symbol))
+        heapq.heapify(self._heap)
+        self.continue_backtest = True
+
 class Portfolio:
     """
     投资组合管理器，是回测系统的核心状态机。
@@ -86,17 +399,68 @@ class Portfolio:
     - 在每个MarketEvent上更新当前持仓的市价和浮动盈亏。
     - 提供接口供BacktestTradingGateway查询，以模拟account_info()等函数。
     """
-    def __init__(self, events_queue: Queue, data_handler: DataHandler, initial_cash: float = 10000.0, leverage: int = 100):
+    def __init__(self, events_queue: EventQueue, data_handler: DataHandler, initial_cash: float = 10000.0, leverage: int = 100,
+                 symbol_specs: Optional[SymbolSpecCache] = None):
+        """
+        :param symbol_specs: 品种规格缓存，提供每个品种的合约大小；默认按品种名推断。
+        """
         self.events = events_queue
         self.data_handler = data_handler
         self.initial_cash = initial_cash
         self.cash = initial_cash
         self.leverage = leverage
+        self.symbol_specs = symbol_specs if symbol_specs is not None else SymbolSpecCache()
         
-        self.positions = {}  # key by symbol
+        self.positions = PositionLedger()  # 按ticket索引，支持对冲
+        self.next_ticket = 1
         self.equity = initial_cash
         self.margin_used = 0.0
+        self.exposure = 0.0  # 持仓名义价值之和
         self.trade_history = []
+        self.allocate_history(0)
+
+    def allocate_history(self, n_bars: int):
+        """
+        按K线时间的数量预分配账户历史数组，每个时间点在on_bar中写入一行（同一时间的多个市场事件只占一行）。
+        预分配之后的记录只是数组赋值，指标计算可以直接在这些数组上向量化完成。
+        """
+        self.history_size = 0
+        self.time_history = np.zeros(n_bars, dtype=np.int64)
+        self.equity_history = np.zeros(n_bars)
+        self.balance_history = np.zeros(n_bars)
+        self.margin_history = np.zeros(n_bars)
+        self.exposure_history = np.zeros(n_bars)
+
+    def get_state(self) -> dict:
+        """返回账户、持仓账本、已平仓交易和已记录的账户历史，供检查点保存。"""
+        n = self.history_size
+        return {
+            'cash': self.cash,
+            'equity': self.equity,
+            'margin_used': self.margin_used,
+            'exposure': self.exposure,
+            'next_ticket': self.next_ticket,
+            'positions': self.positions,
+            'trade_history': self.trade_history,
+            'history': {name: getattr(self, f'{name}_history')[:n].copy() for name in _HISTORY_COLUMNS},
+        }
+
+    def set_state(self, state: dict):
+        """从检查点恢复账户状态，账户历史接在已预分配的数组开头。"""
+        self.cash = state['cash']
+        self.equity = state['equity']
+        self.margin_used = state['margin_used']
+        self.exposure = state['exposure']
+        self.next_ticket = state['next_ticket']
+        self.positions = state['positions']
+        self.trade_history = state['trade_history']
+        history = state['history']
+        n = len(history['equity'])
+        if n > len(self.equity_history):
+            self.allocate_history(n)
+        for name in _HISTORY_COLUMNS:
+            getattr(self, f'{name}_history')[:n] = history[name]
+        self.history_size = n
 
     def on_bar(self, event: MarketEvent):
         """
@@ -105,25 +469,33 @@ class Portfolio:
         if event.type != 'MARKET':
             return
 
-        current_equity = self.cash
         latest_bar = self.data_handler.get_latest_bar(event.symbol)
         
         if latest_bar is None:
             return
 
-        for symbol, pos in self.positions.items():
-            # 更新当前价格和浮动盈亏
-            profit = 0
-            if pos['type'] == 0:  # 0 for buy
-                profit = (latest_bar['close'] - pos['price_open']) * pos['volume'] * 100000  # 简化计算
-            else:  # 1 for sell
-                profit = (pos['price_open'] - latest_bar['close']) * pos['volume'] * 100000  # 简化计算
-            
-            self.positions[symbol]['profit'] = profit
-            self.positions[symbol]['price_current'] = latest_bar['close']
-            current_equity += profit
+        # 只有事件所属品种的价格发生了变化，其他品种的持仓沿用上一次的浮动盈亏
+        self.positions.mark_to_market(event.symbol, latest_bar['close'])
 
-        self.equity = current_equity
+        self.equity = self.cash + self.positions.total_profit()
+        self._update_exposure()
+
+        # 每个时间点记录一行：多品种在同一时间的市场事件覆盖这一行，记录的是全部品种更新后的账户状态
+        i = self.history_size
+        if i > 0 and self.time_history[i - 1] == event.time:
+            i -= 1
+        if i < len(self.equity_history):
+            self.time_history[i] = event.time
+            self.equity_history[i] = self.equity
+            self.balance_history[i] = self.cash
+            self.margin_history[i] = self.margin_used
+            self.exposure_history[i] = self.exposure
+            self.history_size = i + 1
+
+    def _update_exposure(self):
+        """根据当前持仓重新计算名义敞口和占用保证金。"""
+        self.exposure = self.positions.exposure()
+        self.margin_used = self.exposure / self.leverage
 
     def on_signal(self, event: SignalEvent):
         """
@@ -131,52 +503,91 @@ class Portfolio:
         """
         if event.type != 'SIGNAL':
             return
+        # 平仓信号指向的持仓已不存在（例如同一根K线上重复平仓），直接丢弃
+        if event.position and event.position not in self.positions:
+            return
         
         # TODO: 在这里添加更复杂的投资组合逻辑和风险管理
         # 例如：基于信号强度调整订单大小
         
-        # 简化逻辑：直接将信号转换为市价单事件
+        # 简化逻辑：直接将信号转换为同类型的订单事件，未指定手数时使用固定交易量
         order = OrderEvent(
             symbol=event.symbol,
-            order_type='MKT',
+            order_type=event.order_type,
             direction=event.direction,
-            quantity=0.1  # 固定的交易量
+            quantity=event.volume if event.volume else 0.1,
+            price=event.price,
+            order=event.order,
+            position=event.position,
+            sl=event.sl,
+            tp=event.tp,
+            magic=event.magic,
+            comment=event.comment,
         )
         self.events.put(order)
 
     def on_fill(self, event: FillEvent):
         """
         处理来自执行处理器的成交事件，更新持仓和现金。
+        指定了position的成交平掉（或部分平掉）该ticket，否则开一张新持仓。
         """
         if event.type != 'FILL':
             return
+        if event.position and event.position not in self.positions:
+            return  # 持仓在订单挂起期间已被平掉
 
         # 更新现金（扣除成本）
         # 假设成本 = 名义价值 * 手续费率
         # commission = event.fill_price * event.quantity * 100000 * 0.0001 
         self.cash -= event.commission
+        bar_time = int(self.data_handler.get_latest_bar(event.symbol)['time'])
 
-        # 更新持仓
-        pos_dir = 1 if event.direction == 'BUY' else -1
-        
-        if event.symbol not in self.positions:
+        if not event.position:
             # 开新仓
-            self.positions[event.symbol] = {
-                'type': 0 if event.direction == 'BUY' else 1,
-                'volume': event.quantity,
-                'price_open': event.fill_price,
-                'price_current': event.fill_price,
-                'profit': -event.commission, # 初始利润为负的佣金
-                'open_time': self.data_handler.get_latest_bar(event.symbol).name
-            }
+            # 与MT5一致，由挂单成交的持仓沿用挂单的ticket
+            self.positions.open(
+                event.order or self.reserve_ticket(), event.symbol, 0 if event.direction == 'BUY' else 1, event.quantity,
+                event.fill_price, bar_time, magic=event.magic, comment=event.comment,
+                profit=-event.commission,  # 初始利润为负的佣金
+                sl=event.sl, tp=event.tp, contract_size=self.symbol_specs.spec(event.symbol).contract_size,
+                commission=event.commission,
+            )
         else:
-            # 更新现有仓位（加仓/减仓）
-            existing_pos = self.positions[event.symbol]
-            # TODO: 实现更复杂的加减仓逻辑
-            # 此处简化为平仓再开仓
-            print("WARN: Portfolio logic for adjusting existing positions is simplified.")
-            self.cash += existing_pos['profit'] # 实现利润
-            del self.positions[event.symbol]
+            # 按成交价平掉指定持仓，成交手数小于持仓手数时为部分平仓
+            existing_pos = self.positions.get(event.position)
+            volume = min(event.quantity, existing_pos['volume'])
+            direction = 1 if existing_pos['type'] == 0 else -1
+            realized = (event.fill_price - existing_pos['price_open']) * direction * volume * existing_pos['contract_size']
+            self.cash += realized # 实现利润
+            # 与MT5成交记录一致，commission 和 swap 为负数表示成本，净盈亏 = profit + commission + swap。
+            # 开仓手续费按平仓手数分摊，加上本次平仓的手续费；回测不计隔夜利息
+            commission = existing_pos['commission'] * volume / existing_pos['volume'] + event.commission
+            self.trade_history.append({
+                'ticket': existing_pos['ticket'],
+                'symbol': event.symbol,
+                'type': existing_pos['type'],
+                'volume': volume,
+                'price_open': existing_pos['price_open'],
+                'price_close': event.fill_price,
+                'time_open': existing_pos['time'],
+                'time_close': bar_time,
+                'profit': realized,
+                'commission': -commission,
+                'swap': 0.0,
+                'contract_size': existing_pos['contract_size'],
+            })
+            if volume < existing_pos['volume'] - 1e-9:
+                self.positions.reduce(event.position, volume)
+            else:
+                self.positions.close(event.position)
+            self.equity = self.cash + self.positions.total_profit()
+        self._update_exposure()
+
+    def reserve_ticket(self) -> int:
+        """分配一个新的ticket，持仓和挂单共用同一个编号空间。"""
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        return ticket
 
     def get_account_info(self) -> dict:
         """
@@ -191,14 +602,13 @@ class Portfolio:
             "margin_level": (self.equity / self.margin_used) if self.margin_used > 0 else 0,
         }
 
-    def get_positions_info(self, symbol: str = None) -> list:
+    def get_positions_info(self, symbol: str = None, magic: int = None) -> list:
         """
-        返回一个模拟的持仓信息列表，供Gateway使用。
+        返回一个模拟的持仓信息列表，供Gateway使用，可按品种和/或魔术号过滤。
+        字段与PositionInfo一一对应，price_current等内部字段不对外暴露。
         """
-        if symbol:
-            pos = self.positions.get(symbol)
-            return [pos] if pos else []
-        return list(self.positions.values())
+        positions = (self.positions.get(ticket) for ticket in self.positions.tickets(symbol or None, magic))
+        return [{k: pos[k] for k in POSITION_FIELDS} for pos in positions]
 
 class ExecutionHandler(ABC):
     """
@@ -212,12 +622,35 @@ class SimulatedExecutionHandler(ExecutionHandler):
     """
     模拟的执行处理器，用于回测环境。
     它接收OrderEvent，并根据下一根K线的数据模拟成交，然后生成FillEvent。
+    限价单和止损单先进入挂单簿，之后每根K线由 check_pending_orders() 检查是否触发；
+    持仓的止损止盈由 check_stops() 检查。
     """
-    def __init__(self, events_queue: Queue, data_handler: DataHandler, commission_per_trade: float = 0.1, slippage_points: int = 2):
+    def __init__(self, events_queue: EventQueue, data_handler: DataHandler, commission_per_trade: float = 0.1, slippage_points: int = 2,
+                 intrabar_rule: str = INTRABAR_SL_FIRST, symbol_specs: Optional[SymbolSpecCache] = None,
+                 verbose: bool = True):
+        """
+        :param intrabar_rule: 同一根K线内止损和止盈都被触及时的判定规则，见 backtest_ledger.INTRABAR_RULES。
+        :param symbol_specs: 品种规格缓存，提供每个品种的point；默认按品种名推断。
+        :param verbose: 为False时不记录执行错误日志（静默回测）。
+        """
+        if intrabar_rule not in INTRABAR_RULES:
+            raise ValueError(f"未知的K线内成交规则: {intrabar_rule}")
         self.events = events_queue
         self.data_handler = data_handler
         self.commission_per_trade = commission_per_trade
         self.slippage_points = slippage_points
+        self.intrabar_rule = intrabar_rule
+        self.symbol_specs = symbol_specs if symbol_specs is not None else SymbolSpecCache()
+        self.order_book = PendingOrderBook()
+        self.verbose = verbose
+        self.logger = logging.getLogger("MT5Toolbox")
+
+    def get_state(self) -> dict:
+        """返回尚未触发的挂单簿，供检查点保存。"""
+        return {'order_book': self.order_book}
+
+    def set_state(self, state: dict):
+        self.order_book = state['order_book']
 
     def execute_order(self, event: OrderEvent):
         """
@@ -227,9 +660,15 @@ class SimulatedExecutionHandler(ExecutionHandler):
         if event.type != 'ORDER':
             return
 
+        # 限价/止损单只登记到挂单簿，从下一次检查开始参与触发
+        if event.order_type in ('LMT', 'STP'):
+            self.order_book.add(event)
+            return
+
         bar = self.data_handler.get_latest_bar(event.symbol)
         if bar is None:
-            print(f"Execution Error: No market data for {event.symbol}")
+            if self.verbose:
+                self.logger.warning(f"Execution Error: No market data for {event.symbol}")
             return
 
         fill_price = 0.0
@@ -237,22 +676,91 @@ class SimulatedExecutionHandler(ExecutionHandler):
 
         # 模拟市价单（MKT）
         if event.order_type == 'MKT':
-            # 假设在下一根K线的开盘价成交
+            # 假设在下一根K线的开盘价成交。K线价格为bid，买入按 ask = bid + 点差 成交
             fill_price = bar['open']
-            
+
             # 模拟滑点
-            # TODO: 从symbol_info获取point大小
-            point = 0.00001 # 临时硬编码
-            slippage_adj = self.slippage_points * point
+            slippage_adj = self.slippage_points * self.symbol_specs.spec(event.symbol).point
             if event.direction == 'BUY':
                 slippage = slippage_adj
-                fill_price += slippage
+                fill_price += self._spread(event.symbol, bar) + slippage
             elif event.direction == 'SELL':
                 slippage = -slippage_adj
                 fill_price += slippage # 卖出时，价格更低
 
-        # TODO: 在此实现其他订单类型（LMT, STP）的逻辑
+        self._fill(event, fill_price, slippage)
+
+    def check_pending_orders(self, symbol: str, bar=None):
+        """
+        用该品种当前K线的最高/最低价检查挂单簿，为每张被触发的挂单生成成交事件。
+        开盘即越过挂单价（跳空）时按开盘价成交；限价单不计滑点，止损单按市价单计入滑点。
+        K线价格为bid：卖单按bid触发和成交，买单按 ask = bid + 当前K线点差 触发和成交，与市价单一致。
+        :param bar: 可选，包含 open/high/low 的价格区间（例如K线内路径的一段），默认使用当前K线。
+        """
+        if not len(self.order_book):
+            return
+        latest = self.data_handler.get_latest_bar(symbol)
+        if bar is None:
+            bar = latest
+        if bar is None:
+            return
+        spread = self._spread(symbol, latest)
+        slippage_adj = self.slippage_points * self.symbol_specs.spec(symbol).point
+        for order in self.order_book.trigger(symbol, bar['high'], bar['low'], spread):
+            is_buy = order.direction == 'BUY'
+            open_ = bar['open'] + spread if is_buy else bar['open']
+            if order.order_type == 'LMT':
+                self._fill(order, min(open_, order.price) if is_buy else max(open_, order.price), 0.0)
+            else:
+                slippage = slippage_adj if is_buy else -slippage_adj
+                price = max(open_, order.price) if is_buy else min(open_, order.price)
+                self._fill(order, price + slippage, slippage)
+
+    def check_stops(self, positions: PositionLedger, symbol: str, bar=None):
+        """
+        用该品种当前K线的开/高/低价一次性检查全部持仓的止损止盈，为触发的持仓生成平仓成交事件。
+        止损按止损单计入滑点，止盈按限价单不计滑点。多单按bid平仓，空单按 ask = bid + 当前K线点差 平仓。
+        :param bar: 可选，包含 open/high/low 的价格区间（例如K线内路径的一段），默认使用当前K线。
+        """
+        if not len(positions):
+            return
+        latest = self.data_handler.get_latest_bar(symbol)
+        if bar is None:
+            bar = latest
+        if bar is None:
+            return
+        tickets, prices, is_sl = positions.hit_stops(symbol, bar['open'], bar['high'], bar['low'], self.intrabar_rule,
+                                                     self._spread(symbol, latest))
+        slippage_adj = self.slippage_points * self.symbol_specs.spec(symbol).point
+        for ticket, price, stop_loss in zip(tickets.tolist(), prices.tolist(), is_sl.tolist()):
+            pos = positions.get(ticket)
+            direction = 'SELL' if pos['type'] == 0 else 'BUY'  # 与持仓方向相反
+            slippage = (slippage_adj if direction == 'BUY' else -slippage_adj) if stop_loss else 0.0
+            self.events.put(FillEvent(
+                symbol=symbol,
+                direction=direction,
+                quantity=pos['volume'],
+                fill_price=price + slippage,
+                commission=self.commission_per_trade,
+                slippage=slippage,
+                position=ticket,
+                magic=pos['magic'],
+                comment='sl' if stop_loss else 'tp',
+            ))
+
+    def _spread(self, symbol: str, bar) -> float:
+        """K线的点差（价格单位），即 ask - bid = spread * point。"""
+        return float(bar['spread']) * self.symbol_specs.spec(symbol).point if bar is not None else 0.0
+
+    def cancel_order(self, ticket: int) -> bool:
+        """撤销一张挂单，返回是否成功。"""
+        return self.order_book.remove(ticket) is not None
+
+    def modify_order(self, ticket: int, price: float, sl: float = 0.0, tp: float = 0.0) -> bool:
+        """修改一张挂单的价格和止损止盈，返回是否成功。"""
+        return self.order_book.modify(ticket, price, sl, tp) is not None
 
+    def _fill(self, event: OrderEvent, fill_price: float, slippage: float):
         # 创建成交事件
         fill_event = FillEvent(
             symbol=event.symbol,
@@ -260,6 +768,12 @@ class SimulatedExecutionHandler(ExecutionHandler):
             quantity=event.quantity,
             fill_price=fill_price,
             commission=self.commission_per_trade,
-            slippage=slippage
+            slippage=slippage,
+            order=event.order,
+            position=event.position,
+            sl=event.sl,
+            tp=event.tp,
+            magic=event.magic,
+            comment=event.comment,
         )
         self.events.put(fill_event)
@@ -0,0 +1,72 @@
+from collections import deque
+from queue import Queue
+from typing import Callable, Dict, List, Type, Union
+
+from events import Event
+
+
+class EventDispatcher:
+    """
+    单线程事件分发器，回测引擎的默认事件队列。
+    - 基于 collections.deque，put/get 不涉及锁和条件变量。
+    - 按事件类型查表分发，取代 isinstance 判断链。
+    - 对组件暴露与 queue.Queue 相同的 put()/get()/empty() 接口，组件无需关心具体实现。
+    """
+    def __init__(self):
+        self._events = deque()
+        self._handlers: Dict[Type[Event], List[Callable[[Event], None]]] = {}
+        # 直接绑定deque的方法，省去一层Python函数调用
+        self.put = self._events.append
+
+    def register(self, event_type: Type[Event], handler: Callable[[Event], None]):
+        """为指定的事件类型注册处理函数，同一类型可以注册多个，按注册顺序调用。"""
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def get(self, block: bool = False) -> Event:
+        """取出最早的事件。队列为空时抛出IndexError。"""
+        return self._events.popleft()
+
+    def empty(self) -> bool:
+        return not self._events
+
+    def dispatch(self, event: Event):
+        """将单个事件分发给已注册的处理函数。"""
+        for handler in self._handlers.get(type(event), ()):
+            handler(event)
+
+    def drain(self):
+        """
+        依次取出并分发事件，直到队列为空。
+        处理函数在分发过程中放入的新事件也会在本次调用中被处理。
+        """
+        events = self._events
+        handlers = self._handlers
+        while events:
+            event = events.popleft()
+            for handler in handlers.get(type(event), ()):
+                handler(event)
+
+
+class ThreadSafeEventDispatcher(EventDispatcher):
+    """
+    基于 queue.Queue 的分发器，用于需要跨线程投递事件的场景。
+    接口与 EventDispatcher 完全相同，但每次 put/get 都需要加锁。
+    """
+    def __init__(self):
+        super().__init__()
+        self._queue = Queue()
+        self.put = self._queue.put
+
+    def get(self, block: bool = False) -> Event:
+        return self._queue.get(block=block)
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+    def drain(self):
+        while not self._queue.empty():
+            self.dispatch(self._queue.get_nowait())
+
+
+# 组件接受的事件队列类型：Queue 或任一分发器
+EventQueue = Union[Queue, EventDispatcher]
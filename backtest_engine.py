@@ -1,118 +1,348 @@
+import os
+import pickle
 import time
-from queue import Queue
+from datetime import datetime, timezone
 import pandas as pd
 
 # 导入我们重构的组件和类型
 from events import MarketEvent, SignalEvent, OrderEvent, FillEvent
 from backtest_components import DuckDBDataHandler, Portfolio, SimulatedExecutionHandler
+from backtest_dispatcher import EventDispatcher, ThreadSafeEventDispatcher
 from backtest_gateway import BacktestTradingGateway
-from strategy import Strategy
+from backtest_intrabar import IntrabarModel, path_segments
+from backtest_ledger import INTRABAR_SL_FIRST
+from backtest_symbols import SymbolSpecCache
+from backtest_metrics import PERIODS_PER_YEAR, compute_metrics, trade_excursions
+from backtest_recorder import EventRecorder, VERBOSITY_REPORT, VERBOSITY_TRADES, VERBOSITY_ALL
+from data_manager import DataManager
+from models.strategy import Strategy
 
 # 导入一个重构后的策略作为示例
 from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
 
+# 检查点文件格式版本，格式不兼容地变化时递增
+CHECKPOINT_VERSION = 2
+
 class EventDrivenBacktester:
     """
     事件驱动回测引擎主类。
     负责初始化所有组件，并运行主事件循环。
     """
-    def __init__(self, strategy_class, symbol: str, timeframe: str, start_date: str, end_date: str, initial_cash: float):
+    def __init__(self, strategy_class, symbol: str, timeframe: str, start_date: str, end_date: str, initial_cash: float,
+                 params: dict = None, bars=None, extra_symbols: list = None, dispatcher: str = 'deque',
+                 verbosity: int = VERBOSITY_TRADES, record_market: bool = False, intrabar_rule: str = INTRABAR_SL_FIRST,
+                 intrabar: IntrabarModel = None, symbol_specs: dict = None, data_handler: DuckDBDataHandler = None,
+                 stream_chunk_rows: int = None, warmup_bars: int = 0):
+        """
+        :param params: 可选，覆盖strategy_params_config中默认值的策略参数。
+        :param bars: 可选，已加载好的RatesDTO数组（或 {symbol: 数组} 字典），提供时数据处理器不再访问DuckDB。
+        :param extra_symbols: 可选，除主品种外一并加载的品种，供组合/篮子策略通过网关访问。
+        :param dispatcher: 事件分发器类型。'deque'（默认）为无锁的单线程分发器，
+                           'queue' 为基于 queue.Queue 的线程安全分发器。
+        :param verbosity: 控制台输出级别，见 backtest_recorder 中的 VERBOSITY_* 常量。
+                          VERBOSITY_SILENT 完全不输出，适合优化器等批量运行。
+        :param record_market: 事件记录器是否同时记录每根K线的市场事件。
+        :param intrabar_rule: 同一根K线内止损和止盈都被触及时的判定规则，见 backtest_ledger.INTRABAR_RULES。
+        :param intrabar: 可选，K线内价格路径模型（见 backtest_intrabar）。提供时挂单和止损止盈
+                         沿路径逐段检查，先被触及的价位先成交，intrabar_rule 只在同一段内同时触及时生效。
+        :param symbol_specs: 可选，{symbol: 规格字段字典}，覆盖品种规格。未提供且从DuckDB加载数据时
+                             读取 DataManager 同步的规格表，其余字段按品种名推断。
+        :param data_handler: 可选，外部共享的数据处理器（见 backtest_batch.MultiStrategyBacktester），
+                             提供时不再自行加载数据，K线的推进也由外部负责。
+        :param stream_chunk_rows: 可选，流式回测：从DuckDB每次只读取这么多根K线，后台线程预取下一块，
+                                  内存中只保留当前块和策略通过 copy_rates_from_pos 回看的K线（见 StreamingBarCursor）。
+        :param warmup_bars: 可选，数据开头的这么多根K线只作为策略指标的预热历史，不产生市场事件，
+                            交易和账户历史从其后的第一根K线开始（例如滚动前推的样本外回测）。
+        """
         self.strategy_class = strategy_class
         self.symbol = symbol
         self.timeframe = timeframe
         self.start_date = start_date
         self.end_date = end_date
         self.initial_cash = initial_cash
+        self.params = params if params is not None else {}
+        self.bars = bars
+        self.symbols = [symbol] + [s for s in (extra_symbols or []) if s != symbol]
 
-        self.events = Queue()
+        if dispatcher == 'deque':
+            self.events = EventDispatcher()
+        elif dispatcher == 'queue':
+            self.events = ThreadSafeEventDispatcher()
+        else:
+            raise ValueError(f"未知的事件分发器类型: {dispatcher}")
+        self.verbosity = verbosity
+        self.record_market = record_market
+        self.intrabar_rule = intrabar_rule
+        self.intrabar = intrabar
+        self.symbol_specs = symbol_specs
+        self.shared_data_handler = data_handler
+        self.stream_chunk_rows = stream_chunk_rows
+        self.warmup_bars = warmup_bars
         self.strategy = None
+        # 每根K线上产生的订单延后到该品种的下一根K线开盘时执行，避免前视偏差
+        self.pending_orders = []
 
         self._setup_components()
 
     def _setup_components(self):
         """初始化所有回测组件。"""
-        print("Initializing backtest components...")
+        if self.verbosity >= VERBOSITY_REPORT:
+            print("Initializing backtest components...")
         
         # 1. 数据处理器 (Data Handler)
-        self.data_handler = DuckDBDataHandler(self.events, [self.symbol], self.timeframe, self.start_date, self.end_date)
+        if self.shared_data_handler is not None:
+            self.data_handler = self.shared_data_handler
+        else:
+            self.data_handler = DuckDBDataHandler(self.events, self.symbols, self.timeframe, self.start_date,
+                                                  self.end_date, bars=self.bars, chunk_rows=self.stream_chunk_rows,
+                                                  verbose=self.verbosity >= VERBOSITY_REPORT,
+                                                  warmup_bars=self.warmup_bars)
+        if self.verbosity >= VERBOSITY_REPORT:
+            for symbol, missing in self.data_handler.missing_ranges.items():
+                print(f"Warning: {symbol} {self.timeframe} data is not synced for {len(missing)} range(s) in the "
+                      f"backtest period, e.g. {missing[0][0]} to {missing[0][1]}.")
+
+        # 品种规格在每次回测中只加载一次，bid/ask 序列在这里一次性算好
+        specs = self.symbol_specs
+        if specs is None and self.bars is None and self.shared_data_handler is None:
+            specs = DataManager(verbose=self.verbosity >= VERBOSITY_REPORT).get_symbol_specs(self.symbols)
+        self.specs = SymbolSpecCache(specs)
+        for symbol, cursor in self.data_handler.cursors.items():
+            self.specs.load_quotes(symbol, cursor.bars)
 
-        # 2. 投资组合管理器 (Portfolio)
-        self.portfolio = Portfolio(self.events, self.data_handler, self.initial_cash)
+        # 2. 投资组合管理器 (Portfolio)，按合并后时间线上的时间点数预分配账户历史
+        total_bars = sum(cursor.total for cursor in self.data_handler.cursors.values())
+        self.portfolio = Portfolio(self.events, self.data_handler, self.initial_cash, symbol_specs=self.specs)
+        self.portfolio.allocate_history(self.data_handler.count_timestamps())
 
         # 3. 执行处理器 (Execution Handler)
-        self.execution_handler = SimulatedExecutionHandler(self.events, self.data_handler)
+        self.execution_handler = SimulatedExecutionHandler(self.events, self.data_handler, intrabar_rule=self.intrabar_rule,
+                                                           symbol_specs=self.specs,
+                                                           verbose=self.verbosity >= VERBOSITY_REPORT)
 
         # 4. 回测交易网关 (Backtest Trading Gateway)
-        backtest_gateway = BacktestTradingGateway(self.events, self.portfolio, self.data_handler)
+        # 策略日志只在 VERBOSITY_TRADES 及以上输出，策略通过 self.verbose（即网关的 verbose）判断
+        backtest_gateway = BacktestTradingGateway(self.events, self.portfolio, self.data_handler, self.execution_handler,
+                                                  verbose=self.verbosity >= VERBOSITY_TRADES)
 
-        # 从策略类中提取默认参数
+        # 从策略类中提取默认参数，再用调用方传入的参数覆盖
         strategy_params = {k: v['default'] for k, v in self.strategy_class.strategy_params_config.items()}
+        strategy_params.update(self.params)
 
         # 5. 策略实例 (Strategy)
         # 注意：我们将回测网关和参数注入到策略中
         self.strategy = self.strategy_class(backtest_gateway, self.symbol, self.timeframe, params=strategy_params)
-        print("Components initialized successfully.")
 
-    def run_backtest(self):
-        """运行主事件循环。"""
-        print(f"\n--- Running Backtest for {self.strategy.strategy_name} ---")
-        print(f"Symbol: {self.symbol} | Timeframe: {self.timeframe} | Period: {self.start_date} to {self.end_date}\n")
-        
-        self.strategy.on_init()
-
-        # 启动事件循环，由第一个MarketEvent驱动
-        self.data_handler.update_bars()
-
-        while True:
-            if not self.data_handler.continue_backtest and self.events.empty():
-                break
-
-            try:
-                event = self.events.get(block=False)
-            except self.events.empty():
-                # 如果事件队列为空，但数据还没完，就继续获取数据
-                self.data_handler.update_bars()
-            else:
-                if event is not None:
-                    if isinstance(event, MarketEvent):
-                        # 市场事件：更新投资组合，然后运行策略逻辑
-                        print(f"-- Market Event: {pd.to_datetime(event.time, unit='s')} --")
-                        self.portfolio.on_bar(event)
-                        self.strategy.on_bar(event)
-                        # 处理完市场事件后，立即请求下一个数据点
-                        self.data_handler.update_bars()
-
-                    elif isinstance(event, SignalEvent):
-                        # 信号事件：由投资组合处理
-                        print(f"-- Signal Event: {event.direction} {event.symbol} --")
-                        self.portfolio.on_signal(event)
-
-                    elif isinstance(event, OrderEvent):
-                        # 订单事件：由执行处理器处理
-                        print(f"-- Order Event: {event.direction} {event.quantity} {event.symbol} --")
-                        self.execution_handler.execute_order(event)
-
-                    elif isinstance(event, FillEvent):
-                        # 成交事件：由投资组合处理
-                        print(f"-- Fill Event: {event.direction} {event.quantity} {event.symbol} at {event.fill_price:.5f} --")
-                        self.portfolio.on_fill(event)
+        # 6. 事件记录器，按K线数量预分配容量
+        self.recorder = EventRecorder(capacity=total_bars if self.record_market else 1024,
+                                      record_market=self.record_market)
+
+        # 7. 按事件类型注册处理函数
+        self.events.register(MarketEvent, self._on_market)
+        self.events.register(SignalEvent, self._on_signal)
+        self.events.register(OrderEvent, self._on_order)
+        self.events.register(FillEvent, self._on_fill)
+        if self.verbosity >= VERBOSITY_REPORT:
+            print("Components initialized successfully.")
+
+    def run_backtest(self, resume_from: str = None, checkpoint: str = None):
+        """
+        运行主事件循环。
+        :param resume_from: 可选，检查点文件路径。提供时从检查点恢复全部状态（代替 on_init），
+                            只处理检查点之后新增的K线，例如 DataManager.sync_data() 追加的数据。
+        :param checkpoint: 可选，回测结束（on_deinit 之前）时把状态保存到此路径，供下次续跑。
+        """
+        self._start(resume_from)
+        # 每次推进一根K线，并在推进下一根之前处理完本K线产生的所有事件
+        while self.data_handler.update_bars():
+            self.events.drain()
+        return self._finish(checkpoint)
+
+    def _start(self, resume_from: str = None):
+        """主循环开始前：初始化策略，或从检查点恢复。"""
+        if self.verbosity >= VERBOSITY_REPORT:
+            print(f"\n--- Running Backtest for {self.strategy.strategy_name} ---")
+            print(f"Symbol: {', '.join(self.symbols)} | Timeframe: {self.timeframe} | Period: {self.start_date} to {self.end_date}\n")
 
+        if resume_from is not None:
+            self.load_checkpoint(resume_from)
+        else:
+            self.strategy.on_init()
+            self.events.drain()  # on_init中发出的订单在第一根K线执行
+
+    def _finish(self, checkpoint: str = None) -> str:
+        """主循环结束后：按需保存检查点，停止策略并生成报告。"""
+        if checkpoint is not None:
+            self.save_checkpoint(checkpoint)
         self.strategy.on_deinit()
         return self.generate_report()
 
+    def _checkpoint_config(self) -> dict:
+        """决定回测结果的配置，续跑时必须与检查点一致。结束日期不在其中，可以向后延长。"""
+        return {
+            'strategy': f"{self.strategy_class.__module__}.{self.strategy_class.__qualname__}",
+            'symbols': self.symbols,
+            'timeframe': self.timeframe,
+            'start_date': str(self.start_date),
+            'initial_cash': self.initial_cash,
+            'params': self.params,
+        }
+
+    def save_checkpoint(self, path: str):
+        """
+        把引擎的完整状态保存到 path：数据游标位置、投资组合、挂单、待执行的市价单、事件记录和策略状态。
+        先写临时文件再原子替换，中途失败不会损坏已有的检查点。
+        """
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'config': self._checkpoint_config(),
+            'data': self.data_handler.get_state(),
+            'portfolio': self.portfolio.get_state(),
+            'execution': self.execution_handler.get_state(),
+            'pending_orders': self.pending_orders,
+            'recorder': self.recorder,
+            'strategy': self.strategy.get_state(),
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load_checkpoint(self, path: str):
+        """从 save_checkpoint() 保存的文件恢复引擎状态，之后的K线从检查点所在K线的下一根开始。"""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"不支持的检查点版本: {state.get('version')}")
+        config = self._checkpoint_config()
+        mismatched = [key for key, value in state['config'].items() if config.get(key) != value]
+        if mismatched:
+            raise ValueError(f"检查点与当前回测配置不一致: {', '.join(mismatched)}")
+
+        self.data_handler.set_state(state['data'])
+        self.portfolio.set_state(state['portfolio'])
+        self.execution_handler.set_state(state['execution'])
+        self.pending_orders = state['pending_orders']
+        self.recorder = state['recorder']
+        self.recorder.record_market = self.record_market
+        self.strategy.set_state(state['strategy'])
+
+    def _on_market(self, event: MarketEvent):
+        """市场事件：先执行该品种的挂起订单，再更新投资组合，最后运行策略逻辑。"""
+        self.recorder.record(event)
+        if self.verbosity >= VERBOSITY_ALL:
+            print(f"-- Market Event: {datetime.fromtimestamp(event.time, tz=timezone.utc):%Y-%m-%d %H:%M:%S} --")
+        if self.pending_orders:
+            waiting = []
+            for order in self.pending_orders:
+                if order.symbol == event.symbol:
+                    self.execution_handler.execute_order(order)
+                else:
+                    waiting.append(order)  # 等待该品种自己的下一根K线
+            self.pending_orders = waiting
+            self.events.drain()
+
+        if self.intrabar is None:
+            self._check_triggers(event.symbol)
+        elif len(self.execution_handler.order_book) or len(self.portfolio.positions):
+            cursor = self.data_handler.cursors[event.symbol]
+            path = self.intrabar.path(event.symbol, cursor.bars, cursor.position)
+            for open_, high, low in zip(*path_segments(path)):
+                if not (len(self.execution_handler.order_book) or len(self.portfolio.positions)):
+                    break
+                self._check_triggers(event.symbol, {'open': open_, 'high': high, 'low': low})
+
+        self.portfolio.on_bar(event)
+        self.strategy.on_bar(event)
+
+    def _check_triggers(self, symbol: str, bar=None):
+        """在一个价格区间内检查挂单，再检查包括刚成交持仓在内的全部止损止盈。"""
+        self.execution_handler.check_pending_orders(symbol, bar)
+        self.events.drain()
+        self.execution_handler.check_stops(self.portfolio.positions, symbol, bar)
+        # 立即处理成交事件，使策略在本K线上能看到最新持仓
+        self.events.drain()
+
+    def _on_signal(self, event: SignalEvent):
+        """信号事件：由投资组合处理。"""
+        self.recorder.record(event)
+        if self.verbosity >= VERBOSITY_TRADES:
+            print(f"-- Signal Event: {event.direction} {event.symbol} --")
+        self.portfolio.on_signal(event)
+
+    def _on_order(self, event: OrderEvent):
+        """订单事件：市价单等待该品种的下一根K线由执行处理器处理，限价/止损单直接进入挂单簿。"""
+        self.recorder.record(event)
+        if self.verbosity >= VERBOSITY_TRADES:
+            print(f"-- Order Event: {event.order_type} {event.direction} {event.quantity} {event.symbol} --")
+        if event.order_type == 'MKT':
+            self.pending_orders.append(event)
+        else:
+            self.execution_handler.execute_order(event)
+
+    def _on_fill(self, event: FillEvent):
+        """成交事件：由投资组合处理。"""
+        self.recorder.record(event)
+        if self.verbosity >= VERBOSITY_TRADES:
+            print(f"-- Fill Event: {event.direction} {event.quantity} {event.symbol} at {event.fill_price:.5f} --")
+        self.portfolio.on_fill(event)
+
+    def get_equity_curve(self) -> pd.DataFrame:
+        """返回每个K线时间上的账户快照（净值、余额、保证金、敞口）。"""
+        n = self.portfolio.history_size
+        return pd.DataFrame({
+            'equity': self.portfolio.equity_history[:n],
+            'balance': self.portfolio.balance_history[:n],
+            'margin': self.portfolio.margin_history[:n],
+            'exposure': self.portfolio.exposure_history[:n],
+        }, index=pd.to_datetime(self.portfolio.time_history[:n], unit='s').rename('time'))
+
+    def get_trades(self) -> pd.DataFrame:
+        """返回已平仓交易表，并附上每笔交易的MAE/MFE。"""
+        trades = pd.DataFrame(self.portfolio.trade_history)
+        if trades.empty:
+            return trades
+        trades['mae'], trades['mfe'] = 0.0, 0.0
+        for symbol, group in trades.groupby('symbol'):
+            mae, mfe = trade_excursions(group, self.data_handler.iter_bars(symbol),
+                                        contract_size=self.specs.spec(symbol).contract_size)
+            trades.loc[group.index, 'mae'] = mae
+            trades.loc[group.index, 'mfe'] = mfe
+        return trades
+
+    def get_results(self) -> dict:
+        """以字典形式返回回测结果及绩效指标，供优化器等程序化调用方使用。"""
+        final_equity = float(self.portfolio.equity)
+        n = self.portfolio.history_size
+        results = {
+            "final_equity": final_equity,
+            "total_return": (final_equity / self.initial_cash - 1) * 100,
+        }
+        results.update(compute_metrics(
+            self.portfolio.equity_history[:n],
+            pd.DataFrame(self.portfolio.trade_history),
+            self.portfolio.exposure_history[:n],
+            periods_per_year=PERIODS_PER_YEAR.get(self.timeframe.upper(), PERIODS_PER_YEAR['H1']),
+        ))
+        return results
+
     def generate_report(self):
         """生成并返回最终的回测报告字符串。"""
-        final_equity = self.portfolio.equity
-        total_return = (final_equity / self.initial_cash - 1) * 100
+        results = self.get_results()
 
         report = (
             "\n--- Backtest Finished ---\n"
             f"Initial Cash: {self.initial_cash:,.2f}\n"
-            f"Final Equity:   {final_equity:,.2f}\n"
-            f"Total Return:   {total_return:.2f}%\n"
+            f"Final Equity:   {results['final_equity']:,.2f}\n"
+            f"Total Return:   {results['total_return']:.2f}%\n"
+            f"Sharpe Ratio:   {results['sharpe']:.2f}\n"
+            f"Max Drawdown:   {results['max_drawdown']:.2f}% ({results['max_drawdown_duration']} bars)\n"
+            f"Trades:         {results['n_trades']} (win rate {results['win_rate']:.1f}%, "
+            f"profit factor {results['profit_factor']:.2f})\n"
             "-------------------------\n"
         )
-        print(report)
+        if self.verbosity >= VERBOSITY_REPORT:
+            print(report)
         return report
 
 # --- 主程序入口 ---
@@ -1,14 +1,27 @@
-from queue import Queue
 from typing import Optional, Tuple, Dict, Any
 import numpy as np
 
 from trading_gateway import TradingGateway
 from mt5_types import AccountInfo, SymbolInfo, Tick, TradeResult, PositionInfo
 from events import SignalEvent
-from backtest_components import Portfolio, DataHandler
+from backtest_dispatcher import EventQueue
+from backtest_components import Portfolio, DataHandler, SimulatedExecutionHandler
+
+# 回测账户的货币
+ACCOUNT_CURRENCY = "USD"
 
 # 模拟MT5返回码
 TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+
+# MT5交易操作和挂单类型
+TRADE_ACTION_DEAL = 1
+TRADE_ACTION_PENDING = 5
+TRADE_ACTION_SLTP = 6
+TRADE_ACTION_MODIFY = 7
+TRADE_ACTION_REMOVE = 8
+# ORDER_TYPE_BUY_LIMIT/SELL_LIMIT/BUY_STOP/SELL_STOP -> (方向, 订单类型)
+PENDING_ORDER_TYPES = {2: ('BUY', 'LMT'), 3: ('SELL', 'LMT'), 4: ('BUY', 'STP'), 5: ('SELL', 'STP')}
 
 class BacktestTradingGateway(TradingGateway):
     """
@@ -16,10 +29,19 @@ class BacktestTradingGateway(TradingGateway):
     它将策略代码的API调用转换为回测系统中的事件，
     或从回测组件（如Portfolio）中查询状态来响应API调用。
     """
-    def __init__(self, events_queue: Queue, portfolio: Portfolio, data_handler: DataHandler):
+    def __init__(self, events_queue: EventQueue, portfolio: Portfolio, data_handler: DataHandler,
+                 execution_handler: Optional[SimulatedExecutionHandler] = None, verbose: bool = True):
+        """
+        :param execution_handler: 可选，提供时支持修改和撤销挂单（TRADE_ACTION_MODIFY/TRADE_ACTION_REMOVE）。
+        :param verbose: 是否输出策略日志，见 TradingGateway.verbose。
+        """
         self.events = events_queue
         self.portfolio = portfolio
         self.data_handler = data_handler
+        self.execution_handler = execution_handler
+        self.verbose = verbose
+        # 与Portfolio共用同一份品种规格
+        self.symbol_specs = portfolio.symbol_specs
 
     def initialize(self, **kwargs) -> bool:
         # 在回测中，初始化由回测引擎主循环处理，这里直接返回成功
@@ -34,50 +56,37 @@ class BacktestTradingGateway(TradingGateway):
         info_dict = self.portfolio.get_account_info()
         return AccountInfo(
             login=12345, # 模拟的登录ID
-            currency="USD", # 模拟的货币
+            currency=ACCOUNT_CURRENCY,
             **info_dict
         )
 
     def symbol_info(self, symbol: str) -> Optional[SymbolInfo]:
-        """获取模拟的交易品种信息。"""
-        # TODO: 这个信息应该由一个专门的SymbolManager或DataHandler提供
-        # 简化处理
-        point = 0.00001
-        if "JPY" in symbol:
-            point = 0.001
-        
-        return SymbolInfo(
-            name=symbol,
-            point=point,
-            spread=5, # 模拟点差
-            digits=5,
-            trade_mode=0 # SYMBOL_TRADE_MODE_FULL
-        )
+        """从品种规格缓存获取交易品种信息，spread为当前K线的点差。"""
+        bar = self.data_handler.get_latest_bar(symbol)
+        return self.symbol_specs.symbol_info(symbol, int(bar['spread']) if bar is not None else 0)
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        """回测中品种在加载数据时即已确定，已加载数据的品种返回True。"""
+        return symbol in self.data_handler.cursors
 
     def symbol_info_tick(self, symbol: str) -> Optional[Tick]:
-        """从DataHandler获取当前K线的模拟报价。"""
-        bar = self.data_handler.get_latest_bar(symbol)
-        if bar is not None:
-            return Tick(
-                time=int(bar.name.timestamp()),
-                bid=bar['close'],
-                ask=bar['close'],
-                last=bar['close'],
-                volume=int(bar['tick_volume'])
-            )
-        return None
+        """返回当前K线收盘时的报价，bid/ask 由加载时预先计算的点差序列给出。"""
+        cursor = self.data_handler.cursors.get(symbol)
+        if cursor is None or cursor.position < 0:
+            return None
+        return self.symbol_specs.tick(symbol, cursor.bars, cursor.position)
 
     def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int) -> Optional[np.ndarray]:
-        """从DataHandler获取历史K线数据。"""
-        # TODO: 实现更精确的基于位置的访问
-        # 简化实现：直接返回所有数据的一部分
-        if self.data_handler.all_data is not None:
-            return self.data_handler.all_data.iloc[-count:].to_records(index=False)
-        return None
+        """
+        从DataHandler获取历史K线数据。
+        与MT5一致：start_pos=0为当前K线，返回按时间升序排列的RatesDTO数组，
+        且只包含当前K线及之前的数据。返回值是只读视图，每次调用不复制数据。
+        """
+        return self.data_handler.get_rates_from_pos(symbol, start_pos, count)
 
-    def positions_get(self, symbol: Optional[str] = None) -> Tuple[PositionInfo, ...]:
-        """从Portfolio组件获取持仓信息。"""
-        positions_list = self.portfolio.get_positions_info(symbol)
+    def positions_get(self, symbol: Optional[str] = None, magic: Optional[int] = None) -> Tuple[PositionInfo, ...]:
+        """从Portfolio组件获取持仓信息，可按品种和/或魔术号过滤。"""
+        positions_list = self.portfolio.get_positions_info(symbol, magic)
         # 将字典列表转换为PositionInfo元组
         return tuple(PositionInfo(**p) for p in positions_list)
 
@@ -91,15 +100,20 @@ class BacktestTradingGateway(TradingGateway):
         volume = request.get('volume')
         order_type = request.get('type')
 
-        # TODO: 处理更复杂的订单类型和操作
-        if action == 1: # TRADE_ACTION_DEAL
+        if action == TRADE_ACTION_DEAL:
             direction = 'BUY' if order_type == 0 else 'SELL'
             
             # 创建信号事件
             signal = SignalEvent(
                 symbol=symbol,
                 direction=direction,
-                strength=1.0 # strength可以用来决定手数
+                strength=1.0, # strength可以用来决定手数
+                volume=volume,
+                position=request.get('position', 0),  # 指定ticket时为平仓
+                sl=request.get('sl', 0.0),
+                tp=request.get('tp', 0.0),
+                magic=request.get('magic', 0),
+                comment=request.get('comment', ''),
             )
             self.events.put(signal)
 
@@ -113,10 +127,80 @@ class BacktestTradingGateway(TradingGateway):
                 price=0, # 价格在成交时确定
                 comment="Request accepted by backtest engine"
             )
+
+        if action == TRADE_ACTION_PENDING:
+            if order_type not in PENDING_ORDER_TYPES:
+                return TradeResult(retcode=TRADE_RETCODE_INVALID, deal=0, order=0, volume=volume, price=0,
+                                   comment=f"Unsupported pending order type: {order_type}")
+            direction, kind = PENDING_ORDER_TYPES[order_type]
+            # 挂单的ticket在请求时就分配，以便策略之后撤单；成交后的持仓沿用该ticket
+            ticket = self.portfolio.reserve_ticket()
+            self.events.put(SignalEvent(
+                symbol=symbol,
+                direction=direction,
+                volume=volume,
+                order_type=kind,
+                price=request.get('price', 0.0),
+                order=ticket,
+                sl=request.get('sl', 0.0),
+                tp=request.get('tp', 0.0),
+                magic=request.get('magic', 0),
+                comment=request.get('comment', ''),
+            ))
+            return TradeResult(retcode=TRADE_RETCODE_DONE, deal=0, order=ticket, volume=volume,
+                               price=request.get('price', 0.0), comment="Pending order accepted by backtest engine")
+
+        if action == TRADE_ACTION_SLTP:
+            ticket = request.get('position', 0)
+            if ticket not in self.portfolio.positions:
+                return TradeResult(retcode=TRADE_RETCODE_INVALID, deal=0, order=0, volume=0, price=0,
+                                   comment="Position not found")
+            self.portfolio.positions.set_stops(ticket, request.get('sl', 0.0), request.get('tp', 0.0))
+            return TradeResult(retcode=TRADE_RETCODE_DONE, deal=0, order=0, volume=0, price=0, comment="SL/TP modified")
+
+        if action == TRADE_ACTION_MODIFY and self.execution_handler is not None:
+            ticket = request.get('order', 0)
+            price = request.get('price', 0.0)
+            if price <= 0:
+                return TradeResult(retcode=TRADE_RETCODE_INVALID, deal=0, order=ticket, volume=0, price=price,
+                                   comment="Invalid price")
+            done = self.execution_handler.modify_order(ticket, price, request.get('sl', 0.0), request.get('tp', 0.0))
+            return TradeResult(retcode=TRADE_RETCODE_DONE if done else TRADE_RETCODE_INVALID, deal=0, order=ticket,
+                               volume=0, price=price, comment="Order modified" if done else "Order not found")
+
+        if action == TRADE_ACTION_REMOVE and self.execution_handler is not None:
+            ticket = request.get('order', 0)
+            done = self.execution_handler.cancel_order(ticket)
+            return TradeResult(retcode=TRADE_RETCODE_DONE if done else TRADE_RETCODE_INVALID, deal=0, order=ticket,
+                               volume=0, price=0, comment="Order removed" if done else "Order not found")
         return None
 
     def order_calc_margin(self, action: int, symbol: str, volume: float, price: float) -> Optional[float]:
-        """从Portfolio组件计算保证金。"""
-        # TODO: 在Portfolio中实现这个计算
-        # 简化实现
-        return (volume * 100000 * price) / self.portfolio.leverage
+        """
+        计算开仓所需的保证金（账户货币）。
+        - 保证金货币是品种的基础货币时（外汇）：手数 * 合约大小 / 杠杆，以保证金货币计。报价货币即账户货币时
+          按 price 换算；否则优先用 基础货币/账户货币 的货币对换算，没有时按 price 折算为报价货币后再换算。
+        - 否则（差价合约等）：手数 * 合约大小 * price / 杠杆，以保证金货币计。
+        账户货币以外的货币需要回测中加载了该货币与账户货币的货币对（例如 extra_symbols=['USDJPY']），
+        按其当前收盘价换算，找不到时返回None。
+        """
+        spec = self.symbol_specs.spec(symbol)
+        margin = volume * spec.contract_size / self.portfolio.leverage
+        base, quote = symbol.upper()[:3], symbol.upper()[3:6]
+        if spec.margin_currency != base:
+            return self._to_account_currency(margin * price, spec.margin_currency)
+        if quote != ACCOUNT_CURRENCY:
+            converted = self._to_account_currency(margin, base)
+            if converted is not None:
+                return converted
+        return self._to_account_currency(margin * price, quote)
+
+    def _to_account_currency(self, amount: float, currency: str) -> Optional[float]:
+        """用已加载的货币对的当前收盘价把 currency 金额换算为账户货币。"""
+        if currency == ACCOUNT_CURRENCY:
+            return amount
+        for pair, inverse in ((currency + ACCOUNT_CURRENCY, False), (ACCOUNT_CURRENCY + currency, True)):
+            bar = self.data_handler.get_latest_bar(pair)
+            if bar is not None:
+                return float(amount / bar['close'] if inverse else amount * bar['close'])
+        return None
@@ -0,0 +1,201 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from data_manager import DataManager
+from mt5_types import RatesDTO
+
+# from_data_manager() 每次从DuckDB读取小K线时的分页行数
+_LOAD_ROWS = 100_000
+
+
+def ohlc_order(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """
+    按MT5“1分钟OHLC”模式的约定排列K线内的四个价格，返回形状为(n, 4)的数组：
+    阳线（含十字星）先到最低价再到最高价 O-L-H-C，阴线先到最高价 O-H-L-C。
+    """
+    bullish = close >= open_
+    return np.stack([open_, np.where(bullish, low, high), np.where(bullish, high, low), close], axis=1)
+
+
+class IntrabarModel(ABC):
+    """
+    K线内价格路径模型的基类。
+    每根K线被展开为一条从开盘价出发、经过最高/最低价、到收盘价结束的价格路径，
+    回测引擎按路径相邻两点组成的小区间依次检查挂单和止损止盈，从而得到真实的K线内先后顺序。
+    路径按 chunk_size 根K线为一块用NumPy批量生成，每个品种只缓存当前块，内存占用与回测长度无关。
+    """
+    def __init__(self, chunk_size: int = 1024):
+        self.chunk_size = chunk_size
+        # symbol -> (块起始位置, 块内K线数, 扁平化的价格路径, 每根K线路径的起止偏移, 生成路径所用的K线数组)
+        self._chunks: Dict[str, Tuple[int, int, np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def path(self, symbol: str, bars: np.ndarray, index: int) -> np.ndarray:
+        """返回 bars[index] 的K线内价格路径，第一个点为开盘价，最后一个点为收盘价。"""
+        chunk = self._chunks.get(symbol)
+        if chunk is None or chunk[4] is not bars or not chunk[0] <= index < chunk[0] + chunk[1]:
+            end = min(index + self.chunk_size, len(bars))
+            prices, offsets = self._generate(symbol, bars, index, end)
+            chunk = self._chunks[symbol] = (index, end - index, prices, offsets, bars)
+        start, _, prices, offsets, _ = chunk
+        i = index - start
+        return prices[offsets[i]:offsets[i + 1]]
+
+    @abstractmethod
+    def _generate(self, symbol: str, bars: np.ndarray, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        为 symbol 的 bars[start:end] 生成价格路径。
+        :return: (扁平化的价格数组, 长度为 end-start+1 的偏移数组)，第i根K线的路径为 prices[offsets[i]:offsets[i+1]]。
+        """
+
+    @staticmethod
+    def _fixed_length(paths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        n, width = paths.shape
+        return paths.ravel(), np.arange(n + 1, dtype=np.int64) * width
+
+
+class OHLCPathModel(IntrabarModel):
+    """按 O-L-H-C / O-H-L-C 顺序展开K线，与MT5测试器的“1分钟OHLC”模式一致。"""
+    def _generate(self, symbol, bars, start, end):
+        chunk = bars[start:end]
+        return self._fixed_length(ohlc_order(chunk['open'], chunk['high'], chunk['low'], chunk['close']))
+
+
+class RandomWalkPathModel(IntrabarModel):
+    """
+    可复现的随机游走路径。
+    每根K线随机选择最高价和最低价出现的位置与先后顺序，以开盘价、两个极值和收盘价为锚点，
+    锚点之间用布朗桥连接并截断在 [low, high] 内，因此路径严格经过K线的四个价格且不越界。
+    """
+    def __init__(self, steps: int = 20, seed: Optional[int] = None, chunk_size: int = 1024):
+        """
+        :param steps: 每根K线路径的区间数（路径点数为 steps+1），至少为3。
+        :param seed: 随机种子，相同种子和相同数据产生相同路径。
+        """
+        super().__init__(chunk_size)
+        if steps < 3:
+            raise ValueError("steps 至少为3，才能容纳开盘、最高、最低、收盘四个锚点。")
+        self.steps = steps
+        self.seed = seed
+
+    def _generate(self, symbol, bars, start, end):
+        chunk = bars[start:end]
+        n, steps = len(chunk), self.steps
+        # 以块的起始位置派生随机流，路径与块的生成顺序无关
+        rng = np.random.default_rng(None if self.seed is None else (self.seed, start))
+
+        # 两个极值的位置：从 1..steps-1 中不放回地取两个，按先后排序
+        extremes = np.sort(rng.random((n, steps - 1)).argsort(axis=1)[:, :2] + 1, axis=1)
+        anchor_pos = np.column_stack([np.zeros(n, dtype=np.int64), extremes, np.full(n, steps)])
+        high_first = rng.random(n) < 0.5
+        anchor_val = np.column_stack([
+            chunk['open'],
+            np.where(high_first, chunk['high'], chunk['low']),
+            np.where(high_first, chunk['low'], chunk['high']),
+            chunk['close'],
+        ])
+
+        # 每个路径点所在的锚点区间及其在区间内的位置 t∈[0,1]
+        j = np.arange(steps + 1)
+        segment = np.clip((j[None, :] >= anchor_pos[:, 1:2]).astype(np.int64) + (j[None, :] >= anchor_pos[:, 2:3]), 0, 2)
+        rows = np.arange(n)[:, None]
+        left, right = anchor_pos[rows, segment], anchor_pos[rows, segment + 1]
+        t = (j[None, :] - left) / (right - left)
+        linear = anchor_val[rows, segment] + (anchor_val[rows, segment + 1] - anchor_val[rows, segment]) * t
+
+        # 布朗桥：随机游走减去其在锚点处取值的线性插值，使锚点处的扰动为0
+        walk = np.zeros((n, steps + 1))
+        walk[:, 1:] = np.cumsum(rng.standard_normal((n, steps)), axis=1)
+        bridge = walk - (walk[rows, left] + (walk[rows, right] - walk[rows, left]) * t)
+        scale = (chunk['high'] - chunk['low'])[:, None] / np.sqrt(steps) / 2
+        paths = np.clip(linear + bridge * scale, chunk['low'][:, None], chunk['high'][:, None])
+        return self._fixed_length(paths)
+
+
+# 小K线加载函数：loader(symbol, start, end) 返回 time 在 [start, end) 内（Unix秒，end 为None表示不设上界）、
+# 按时间升序的小周期RatesDTO数组，没有数据时返回None或空数组
+SubBarLoader = Callable[[str, int, Optional[int]], Optional[np.ndarray]]
+
+
+class SubBarReplayModel(IntrabarModel):
+    """
+    用更小周期的K线（例如H1回测中的M1数据）重放每根K线的内部走势。
+    每根小K线再按OHLC顺序展开；某根K线内没有小K线数据时退化为该K线自身的OHLC顺序。
+    小K线按块加载：每生成一块路径（chunk_size 根K线）只加载这一块时间范围内的小K线，内存中只保留当前块，
+    内存占用与回测长度和小K线总数无关。
+    """
+    def __init__(self, sub_bars: Union[SubBarLoader, Dict[str, np.ndarray]], chunk_size: int = 256):
+        """
+        :param sub_bars: 小K线来源：加载函数（见 SubBarLoader，例如 from_data_manager() 按时间窗口读取DuckDB），
+                         或已在内存中的 {symbol: 小周期RatesDTO数组}（按时间升序排列）。
+        """
+        super().__init__(chunk_size)
+        if callable(sub_bars):
+            self.loader = sub_bars
+        else:
+            arrays = {symbol: np.ascontiguousarray(bars, dtype=RatesDTO) for symbol, bars in sub_bars.items()}
+
+            def loader(symbol, start, end):
+                subs = arrays.get(symbol)
+                if subs is None:
+                    return None
+                times = subs['time']
+                return subs[np.searchsorted(times, start):len(subs) if end is None else np.searchsorted(times, end)]
+            self.loader = loader
+
+    @classmethod
+    def from_data_manager(cls, timeframe: str = 'M1', data_manager=None, chunk_size: int = 256) -> 'SubBarReplayModel':
+        """从DuckDB按块读取 timeframe 周期的小K线（DataManager.iter_data），每块路径只读取对应的时间窗口。"""
+        manager = data_manager or DataManager(verbose=False)
+
+        def loader(symbol, start, end):
+            # iter_data 的范围包含结束时间，K线时间为整秒，[start, end) 即 [start, end - 1秒]
+            end_date = pd.Timestamp.max if end is None else pd.to_datetime(end - 1, unit='s')
+            chunks = list(manager.iter_data(symbol, timeframe, pd.to_datetime(start, unit='s'), end_date, _LOAD_ROWS))
+            return np.concatenate(chunks) if chunks else None
+        return cls(loader, chunk_size)
+
+    def _generate(self, symbol, bars, start, end):
+        chunk = bars[start:end]
+        # 第i根K线覆盖 [time[i], time[i+1])。最后一根K线之后没有K线时按K线间隔估计其结束时间
+        # （流式回测中当前块的最后一根K线也是如此），只有一根K线时不设上界
+        times = bars['time']
+        if end < len(bars):
+            stop = int(times[end])
+        elif len(bars) > 1:
+            stop = int(times[-1] + np.diff(times).min())
+        else:
+            stop = None
+        subs = self.loader(symbol, int(chunk['time'][0]), stop)
+        if subs is None or len(subs) == 0:
+            return self._fixed_length(ohlc_order(chunk['open'], chunk['high'], chunk['low'], chunk['close']))
+
+        bounds = np.empty(len(chunk) + 1, dtype=np.int64)
+        bounds[:-1] = chunk['time']
+        bounds[-1] = np.iinfo(np.int64).max if stop is None else stop
+        cut = np.searchsorted(subs['time'], bounds)
+        inner = subs[cut[0]:cut[-1]]
+        counts = np.diff(cut)
+
+        # 没有小K线的K线用自身代替，使每根K线至少有一组OHLC
+        empty = counts == 0
+        if empty.any():
+            filler = chunk[empty]
+            inner = np.concatenate([inner, filler])
+            order = np.argsort(np.concatenate([np.repeat(np.arange(len(chunk)), counts), np.flatnonzero(empty)]),
+                               kind='stable')
+            inner = inner[order]
+            counts = np.maximum(counts, 1)
+
+        prices = ohlc_order(inner['open'], inner['high'], inner['low'], inner['close']).ravel()
+        offsets = np.zeros(len(chunk) + 1, dtype=np.int64)
+        np.cumsum(counts * 4, out=offsets[1:])
+        return prices, offsets
+
+
+def path_segments(path: np.ndarray):
+    """把价格路径拆成相邻两点组成的区间，返回 (open, high, low) 三个列表。"""
+    start, stop = path[:-1], path[1:]
+    return start.tolist(), np.maximum(start, stop).tolist(), np.minimum(start, stop).tolist()
@@ -0,0 +1,231 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# get_positions_info() 对外暴露的字段，与 PositionInfo 一一对应
+POSITION_FIELDS = ('ticket', 'symbol', 'volume', 'price_open', 'profit', 'type', 'time', 'magic', 'sl', 'tp',
+                   'comment')
+
+# 同一根K线内止损和止盈都被触及时，判定先成交哪一个的规则
+INTRABAR_SL_FIRST = 'sl_first'    # 保守：总是先止损（默认）
+INTRABAR_TP_FIRST = 'tp_first'    # 乐观：总是先止盈
+INTRABAR_NEAREST = 'nearest'      # 离开盘价更近的价位先成交
+INTRABAR_RULES = (INTRABAR_SL_FIRST, INTRABAR_TP_FIRST, INTRABAR_NEAREST)
+
+_COLUMNS = ('ticket', 'type', 'volume', 'price_open', 'price_current', 'profit', 'time', 'magic', 'sl', 'tp',
+            'contract_size', 'commission', 'symbol', 'comment')
+
+
+class PositionLedger:
+    """
+    按订单号(ticket)索引的持仓账本，支持对冲模式：同一品种可以同时持有任意多张多单和空单。
+    - 持仓字段按列存放在预分配的NumPy数组中（struct-of-arrays），平仓后的槽位被回收复用。
+    - ticket -> 槽位 的字典使开仓、平仓、查询均为O(1)；另维护按品种、按魔术号的二级索引。
+    - 已平仓的槽位 volume/profit 均为0，因此净值和敞口可以直接对整列求和。
+    """
+    def __init__(self, capacity: int = 64, contract_size: float = 100000):
+        """
+        :param contract_size: 开仓时未指定合约大小的默认值。
+        """
+        self.default_contract_size = contract_size
+        self._allocate(max(capacity, 1))
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._size = 0  # 已使用过的槽位数（含回收的空槽位）
+        # 二级索引：值为按开仓顺序排列的 {ticket: None}，兼顾有序和O(1)删除
+        self._by_symbol: Dict[str, Dict[int, None]] = {}
+        self._by_magic: Dict[int, Dict[int, None]] = {}
+        # 每个品种的持仓槽位数组，开/平仓时失效，盯市时按需重建
+        self._symbol_slots: Dict[str, np.ndarray] = {}
+
+    def _allocate(self, capacity: int):
+        self.ticket = np.zeros(capacity, dtype=np.int64)
+        self.type = np.zeros(capacity, dtype=np.int8)
+        self.volume = np.zeros(capacity)
+        self.price_open = np.zeros(capacity)
+        self.price_current = np.zeros(capacity)
+        self.profit = np.zeros(capacity)
+        self.time = np.zeros(capacity, dtype=np.int64)
+        self.magic = np.zeros(capacity, dtype=np.int64)
+        self.sl = np.zeros(capacity)  # 0表示未设置
+        self.tp = np.zeros(capacity)
+        self.contract_size = np.zeros(capacity)
+        self.commission = np.zeros(capacity)  # 开仓手续费中尚未分摊到已平仓交易的部分
+        self.symbol = np.empty(capacity, dtype=object)
+        self.comment = np.empty(capacity, dtype=object)
+
+    def _grow(self):
+        old = {name: getattr(self, name) for name in _COLUMNS}
+        self._allocate(len(self.ticket) * 2)
+        for name, values in old.items():
+            getattr(self, name)[:len(values)] = values
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, ticket: int) -> bool:
+        return ticket in self._slots
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._slots)
+
+    def open(self, ticket: int, symbol: str, type_: int, volume: float, price: float, time: int,
+             magic: int = 0, comment: str = '', profit: float = 0.0, sl: float = 0.0, tp: float = 0.0,
+             contract_size: Optional[float] = None, commission: float = 0.0):
+        """登记一张新持仓。commission 为开仓手续费，平仓时按平仓手数分摊到每笔交易。"""
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._size == len(self.ticket):
+                self._grow()
+            slot = self._size
+            self._size += 1
+
+        self.ticket[slot] = ticket
+        self.symbol[slot] = symbol
+        self.type[slot] = type_
+        self.volume[slot] = volume
+        self.price_open[slot] = price
+        self.price_current[slot] = price
+        self.profit[slot] = profit
+        self.time[slot] = time
+        self.magic[slot] = magic
+        self.sl[slot] = sl
+        self.tp[slot] = tp
+        self.contract_size[slot] = self.default_contract_size if contract_size is None else contract_size
+        self.commission[slot] = commission
+        self.comment[slot] = comment
+
+        self._slots[ticket] = slot
+        self._by_symbol.setdefault(symbol, {})[ticket] = None
+        self._by_magic.setdefault(magic, {})[ticket] = None
+        self._symbol_slots.pop(symbol, None)
+
+    def close(self, ticket: int) -> dict:
+        """移除一张持仓，返回其平仓前的字段快照。"""
+        snapshot = self.get(ticket)
+        slot = self._slots.pop(ticket)
+        symbol, magic = self.symbol[slot], int(self.magic[slot])
+        del self._by_symbol[symbol][ticket]
+        del self._by_magic[magic][ticket]
+        self._symbol_slots.pop(symbol, None)
+
+        self.volume[slot] = 0.0
+        self.profit[slot] = 0.0
+        self.symbol[slot] = None
+        self.comment[slot] = None
+        self._free.append(slot)
+        return snapshot
+
+    def reduce(self, ticket: int, volume: float):
+        """部分平仓：减少持仓手数，浮动盈亏和未分摊的开仓手续费按比例缩减。"""
+        slot = self._slots[ticket]
+        remaining = self.volume[slot] - volume
+        self.profit[slot] *= remaining / self.volume[slot]
+        self.commission[slot] *= remaining / self.volume[slot]
+        self.volume[slot] = remaining
+
+    def set_stops(self, ticket: int, sl: float, tp: float):
+        """修改持仓的止损/止盈价，0表示取消。"""
+        slot = self._slots[ticket]
+        self.sl[slot] = sl
+        self.tp[slot] = tp
+
+    def get(self, ticket: int) -> Optional[dict]:
+        """以字典形式返回单张持仓，不存在时返回None。"""
+        slot = self._slots.get(ticket)
+        if slot is None:
+            return None
+        return {
+            'ticket': int(self.ticket[slot]),
+            'symbol': self.symbol[slot],
+            'type': int(self.type[slot]),
+            'volume': float(self.volume[slot]),
+            'price_open': float(self.price_open[slot]),
+            'price_current': float(self.price_current[slot]),
+            'profit': float(self.profit[slot]),
+            'time': int(self.time[slot]),
+            'magic': int(self.magic[slot]),
+            'sl': float(self.sl[slot]),
+            'tp': float(self.tp[slot]),
+            'contract_size': float(self.contract_size[slot]),
+            'commission': float(self.commission[slot]),
+            'comment': self.comment[slot],
+        }
+
+    def tickets(self, symbol: Optional[str] = None, magic: Optional[int] = None) -> List[int]:
+        """按开仓顺序返回持仓的ticket，可按品种和/或魔术号过滤。"""
+        if symbol is None and magic is None:
+            return list(self._slots)
+        if magic is None:
+            return list(self._by_symbol.get(symbol, ()))
+        by_magic = self._by_magic.get(magic, {})
+        if symbol is None:
+            return list(by_magic)
+        # 从较小的索引出发取交集
+        by_symbol = self._by_symbol.get(symbol, {})
+        small, large = (by_symbol, by_magic) if len(by_symbol) <= len(by_magic) else (by_magic, by_symbol)
+        return [ticket for ticket in small if ticket in large]
+
+    def slots_for(self, symbol: str) -> np.ndarray:
+        """返回某品种全部持仓所在的槽位数组。"""
+        slots = self._symbol_slots.get(symbol)
+        if slots is None:
+            tickets = self._by_symbol.get(symbol, ())
+            slots = self._symbol_slots[symbol] = np.fromiter((self._slots[t] for t in tickets), dtype=np.int64,
+                                                             count=len(tickets))
+        return slots
+
+    def mark_to_market(self, symbol: str, price: float):
+        """用最新价格一次性重估某品种的全部持仓。"""
+        slots = self.slots_for(symbol)
+        if len(slots) == 0:
+            return
+        direction = 1 - 2 * self.type[slots]  # 买入为1，卖出为-1
+        self.price_current[slots] = price
+        self.profit[slots] = (price - self.price_open[slots]) * direction * self.volume[slots] * self.contract_size[slots]
+
+    def hit_stops(self, symbol: str, open_: float, high: float, low: float, rule: str = INTRABAR_SL_FIRST,
+                  spread: float = 0.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        用一根K线的开/高/低价（bid）一次性检查某品种全部持仓的止损止盈。
+        多单平仓是卖出，按bid判断；空单平仓是买入，按 ask = bid + spread 判断。
+        开盘价已越过止损/止盈价（跳空）时按开盘价成交。
+        :param rule: 止损和止盈在同一根K线内都被触及时的判定规则，见 INTRABAR_RULES。
+        :param spread: 点差（价格单位），即 ask - bid。
+        :return: (tickets, 成交价, 是否为止损) 三个等长数组。
+        """
+        slots = self.slots_for(symbol)
+        if len(slots) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=bool)
+        sl, tp = self.sl[slots], self.tp[slots]
+        is_buy = self.type[slots] == 0
+        offset = np.where(is_buy, 0.0, spread)
+        open_, high, low = open_ + offset, high + offset, low + offset
+
+        sl_hit = (sl > 0) & np.where(is_buy, low <= sl, high >= sl)
+        tp_hit = (tp > 0) & np.where(is_buy, high >= tp, low <= tp)
+        both = sl_hit & tp_hit
+        if rule == INTRABAR_TP_FIRST:
+            sl_hit &= ~both
+        elif rule == INTRABAR_NEAREST:
+            # 开盘价本身越过其中一个价位时，该价位一定先成交
+            sl_hit &= ~both | (np.abs(open_ - sl) <= np.abs(tp - open_))
+        elif rule != INTRABAR_SL_FIRST:
+            raise ValueError(f"未知的K线内成交规则: {rule}")
+        tp_hit &= ~sl_hit
+
+        hit = sl_hit | tp_hit
+        sl, tp, is_buy, sl_hit, open_ = sl[hit], tp[hit], is_buy[hit], sl_hit[hit], open_[hit]
+        # 止损对持仓不利，跳空时按更差的开盘价成交；止盈跳空时按更好的开盘价成交
+        sl_price = np.where(is_buy, np.minimum(open_, sl), np.maximum(open_, sl))
+        tp_price = np.where(is_buy, np.maximum(open_, tp), np.minimum(open_, tp))
+        return self.ticket[slots[hit]], np.where(sl_hit, sl_price, tp_price), sl_hit
+
+    def total_profit(self) -> float:
+        return float(self.profit[:self._size].sum())
+
+    def exposure(self) -> float:
+        """全部持仓的名义价值之和。"""
+        n = self._size
+        return float(np.sum(self.volume[:n] * self.price_current[:n] * self.contract_size[:n]))
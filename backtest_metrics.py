@@ -0,0 +1,130 @@
+from typing import Iterable, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# 每年的K线数量，外汇按每年约260个交易日、每日24小时计算
+PERIODS_PER_YEAR = {
+    'M1': 260 * 24 * 60,
+    'M5': 260 * 24 * 12,
+    'M15': 260 * 24 * 4,
+    'M30': 260 * 24 * 2,
+    'H1': 260 * 24,
+    'H4': 260 * 6,
+    'D1': 260,
+    'W1': 52,
+}
+
+
+def max_drawdown(equity: np.ndarray) -> Tuple[float, int]:
+    """
+    计算最大回撤（百分比，正数）及最长回撤持续时间（K线数，从前高到恢复或结束）。
+    """
+    if len(equity) == 0:
+        return 0.0, 0
+    peak = np.maximum.accumulate(equity)
+    drawdown = 1.0 - equity / peak
+    index = np.arange(len(equity))
+    # 每个位置最近一次创新高的位置，两者之差即为处于回撤中的时间
+    last_peak = np.maximum.accumulate(np.where(equity >= peak, index, 0))
+    return float(drawdown.max() * 100), int((index - last_peak).max())
+
+
+def trade_excursions(trades: pd.DataFrame, bars: Union[np.ndarray, Iterable[np.ndarray]],
+                     contract_size: float = 100000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算每笔交易的最大不利变动(MAE)和最大有利变动(MFE)，以账户货币计。
+    交易区间用时间在K线数组中定位，区间内的最高/最低价用一次 reduceat 求出，
+    区间允许相互重叠（对冲或多张订单）。
+    :param trades: 至少包含 type/volume/price_open/time_open/time_close 列的交易表。
+    :param bars: 该品种的RatesDTO数组，或按时间顺序分块的RatesDTO数组序列（流式回测，见
+                 DuckDBDataHandler.iter_bars()）；分块时逐块累计最高/最低价，不需要整段K线同时在内存中。
+    :param contract_size: 合约大小。交易表有 contract_size 列（回测记录的每笔交易的合约大小）时以该列为准，
+                          只用于填补其中的缺失值。
+    :return: (mae, mfe)，MAE为非正数，MFE为非负数。
+    """
+    if len(trades) == 0:
+        return np.zeros(0), np.zeros(0)
+    if isinstance(bars, np.ndarray):
+        bars = (bars,)
+    time_open = trades['time_open'].to_numpy()
+    time_close = trades['time_close'].to_numpy()
+    highest = np.full(len(trades), -np.inf)
+    lowest = np.full(len(trades), np.inf)
+
+    # 一根K线是否属于交易区间取决于下一根K线的时间，因此每块的最后一根K线留到下一块（或最后）再处理
+    carry = None
+    for chunk in bars:
+        if len(chunk) == 0:
+            continue
+        if carry is not None:
+            chunk = np.concatenate([carry, chunk])
+        times = chunk['time']
+        _accumulate_extremes(chunk[:-1], times[1:], time_open, time_close, highest, lowest)
+        carry = chunk[-1:]
+    if carry is None:
+        return np.zeros(len(trades)), np.zeros(len(trades))
+    _accumulate_extremes(carry, np.array([np.iinfo(np.int64).max]), time_open, time_close, highest, lowest)
+
+    price_open = trades['price_open'].to_numpy()
+    if 'contract_size' in trades:
+        contract_size = trades['contract_size'].fillna(contract_size).to_numpy()
+    size = trades['volume'].to_numpy() * contract_size
+    is_buy = trades['type'].to_numpy() == 0
+    mfe = np.where(is_buy, highest - price_open, price_open - lowest) * size
+    mae = np.where(is_buy, lowest - price_open, price_open - highest) * size
+    return np.minimum(mae, 0.0), np.maximum(mfe, 0.0)
+
+
+def _accumulate_extremes(bars: np.ndarray, next_times: np.ndarray, time_open: np.ndarray, time_close: np.ndarray,
+                         highest: np.ndarray, lowest: np.ndarray):
+    """
+    把 bars 中落在各交易区间内的K线的最高/最低价并入 highest/lowest。
+    K线属于交易区间的条件：开盘时间不晚于平仓时间，且下一根K线（next_times）晚于开仓时间，
+    即从包含开仓时刻的那根K线起、到包含平仓时刻的那根K线止。
+    """
+    start = np.searchsorted(next_times, time_open, side='right')
+    end = np.searchsorted(bars['time'], time_close, side='right')
+    selected = end > start
+    if not selected.any():
+        return
+    # 末尾追加一个哨兵，使 end == len(bars) 时 reduceat 的下标依然合法
+    high = np.append(bars['high'], -np.inf)
+    low = np.append(bars['low'], np.inf)
+    bounds = np.empty(2 * int(selected.sum()), dtype=np.int64)
+    bounds[0::2], bounds[1::2] = start[selected], end[selected]
+    highest[selected] = np.maximum(highest[selected], np.maximum.reduceat(high, bounds)[0::2])
+    lowest[selected] = np.minimum(lowest[selected], np.minimum.reduceat(low, bounds)[0::2])
+
+
+def compute_metrics(equity: np.ndarray, trades: Optional[pd.DataFrame] = None, exposure: Optional[np.ndarray] = None,
+                    periods_per_year: float = PERIODS_PER_YEAR['H1']) -> dict:
+    """
+    一次性计算回测的绩效指标。
+    :param equity: 每根K线的净值曲线。
+    :param trades: 已平仓交易表，需要 profit 列。
+    :param exposure: 每根K线的持仓名义价值，用于计算持仓时间占比。
+    :param periods_per_year: 每年的K线数量，用于年化夏普/索提诺比率。
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    metrics = {}
+
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.zeros(0)
+    std = returns.std() if len(returns) else 0.0
+    downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2)) if len(returns) else 0.0
+    mean = returns.mean() if len(returns) else 0.0
+    annualizer = np.sqrt(periods_per_year)
+    metrics['sharpe'] = float(mean / std * annualizer) if std > 0 else 0.0
+    metrics['sortino'] = float(mean / downside * annualizer) if downside > 0 else 0.0
+    metrics['max_drawdown'], metrics['max_drawdown_duration'] = max_drawdown(equity)
+
+    profits = trades['profit'].to_numpy() if trades is not None and len(trades) else np.zeros(0)
+    gross_profit = profits[profits > 0].sum()
+    gross_loss = -profits[profits < 0].sum()
+    metrics['n_trades'] = int(len(profits))
+    metrics['win_rate'] = float((profits > 0).mean() * 100) if len(profits) else 0.0
+    metrics['profit_factor'] = float(gross_profit / gross_loss) if gross_loss > 0 else (np.inf if gross_profit > 0 else 0.0)
+
+    if exposure is not None and len(exposure):
+        metrics['exposure_time'] = float((np.asarray(exposure) != 0).mean() * 100)
+    return metrics
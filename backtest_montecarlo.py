@@ -0,0 +1,113 @@
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+BOOTSTRAP = 'bootstrap'  # 有放回抽样：交易序列和总收益都会变化
+SHUFFLE = 'shuffle'      # 打乱顺序：总收益不变（未加扰动时），只改变路径和回撤
+
+
+def monte_carlo_trades(trades: pd.DataFrame, initial_cash: float, n_paths: int = 100_000, method: str = BOOTSTRAP,
+                       n_trades: Optional[int] = None, slippage_points: float = 0.0, spread_points: float = 0.0,
+                       point: float = 0.00001, contract_size: float = 100000, ruin_fraction: float = 0.5,
+                       seed: Optional[int] = None, max_batch_elements: int = 4_000_000) -> pd.DataFrame:
+    """
+    对回测产生的交易序列做蒙特卡洛重抽样，估计回撤、爆仓概率和期末净值的分布。
+    所有路径按批次组成 (路径数, 交易数) 矩阵一次性计算，不逐条路径循环；
+    每批的元素数不超过 max_batch_elements，因此10万条路径也只占用有限内存。
+    :param trades: 已平仓交易表，需要 profit 列，可选的 commission/swap 列（负数为成本）计入每笔交易的净盈亏，
+                   与回测引擎的净值一致；施加成本扰动时还需要 volume 列，
+                   可选的 point/contract_size 列覆盖同名参数（多品种回测时按交易各自的品种规格计算成本）。
+    :param method: BOOTSTRAP 有放回抽样，或 SHUFFLE 打乱交易顺序。
+    :param n_trades: 每条路径的交易笔数，默认与原交易数相同（SHUFFLE 时必须相同）。
+    :param slippage_points: 每笔交易额外的不利滑点，在 [0, slippage_points] 点内均匀抽样（开平两次成交各一次）。
+    :param spread_points: 每笔交易额外的点差成本，在 [0, spread_points] 点内均匀抽样。
+    :param ruin_fraction: 净值在任一时刻跌到 initial_cash * ruin_fraction 及以下即视为爆仓。
+    :return: 每行一条路径：terminal_equity、min_equity、max_drawdown（百分比）、ruined。
+    """
+    profits = trades['profit'].to_numpy(dtype=np.float64).copy()
+    for cost in ('commission', 'swap'):
+        if cost in trades:
+            profits += trades[cost].to_numpy(dtype=np.float64)
+    n = len(profits)
+    if n == 0:
+        raise ValueError("交易列表为空，无法进行蒙特卡洛模拟。")
+    if method not in (BOOTSTRAP, SHUFFLE):
+        raise ValueError(f"未知的抽样方法: {method}")
+    length = n if n_trades is None else n_trades
+    if method == SHUFFLE and length != n:
+        raise ValueError("SHUFFLE 只能使用原交易数。")
+
+    perturb = slippage_points > 0 or spread_points > 0
+    if perturb:
+        sizes = trades['contract_size'].to_numpy(dtype=np.float64) if 'contract_size' in trades else contract_size
+        points = trades['point'].to_numpy(dtype=np.float64) if 'point' in trades else point
+        # 每笔交易每1个点的成本（账户货币）
+        cost_per_point = trades['volume'].to_numpy(dtype=np.float64) * sizes * points
+
+    rng = np.random.default_rng(seed)
+    ruin_level = initial_cash * ruin_fraction
+    batch = max(1, min(n_paths, max_batch_elements // length))
+    columns = {name: np.empty(n_paths) for name in ('terminal_equity', 'min_equity', 'max_drawdown')}
+
+    for start in range(0, n_paths, batch):
+        size = min(batch, n_paths - start)
+        if method == BOOTSTRAP:
+            index = rng.integers(0, n, size=(size, length))
+        else:
+            index = rng.permuted(np.broadcast_to(np.arange(n), (size, n)), axis=1)
+        pnl = profits[index]
+        if perturb:
+            extra = rng.uniform(0, 2 * slippage_points, size=pnl.shape) if slippage_points > 0 else 0.0
+            if spread_points > 0:
+                extra = extra + rng.uniform(0, spread_points, size=pnl.shape)
+            pnl -= extra * cost_per_point[index]
+
+        equity = np.cumsum(pnl, axis=1)
+        equity += initial_cash
+        peak = np.maximum(np.maximum.accumulate(equity, axis=1), initial_cash)
+        drawdown = 1.0 - equity / peak
+
+        stop = start + size
+        columns['terminal_equity'][start:stop] = equity[:, -1]
+        columns['min_equity'][start:stop] = np.minimum(equity.min(axis=1), initial_cash)
+        columns['max_drawdown'][start:stop] = drawdown.max(axis=1) * 100
+
+    paths = pd.DataFrame(columns)
+    paths['ruined'] = paths['min_equity'] <= ruin_level
+    return paths
+
+
+def monte_carlo_backtest(backtester, n_paths: int = 100_000, **kwargs) -> pd.DataFrame:
+    """
+    对一次已完成的 EventDrivenBacktester 回测做蒙特卡洛模拟。
+    每笔交易的 point 和 contract_size 取自回测使用的品种规格，其余参数同 monte_carlo_trades()。
+    """
+    trades = backtester.get_trades()
+    if trades.empty:
+        raise ValueError("回测没有产生任何已平仓交易。")
+    specs = {symbol: backtester.specs.spec(symbol) for symbol in trades['symbol'].unique()}
+    trades['point'] = trades['symbol'].map(lambda symbol: specs[symbol].point)
+    trades['contract_size'] = trades['symbol'].map(lambda symbol: specs[symbol].contract_size)
+    return monte_carlo_trades(trades, backtester.initial_cash, n_paths=n_paths, **kwargs)
+
+
+def summarize_monte_carlo(paths: pd.DataFrame, initial_cash: float,
+                          percentiles: Sequence[float] = (5, 25, 50, 75, 95)) -> dict:
+    """
+    汇总蒙特卡洛路径：爆仓概率、亏损概率，以及期末净值和最大回撤的均值与分位数。
+    回撤分位数越高越差，例如 max_drawdown_p95 表示95%的路径回撤不超过该值。
+    """
+    terminal = paths['terminal_equity'].to_numpy()
+    drawdown = paths['max_drawdown'].to_numpy()
+    summary = {
+        'n_paths': len(paths),
+        'ruin_probability': float(paths['ruined'].mean() * 100),
+        'loss_probability': float((terminal < initial_cash).mean() * 100),
+        'terminal_equity_mean': float(terminal.mean()),
+        'max_drawdown_mean': float(drawdown.mean()),
+    }
+    for q, t, d in zip(percentiles, np.percentile(terminal, percentiles), np.percentile(drawdown, percentiles)):
+        summary[f'terminal_equity_p{q:g}'] = float(t)
+        summary[f'max_drawdown_p{q:g}'] = float(d)
+    return summary
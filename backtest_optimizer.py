@@ -0,0 +1,207 @@
+import itertools
+import random
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from backtest_components import BarCursor
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_SILENT
+from data_manager import DataManager
+from mt5_types import RatesDTO
+
+
+def grid_search_space(param_ranges: dict) -> list[dict]:
+    """
+    生成网格搜索的参数组合（笛卡尔积）。
+    :param param_ranges: 参数名 -> 可迭代的取值，例如 {'fast_ma_period': range(5, 30, 5)}。
+    :return: 参数字典列表。
+    """
+    names = list(param_ranges)
+    values = [list(param_ranges[name]) for name in names]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def random_search_space(param_ranges: dict, n_samples: int, params_config: dict = None, seed: int = None) -> list[dict]:
+    """
+    生成随机搜索的参数组合。
+    :param param_ranges: 参数名 -> (low, high) 区间或取值列表。
+                         区间按 params_config 中声明的类型采样：'int' 为闭区间整数，其余为均匀分布浮点数。
+    :param n_samples: 采样数量。
+    :param params_config: 策略的 strategy_params_config，用于确定参数类型。
+    :param seed: 随机种子，保证结果可复现。
+    """
+    params_config = params_config or {}
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(n_samples):
+        params = {}
+        for name, spec in param_ranges.items():
+            if isinstance(spec, tuple) and len(spec) == 2:
+                low, high = spec
+                if params_config.get(name, {}).get('type') == 'int':
+                    params[name] = rng.randint(int(low), int(high))
+                else:
+                    params[name] = rng.uniform(low, high)
+            else:
+                params[name] = rng.choice(list(spec))
+        samples.append(params)
+    return samples
+
+
+# --- 工作进程 ---
+# 每个工作进程在初始化时挂载一次共享内存，之后的所有任务都复用同一份K线数组。
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_bars: Optional[np.ndarray] = None
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    挂载已存在的共享内存块，生命周期由主进程负责，工作进程不应注销它。
+    Python 3.13 之前挂载时总会向 resource_tracker 登记。进程池的工作进程继承了主进程的
+    resource_tracker 时，登记的是同一条记录，不能再撤销，否则主进程 unlink 时 resource_tracker 报 KeyError；
+    只有工作进程启动了自己的 resource_tracker 时才撤销登记，避免它在工作进程退出时删除共享内存。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        from multiprocessing import resource_tracker
+        inherited = getattr(resource_tracker._resource_tracker, '_fd', None) is not None
+        shm = shared_memory.SharedMemory(name=name)
+        if not inherited:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _init_worker(shm_name: str, length: int):
+    global _worker_shm, _worker_bars
+    _worker_shm = _attach_shared_memory(shm_name)
+    _worker_bars = np.ndarray((length,), dtype=RatesDTO, buffer=_worker_shm.buf)
+
+
+def _run_single(strategy_class, symbol: str, timeframe: str, start_date: str, end_date: str,
+                initial_cash: float, params: dict, window: tuple = None, with_equity: bool = False,
+                warmup: int = 0, symbol_specs: dict = None) -> dict:
+    """
+    在工作进程中运行一次回测，返回参数和结果合并后的字典。
+    :param window: 可选，(start, end) 下标区间，只回测共享K线数组的这一段（切片视图，不复制数据）。
+    :param with_equity: 是否在结果中附带净值曲线（'equity_time' 和 'equity' 两个数组）。
+    :param warmup: 窗口开头只作为策略预热历史、不交易也不计入结果的K线数（见 EventDrivenBacktester 的 warmup_bars）。
+    :param symbol_specs: 品种规格（见 EventDrivenBacktester），由主进程加载一次后传给每个任务。
+    """
+    row = dict(params)
+    bars = _worker_bars if window is None else _worker_bars[window[0]:window[1]]
+    try:
+        backtester = EventDrivenBacktester(strategy_class, symbol, timeframe, start_date, end_date,
+                                           initial_cash, params=params, bars=bars,
+                                           verbosity=VERBOSITY_SILENT, warmup_bars=warmup,
+                                           symbol_specs=symbol_specs)
+        backtester.run_backtest()
+        row.update(backtester.get_results())
+        if with_equity:
+            n = backtester.portfolio.history_size
+            row['equity_time'] = backtester.portfolio.time_history[:n].copy()
+            row['equity'] = backtester.portfolio.equity_history[:n].copy()
+        row['error'] = None
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+
+class ParameterOptimizer:
+    """
+    基于 EventDrivenBacktester 的并行参数优化器。
+    - 每个 symbol/timeframe 的数据只从DuckDB加载一次，放入共享内存。
+    - 参数组合分发到 ProcessPoolExecutor 中并行回测，工作进程直接读取共享内存，不再复制数据。
+    - 返回按指定指标排序的结果表。
+    """
+    def __init__(self, strategy_class, symbol: str, timeframe: str, start_date: str, end_date: str,
+                 initial_cash: float = 10000.0, max_workers: int = None, bars: np.ndarray = None,
+                 symbol_specs: dict = None):
+        """
+        :param max_workers: 工作进程数，默认为CPU核心数。
+        :param bars: 可选，已加载好的RatesDTO数组；为None时从DuckDB加载。
+        :param symbol_specs: 可选，{symbol: 规格字段字典}，覆盖品种规格。未提供且从DuckDB加载数据时
+                             同时读取 DataManager 同步的规格表，与直接运行 EventDrivenBacktester 一致。
+        """
+        self.strategy_class = strategy_class
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.start_date = start_date
+        self.end_date = end_date
+        self.initial_cash = initial_cash
+        self.max_workers = max_workers
+        self.bars = bars
+        self.symbol_specs = symbol_specs
+
+    def _load_bars(self) -> np.ndarray:
+        if self.bars is None:
+            manager = DataManager()
+            data = manager.get_data(self.symbol, self.timeframe, self.start_date, self.end_date)
+            if data is None or data.empty:
+                raise ValueError(f"无法从DataManager获取到 {self.symbol} 的数据，请检查数据是否存在或时间范围是否正确。")
+            self.bars = BarCursor.from_dataframe(data).bars
+            if self.symbol_specs is None:
+                self.symbol_specs = manager.get_symbol_specs([self.symbol])
+        return self.bars
+
+    @contextmanager
+    def _executor(self):
+        """
+        把K线放入共享内存并启动进程池，工作进程在初始化时挂载一次共享内存。
+        退出时关闭进程池并释放共享内存。
+        """
+        bars = np.ascontiguousarray(self._load_bars(), dtype=RatesDTO)
+        shm = shared_memory.SharedMemory(create=True, size=max(bars.nbytes, 1))
+        try:
+            shared_bars = np.ndarray(bars.shape, dtype=RatesDTO, buffer=shm.buf)
+            shared_bars[:] = bars
+            del shared_bars  # 释放对缓冲区的引用，否则无法关闭共享内存
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(shm.name, len(bars))) as executor:
+                yield executor
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def grid(self, param_ranges: dict, constraint: Callable[[dict], bool] = None, **run_kwargs) -> pd.DataFrame:
+        """对参数网格执行优化。constraint 用于过滤无效组合，例如快线周期必须小于慢线周期。"""
+        param_sets = grid_search_space(param_ranges)
+        if constraint:
+            param_sets = [p for p in param_sets if constraint(p)]
+        return self.run(param_sets, **run_kwargs)
+
+    def random(self, param_ranges: dict, n_samples: int, seed: int = None,
+               constraint: Callable[[dict], bool] = None, **run_kwargs) -> pd.DataFrame:
+        """对参数区间执行随机搜索。"""
+        param_sets = random_search_space(param_ranges, n_samples, self.strategy_class.strategy_params_config, seed)
+        if constraint:
+            param_sets = [p for p in param_sets if constraint(p)]
+        return self.run(param_sets, **run_kwargs)
+
+    def run(self, param_sets: Iterable[dict], sort_by: str = 'total_return', ascending: bool = False) -> pd.DataFrame:
+        """
+        并行运行所有参数组合。
+        :return: 每行一个参数组合的结果表，按 sort_by 排序，失败的组合排在最后并在 error 列中注明原因。
+        """
+        param_sets = list(param_sets)
+        rows = []
+        with self._executor() as executor:
+            futures = [
+                executor.submit(_run_single, self.strategy_class, self.symbol, self.timeframe,
+                                self.start_date, self.end_date, self.initial_cash, params,
+                                symbol_specs=self.symbol_specs)
+                for params in param_sets
+            ]
+            for future in as_completed(futures):
+                rows.append(future.result())
+
+        results = pd.DataFrame(rows)
+        if sort_by in results.columns:
+            results = results.sort_values(sort_by, ascending=ascending, na_position='last')
+        results.index = pd.RangeIndex(1, len(results) + 1, name='rank')
+        return results
@@ -0,0 +1,84 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+from events import OrderEvent
+
+_INF = float('inf')
+
+
+class PendingOrderBook:
+    """
+    挂单簿，按品种保存尚未触发的限价单(LMT)和止损单(STP)。
+    按触发方向和买卖方向分成四个按价格升序排列的列表，键为 (price, ticket)：
+    - 下方触发（买入限价、卖出止损）：价格跌到挂单价时触发，即 price >= 当根K线最低价；
+    - 上方触发（卖出限价、买入止损）：价格涨到挂单价时触发，即 price <= 当根K线最高价。
+    买单按ask触发、卖单按bid触发，因此买卖分开存放，买单的价格区间整体上移一个点差。
+    每根K线只需四次二分查找即可切出全部被触发的挂单，与挂单总数无关。
+    """
+    def __init__(self):
+        self._orders: Dict[int, OrderEvent] = {}
+        # (symbol, 是否买单) -> [(price, ticket), ...]
+        self._below: Dict[Tuple[str, bool], List[Tuple[float, int]]] = {}
+        self._above: Dict[Tuple[str, bool], List[Tuple[float, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, ticket: int) -> bool:
+        return ticket in self._orders
+
+    @staticmethod
+    def _triggers_below(order: OrderEvent) -> bool:
+        return (order.direction == 'BUY') == (order.order_type == 'LMT')
+
+    def _side(self, order: OrderEvent) -> List[Tuple[float, int]]:
+        book = self._below if self._triggers_below(order) else self._above
+        return book.setdefault((order.symbol, order.direction == 'BUY'), [])
+
+    def add(self, order: OrderEvent):
+        """登记一张挂单，order.order 为其ticket。"""
+        self._orders[order.order] = order
+        insort(self._side(order), (order.price, order.order))
+
+    def remove(self, ticket: int) -> Optional[OrderEvent]:
+        """撤销挂单，ticket不存在时返回None。"""
+        order = self._orders.pop(ticket, None)
+        if order is not None:
+            side = self._side(order)
+            del side[bisect_left(side, (order.price, ticket))]
+        return order
+
+    def modify(self, ticket: int, price: float, sl: float = 0.0, tp: float = 0.0) -> Optional[OrderEvent]:
+        """修改挂单的价格和止损止盈，按新价格重新排序；ticket不存在时返回None。"""
+        order = self._orders.get(ticket)
+        if order is None:
+            return None
+        side = self._side(order)
+        del side[bisect_left(side, (order.price, ticket))]
+        order.price, order.sl, order.tp = price, sl, tp
+        insort(side, (price, ticket))
+        return order
+
+    def orders(self, symbol: Optional[str] = None) -> List[OrderEvent]:
+        """按挂单顺序返回挂单，可按品种过滤。"""
+        return [order for order in self._orders.values() if symbol is None or order.symbol == symbol]
+
+    def trigger(self, symbol: str, high: float, low: float, spread: float = 0.0) -> List[OrderEvent]:
+        """
+        取出并返回被触发的全部挂单：卖单在bid区间 [low, high] 内触发，
+        买单在ask区间 [low + spread, high + spread] 内触发。
+        :param spread: 点差（价格单位），即 ask - bid。
+        """
+        triggered = []
+        for is_buy, offset in ((True, spread), (False, 0.0)):
+            below = self._below.get((symbol, is_buy))
+            if below:
+                i = bisect_left(below, (low + offset,))
+                triggered.extend(below[i:])
+                del below[i:]
+            above = self._above.get((symbol, is_buy))
+            if above:
+                i = bisect_right(above, (high + offset, _INF))
+                triggered.extend(above[:i])
+                del above[:i]
+        return [self._orders.pop(ticket) for _, ticket in triggered]
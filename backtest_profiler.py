@@ -0,0 +1,192 @@
+import cProfile
+import io
+import pstats
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+import pandas as pd
+
+# 对回测引擎组件逐一计时的方法
+_COMPONENT_METHODS = {
+    'data': ('update_bars',),
+    'portfolio': ('on_bar', 'on_signal', 'on_fill'),
+    'execution': ('execute_order', 'check_pending_orders', 'check_stops'),
+    'strategy': ('on_init', 'on_bar', 'on_deinit'),
+}
+STRATEGY_PROFILERS = ('cprofile', 'pyinstrument')
+
+
+class BacktestProfiler:
+    """
+    EventDrivenBacktester 的性能剖析器。
+    attach() 用计时包装替换引擎各组件实例上的方法（类本身不受影响），记录每个方法的调用次数和累计耗时：
+    数据处理器的 update_bars、Portfolio 的 on_bar/on_signal/on_fill、执行处理器的撮合方法、
+    策略的 on_init/on_bar/on_deinit，以及 BacktestTradingGateway 的每一个公开方法。
+    策略时间包含其内部调用网关的时间，报告中的策略“自身”耗时已扣除网关部分。
+    可选地只在策略代码周围开启 cProfile 或 pyinstrument，定位策略内部的热点。
+
+    用法::
+
+        profiler = BacktestProfiler(strategy_profiler='cprofile')
+        profiler.attach(backtester)
+        backtester.run_backtest()
+        print(profiler.report())
+    """
+    def __init__(self, strategy_profiler: Optional[str] = None):
+        """
+        :param strategy_profiler: None（默认，只计时）、'cprofile' 或 'pyinstrument'（需另行安装）。
+        """
+        if strategy_profiler is not None and strategy_profiler not in STRATEGY_PROFILERS:
+            raise ValueError(f"未知的策略剖析器: {strategy_profiler}")
+        self.strategy_profiler = strategy_profiler
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.times: Dict[str, float] = defaultdict(float)
+        self.bars = 0
+        self.total_time = 0.0
+        self.profile = None
+
+    def attach(self, backtester):
+        """为回测引擎的各组件安装计时包装，返回 backtester 本身。应在 run_backtest() 之前调用。"""
+        if self.strategy_profiler == 'cprofile':
+            self.profile = cProfile.Profile()
+        elif self.strategy_profiler == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ImportError("使用 pyinstrument 剖析策略需要先安装: pip install pyinstrument")
+            self.profile = Profiler()
+
+        components = {
+            'data': backtester.data_handler,
+            'portfolio': backtester.portfolio,
+            'execution': backtester.execution_handler,
+            'strategy': backtester.strategy,
+        }
+        for prefix, obj in components.items():
+            for name in _COMPONENT_METHODS[prefix]:
+                self._wrap(obj, name, f'{prefix}.{name}', profiled=prefix == 'strategy')
+
+        gateway = backtester.strategy.gateway
+        for name in dir(type(gateway)):
+            if not name.startswith('_') and callable(getattr(gateway, name)):
+                self._wrap(gateway, name, f'gateway.{name}')
+
+        self._wrap_bars(backtester.data_handler)
+        self._wrap_total(backtester)
+        return backtester
+
+    def _wrap(self, obj, name: str, key: str, profiled: bool = False):
+        method = getattr(obj, name)
+        calls, times, clock = self.calls, self.times, time.perf_counter
+        profile = self.profile if profiled else None
+
+        if profile is None:
+            def timed(*args, **kwargs):
+                start = clock()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    times[key] += clock() - start
+                    calls[key] += 1
+        else:
+            enable, disable = (profile.enable, profile.disable) if isinstance(profile, cProfile.Profile) \
+                else (profile.start, profile.stop)
+
+            def timed(*args, **kwargs):
+                start = clock()
+                enable()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    disable()
+                    times[key] += clock() - start
+                    calls[key] += 1
+        setattr(obj, name, timed)
+
+    def _wrap_bars(self, data_handler):
+        """在 update_bars 计时包装之外再统计实际推进的K线数。"""
+        update_bars = data_handler.update_bars
+
+        def counted():
+            advanced = update_bars()
+            if advanced:
+                self.bars += 1
+            return advanced
+        data_handler.update_bars = counted
+
+    def _wrap_total(self, backtester):
+        run_backtest = backtester.run_backtest
+
+        def timed_run(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return run_backtest(*args, **kwargs)
+            finally:
+                self.total_time += time.perf_counter() - start
+        backtester.run_backtest = timed_run
+
+    def _grouped(self, prefix: str) -> float:
+        return sum(t for key, t in self.times.items() if key.startswith(prefix + '.'))
+
+    def summary(self) -> pd.DataFrame:
+        """每行一个被计时的方法：调用次数、累计耗时（秒）、平均每次耗时（微秒）和占总时间的百分比。"""
+        total = self.total_time or sum(self._grouped(prefix) for prefix in ('data', 'portfolio', 'execution',
+                                                                           'strategy'))
+        rows = [{'method': key, 'calls': self.calls[key], 'time': t,
+                 'per_call_us': t / self.calls[key] * 1e6 if self.calls[key] else 0.0,
+                 'percent': t / total * 100 if total else 0.0}
+                for key, t in self.times.items()]
+        if not rows:
+            return pd.DataFrame(columns=['calls', 'time', 'per_call_us', 'percent'])
+        return pd.DataFrame(rows).set_index('method').sort_values('time', ascending=False)
+
+    def components(self) -> Dict[str, float]:
+        """
+        按组件汇总的耗时（秒）。策略为扣除网关调用后的自身耗时，
+        engine 为总时间中未归入任何组件的部分（事件分发、主循环本身等）。
+        """
+        gateway = self._grouped('gateway')
+        result = {
+            'data': self._grouped('data'),
+            'portfolio': self._grouped('portfolio'),
+            'execution': self._grouped('execution'),
+            'strategy': max(self._grouped('strategy') - gateway, 0.0),
+            'gateway': gateway,
+        }
+        if self.total_time:
+            result['engine'] = max(self.total_time - sum(result.values()), 0.0)
+        return result
+
+    def report(self, top: int = 10) -> str:
+        """生成文本报告：总耗时、K线吞吐量、各组件占比和耗时最多的网关调用。"""
+        components = self.components()
+        total = self.total_time or sum(components.values())
+        lines = [
+            "\n--- Backtest Profile ---",
+            f"Total Time:     {total:.3f}s",
+            f"Bars:           {self.bars} ({self.bars / total if total else 0.0:,.0f} bars/sec)",
+            "Components:",
+        ]
+        for name, t in sorted(components.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"  {name:<12}{t:>9.3f}s {t / total * 100 if total else 0.0:6.1f}%")
+
+        summary = self.summary()
+        gateway = summary[summary.index.str.startswith('gateway.')].head(top)
+        if len(gateway):
+            lines.append("Top Gateway Calls:")
+            for key, row in gateway.iterrows():
+                lines.append(f"  {key[len('gateway.'):]:<24}{int(row['calls']):>9} calls {row['time']:>9.3f}s "
+                             f"{row['per_call_us']:>8.1f}us/call")
+        lines.append("------------------------")
+        return "\n".join(lines)
+
+    def strategy_profile(self, sort_by: str = 'cumulative', limit: int = 30) -> str:
+        """返回策略代码的 cProfile 统计或 pyinstrument 调用树文本；未启用策略剖析时返回空字符串。"""
+        if self.profile is None:
+            return ''
+        if isinstance(self.profile, cProfile.Profile):
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats(sort_by).print_stats(limit)
+            return stream.getvalue()
+        return self.profile.output_text()
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from events import Event, MarketEvent, SignalEvent, OrderEvent, FillEvent
+
+# 控制台输出级别
+VERBOSITY_SILENT = 0   # 不产生任何控制台输出（包括策略日志），用于优化器等批量运行
+VERBOSITY_REPORT = 1   # 只输出初始化信息和最终报告
+VERBOSITY_TRADES = 2   # 额外输出信号/订单/成交事件和策略日志
+VERBOSITY_ALL = 3      # 额外输出每一根K线的市场事件
+
+# 事件种类编码
+EVENT_KINDS = ('MARKET', 'SIGNAL', 'ORDER', 'FILL')
+_KIND_CODES = {MarketEvent: 0, SignalEvent: 1, OrderEvent: 2, FillEvent: 3}
+_DIRECTION_CODES = {'BUY': 1, 'SELL': -1, 'CLOSE': 0}
+
+EventRecordDTO = np.dtype([
+    ('time', 'i8'),         # 事件发生时所在K线的时间（Unix秒）
+    ('kind', 'u1'),         # EVENT_KINDS中的序号
+    ('symbol', 'u2'),       # 品种表中的序号
+    ('direction', 'i1'),    # 1买入，-1卖出，0平仓/无方向
+    ('quantity', 'f8'),
+    ('price', 'f8'),
+    ('commission', 'f8'),
+    ('slippage', 'f8'),
+])
+
+
+class EventRecorder:
+    """
+    结构化的事件记录器。
+    事件被写入预分配的NumPy结构化数组，回测结束后再整体导出为DataFrame/CSV/Parquet，
+    回测主循环中不产生任何I/O。容量不足时按倍数扩容。
+    """
+    def __init__(self, capacity: int = 1024, record_market: bool = False):
+        """
+        :param capacity: 初始容量（记录条数）。
+        :param record_market: 是否记录每根K线的市场事件，默认只记录信号/订单/成交。
+        """
+        self._buffer = np.zeros(max(capacity, 1), dtype=EventRecordDTO)
+        self._size = 0
+        self._time = 0
+        self.record_market = record_market
+        self._symbols = {}
+
+    def __len__(self):
+        return self._size
+
+    def _symbol_code(self, symbol: str) -> int:
+        code = self._symbols.get(symbol)
+        if code is None:
+            code = self._symbols[symbol] = len(self._symbols)
+        return code
+
+    def record(self, event: Event):
+        """记录一个事件。MarketEvent同时更新后续事件所使用的时间戳。"""
+        kind = _KIND_CODES[type(event)]
+        if kind == 0:
+            self._time = event.time or 0
+            if not self.record_market:
+                return
+            values = (0, 0.0, 0.0, 0.0, 0.0)
+        elif kind == 1:
+            values = (_DIRECTION_CODES[event.direction], event.volume or 0.0, 0.0, 0.0, 0.0)
+        elif kind == 2:
+            values = (_DIRECTION_CODES[event.direction], event.quantity, event.price, 0.0, 0.0)
+        else:
+            values = (_DIRECTION_CODES[event.direction], event.quantity, event.fill_price,
+                      event.commission, event.slippage)
+
+        if self._size == len(self._buffer):
+            grown = np.zeros(len(self._buffer) * 2, dtype=EventRecordDTO)
+            grown[:self._size] = self._buffer
+            self._buffer = grown
+        self._buffer[self._size] = (self._time, kind, self._symbol_code(event.symbol)) + values
+        self._size += 1
+
+    @property
+    def records(self) -> np.ndarray:
+        """已记录的事件（EventRecordDTO数组视图）。"""
+        return self._buffer[:self._size]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """将记录转换为DataFrame，时间、事件种类和品种都还原为可读形式。"""
+        records = self.records
+        symbols = np.array(list(self._symbols) or [''], dtype=object)
+        return pd.DataFrame({
+            'time': pd.to_datetime(records['time'], unit='s'),
+            'kind': np.array(EVENT_KINDS, dtype=object)[records['kind']],
+            'symbol': symbols[records['symbol']],
+            'direction': records['direction'],
+            'quantity': records['quantity'],
+            'price': records['price'],
+            'commission': records['commission'],
+            'slippage': records['slippage'],
+        })
+
+    def to_csv(self, path: str):
+        self.to_dataframe().to_csv(path, index=False)
+
+    def to_parquet(self, path: str):
+        """导出为Parquet文件（需要安装pyarrow或fastparquet）。"""
+        self.to_dataframe().to_parquet(path, index=False)
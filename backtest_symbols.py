@@ -0,0 +1,101 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from mt5_types import SymbolInfo, Tick
+
+
+@dataclass(frozen=True)
+class SymbolSpec:
+    """回测所需的交易品种规格，字段对应MT5 symbol_info()中的同名（或近似）字段。"""
+    name: str
+    point: float = 0.00001
+    digits: int = 5
+    contract_size: float = 100000
+    volume_min: float = 0.01
+    volume_max: float = 100.0
+    volume_step: float = 0.01
+    margin_currency: str = 'USD'
+
+    @classmethod
+    def default(cls, symbol: str) -> 'SymbolSpec':
+        """没有同步过规格时按品种名推断：JPY交叉盘3位小数，贵金属2位小数/100盎司，其余外汇5位小数。"""
+        upper = symbol.upper()
+        margin_currency = upper[:3] if len(upper) >= 6 else 'USD'
+        if upper.startswith(('XAU', 'XAG')):
+            return cls(symbol, point=0.01, digits=2, contract_size=100 if upper.startswith('XAU') else 5000,
+                       margin_currency=margin_currency)
+        if 'JPY' in upper:
+            return cls(symbol, point=0.001, digits=3, margin_currency=margin_currency)
+        return cls(symbol, margin_currency=margin_currency)
+
+
+class SymbolSpecCache:
+    """
+    每次回测加载一次的品种规格缓存。
+    - 规格和 SymbolInfo 对象按品种只构建一次，symbol_info() 不再每次调用都创建新对象。
+    - 每个品种的 bid/ask 序列在加载K线时一次性向量化计算：MT5的K线价格为bid，
+      ask = bid + spread * point，spread 取自每根K线存储的点差列。
+    """
+    def __init__(self, specs: Optional[Dict[str, dict]] = None):
+        """
+        :param specs: 可选，{symbol: 规格字段字典}（例如 DataManager.get_symbol_specs() 的结果），
+                      缺失的品种和字段按 SymbolSpec.default() 推断。
+        """
+        self._specs: Dict[str, SymbolSpec] = {}
+        for symbol, fields in (specs or {}).items():
+            base = asdict(SymbolSpec.default(symbol))
+            base.update({k: v for k, v in fields.items() if k in base and v is not None})
+            self._specs[symbol] = SymbolSpec(**base)
+        self._infos: Dict[str, SymbolInfo] = {}
+        # symbol -> (计算报价所用的K线数组, bid, ask)；流式回测中K线数组被替换后重新计算
+        self._quotes: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._ticks: Dict[str, Tuple[np.ndarray, int, Tick]] = {}
+
+    def spec(self, symbol: str) -> SymbolSpec:
+        spec = self._specs.get(symbol)
+        if spec is None:
+            spec = self._specs[symbol] = SymbolSpec.default(symbol)
+        return spec
+
+    def load_quotes(self, symbol: str, bars: np.ndarray):
+        """为一个品种的整段K线预先计算收盘时的 bid/ask 序列。"""
+        bid = bars['close'].astype(np.float64)
+        ask = bid + bars['spread'] * self.spec(symbol).point
+        self._quotes[symbol] = (bars, bid, ask)
+        self._ticks.pop(symbol, None)
+
+    def symbol_info(self, symbol: str, spread: int = 0) -> SymbolInfo:
+        """返回缓存的 SymbolInfo，spread 字段随当前K线更新。"""
+        info = self._infos.get(symbol)
+        if info is None:
+            spec = self.spec(symbol)
+            info = self._infos[symbol] = SymbolInfo(
+                name=symbol,
+                point=spec.point,
+                spread=spread,
+                digits=spec.digits,
+                trade_mode=0,  # SYMBOL_TRADE_MODE_FULL
+                volume_min=spec.volume_min,
+                volume_max=spec.volume_max,
+                volume_step=spec.volume_step,
+            )
+        elif info.spread != spread:
+            info.spread = spread
+        return info
+
+    def tick(self, symbol: str, bars: np.ndarray, index: int) -> Tick:
+        """返回第index根K线收盘时的报价，同一根K线上重复调用返回同一个对象。"""
+        cached = self._ticks.get(symbol)
+        if cached is not None and cached[1] == index and cached[0] is bars:
+            return cached[2]
+        quotes = self._quotes.get(symbol)
+        if quotes is None or quotes[0] is not bars:
+            self.load_quotes(symbol, bars)
+            quotes = self._quotes[symbol]
+        _, bid, ask = quotes
+        tick = Tick(time=int(bars['time'][index]), bid=float(bid[index]), ask=float(ask[index]),
+                    last=float(bid[index]), volume=int(bars['tick_volume'][index]))
+        self._ticks[symbol] = (bars, index, tick)
+        return tick
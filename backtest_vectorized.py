@@ -0,0 +1,174 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from backtest_components import BarCursor
+from backtest_engine import EventDrivenBacktester
+from backtest_metrics import PERIODS_PER_YEAR, compute_metrics
+from backtest_recorder import VERBOSITY_SILENT
+from backtest_symbols import SymbolSpecCache
+from data_manager import DataManager
+from mt5_types import RatesDTO
+
+
+class VectorizedBacktester:
+    """
+    向量化回测引擎，是 EventDrivenBacktester 之外的第二种回测模式。
+    没有事件队列：策略通过 generate_signals() 一次性给出每根K线收盘后的目标仓位，
+    引擎再用NumPy一次性计算成交、滑点、手续费和净值曲线。
+    成交规则与事件驱动引擎保持一致：
+    - 第i根K线上的目标仓位在第i+1根K线开盘价成交，买入按 ask（开盘价+该K线点差）加滑点，卖出减滑点。
+    - 仓位变化时先平掉原有仓位，再按新目标开仓，每笔成交单独收取手续费。
+    - 净值按每根K线收盘价计算浮动盈亏。
+    策略的 vectorized_unsupported_params（例如止损止盈点数）取非零值时，generate_signals() 无法反映这些
+    盘中逻辑，此时改用 EventDrivenBacktester 在同样的数据和交易成本下回测，结果与事件驱动引擎一致。
+    """
+    def __init__(self, strategy_class, symbol: str, timeframe: str, start_date: str, end_date: str, initial_cash: float,
+                 params: dict = None, bars: np.ndarray = None, commission_per_trade: float = 0.1,
+                 slippage_points: int = 2, point: float = None, contract_size: float = None, symbol_specs: dict = None):
+        """
+        :param params: 可选，覆盖strategy_params_config中默认值的策略参数。
+        :param bars: 可选，已加载好的RatesDTO数组，为None时从DuckDB加载。
+        :param point: 可选，覆盖品种规格中的point。
+        :param contract_size: 可选，覆盖品种规格中的合约大小。
+        :param symbol_specs: 可选，{symbol: 规格字段字典}，含义与 EventDrivenBacktester 相同。
+        """
+        if not getattr(strategy_class, 'supports_vectorized', False) or not hasattr(strategy_class, 'generate_signals'):
+            raise TypeError(f"{strategy_class.__name__} 没有声明 supports_vectorized，无法进行向量化回测。")
+
+        self.strategy_class = strategy_class
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.start_date = start_date
+        self.end_date = end_date
+        self.initial_cash = initial_cash
+        self.params = params or {}
+        self.commission_per_trade = commission_per_trade
+        self.slippage_points = slippage_points
+        self.logger = logging.getLogger("MT5Toolbox")
+
+        if symbol_specs is None and bars is None:
+            symbol_specs = DataManager().get_symbol_specs([symbol])
+        self.symbol_specs = symbol_specs
+        spec = SymbolSpecCache(symbol_specs).spec(symbol)
+        self.point = spec.point if point is None else point
+        self.contract_size = spec.contract_size if contract_size is None else contract_size
+        self.slippage = slippage_points * self.point
+
+        if bars is None:
+            data = DataManager().get_data(symbol, timeframe, start_date, end_date)
+            if data is None or data.empty:
+                raise ValueError(f"无法从DataManager获取到 {symbol} 的数据，请检查数据是否存在或时间范围是否正确。")
+            bars = BarCursor.from_dataframe(data).bars
+        self.bars = np.ascontiguousarray(bars, dtype=RatesDTO)
+
+        strategy_params = {k: v['default'] for k, v in strategy_class.strategy_params_config.items()}
+        strategy_params.update(self.params)
+        # 向量化模式下策略不与网关交互
+        self.strategy = strategy_class(None, symbol, timeframe, params=strategy_params)
+        # 设置了向量化无法模拟的参数时改用事件驱动引擎
+        self.unsupported_params = [name for name in getattr(strategy_class, 'vectorized_unsupported_params', ())
+                                   if strategy_params.get(name)]
+
+        self.equity_curve = None
+        self.exposure = None
+        self.trades = None
+
+    def run_backtest(self) -> dict:
+        """运行向量化回测，返回结果字典。"""
+        if self.unsupported_params:
+            return self._run_event_driven()
+        bars = self.bars
+        n = len(bars)
+        opens = bars['open']
+        closes = bars['close']
+
+        target = np.asarray(self.strategy.generate_signals(bars), dtype=np.float64)
+        if target.shape != (n,):
+            raise ValueError(f"generate_signals() 应返回长度为 {n} 的一维数组，实际为 {target.shape}。")
+
+        # held[j]: 第j根K线开盘成交后持有的仓位
+        held = np.zeros(n)
+        held[1:] = target[:-1]
+        prev_held = np.zeros(n)
+        prev_held[1:] = held[:-1]
+        changed = held != prev_held
+
+        close_idx = np.flatnonzero(changed & (prev_held != 0))
+        open_idx = np.flatnonzero(changed & (held != 0))
+
+        # 成交价：开仓方向与仓位同向，平仓方向与原仓位反向；买入一侧另加点差
+        spread = bars['spread'] * self.point
+        open_side = np.sign(held[open_idx])
+        close_side = -np.sign(prev_held[close_idx])
+        open_price = opens[open_idx] + open_side * self.slippage + (open_side > 0) * spread[open_idx]
+        close_price = opens[close_idx] + close_side * self.slippage + (close_side > 0) * spread[close_idx]
+
+        # 每根K线上持仓的开仓价（向前填充最近一次开仓）
+        entry = np.zeros(n)
+        entry[open_idx] = open_price
+        last_open = np.zeros(n, dtype=np.int64)
+        last_open[open_idx] = open_idx
+        entry = entry[np.maximum.accumulate(last_open)]
+
+        # 平仓的第k笔对应开仓的第k笔（同一时刻只持有一个仓位）
+        n_closed = len(close_idx)
+        trade_volume = held[open_idx[:n_closed]]
+        realized = (close_price - open_price[:n_closed]) * trade_volume * self.contract_size
+
+        cash_delta = np.zeros(n)
+        np.add.at(cash_delta, close_idx, realized - self.commission_per_trade)
+        np.add.at(cash_delta, open_idx, -self.commission_per_trade)
+        cash = self.initial_cash + np.cumsum(cash_delta)
+
+        unrealized = np.where(held != 0, (closes - entry) * held * self.contract_size, 0.0)
+        self.equity_curve = cash + unrealized
+        self.exposure = np.abs(held) * self.contract_size * closes
+
+        times = bars['time']
+        self.trades = pd.DataFrame({
+            'symbol': self.symbol,
+            'type': np.where(trade_volume > 0, 0, 1),
+            'volume': np.abs(trade_volume),
+            'price_open': open_price[:n_closed],
+            'price_close': close_price,
+            'time_open': times[open_idx[:n_closed]],
+            'time_close': times[close_idx],
+            'profit': realized,
+            'commission': -2 * self.commission_per_trade,
+            'swap': 0.0,
+        })
+        return self.get_results()
+
+    def _run_event_driven(self) -> dict:
+        """用 EventDrivenBacktester 回测，并把净值、敞口和交易表换成事件驱动引擎的结果。"""
+        self.logger.warning(f"{self.strategy_class.__name__} 的 {', '.join(self.unsupported_params)} 无法向量化模拟，"
+                            f"改用事件驱动引擎回测。")
+        specs = dict(self.symbol_specs or {})
+        specs[self.symbol] = {**specs.get(self.symbol, {}), 'point': self.point, 'contract_size': self.contract_size}
+        engine = EventDrivenBacktester(self.strategy_class, self.symbol, self.timeframe, self.start_date, self.end_date,
+                                       self.initial_cash, params=self.params, bars=self.bars, symbol_specs=specs,
+                                       verbosity=VERBOSITY_SILENT)
+        engine.execution_handler.commission_per_trade = self.commission_per_trade
+        engine.execution_handler.slippage_points = self.slippage_points
+        engine.run_backtest()
+
+        n = engine.portfolio.history_size
+        self.equity_curve = engine.portfolio.equity_history[:n].copy()
+        self.exposure = engine.portfolio.exposure_history[:n].copy()
+        self.trades = pd.DataFrame(engine.portfolio.trade_history)
+        return self.get_results()
+
+    def get_results(self) -> dict:
+        """以字典形式返回回测结果，字段与 EventDrivenBacktester.get_results() 一致。"""
+        final_equity = float(self.equity_curve[-1]) if len(self.equity_curve) else self.initial_cash
+        results = {
+            "final_equity": final_equity,
+            "total_return": (final_equity / self.initial_cash - 1) * 100,
+        }
+        results.update(compute_metrics(
+            self.equity_curve, self.trades, self.exposure,
+            periods_per_year=PERIODS_PER_YEAR.get(self.timeframe.upper(), PERIODS_PER_YEAR['H1']),
+        ))
+        return results
@@ -0,0 +1,174 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Iterable, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from backtest_metrics import PERIODS_PER_YEAR, compute_metrics
+from backtest_optimizer import ParameterOptimizer, _run_single
+
+Window = Union[int, str, pd.Timedelta]
+
+
+def walk_forward_windows(times: np.ndarray, in_sample: Window, out_of_sample: Window,
+                         anchored: bool = False) -> List[Tuple[int, int, int, int]]:
+    """
+    把K线时间序列切分为前后相接的样本内/样本外窗口。
+    :param times: K线时间（Unix秒），升序。
+    :param in_sample: 样本内长度，整数为K线根数，字符串/Timedelta为时间跨度（例如 '180D'）。
+    :param out_of_sample: 样本外长度，单位同上。每一折向前滚动一个样本外长度，样本外区间互不重叠。
+    :param anchored: 为True时样本内起点固定在数据开头（扩展窗口），否则为等长滚动窗口。
+    :return: [(is_start, is_end, oos_start, oos_end), ...] 下标区间，均为左闭右开。
+    """
+    n = len(times)
+    if isinstance(in_sample, int) and isinstance(out_of_sample, int):
+        oos_starts = range(in_sample, n, out_of_sample)
+        bounds = [(start - in_sample, start, min(start + out_of_sample, n)) for start in oos_starts]
+    else:
+        in_span = int(pd.Timedelta(in_sample).total_seconds())
+        out_span = int(pd.Timedelta(out_of_sample).total_seconds())
+        cuts = np.arange(times[0] + in_span, times[-1] + 1, out_span)
+        oos_starts = np.searchsorted(times, cuts)
+        oos_ends = np.searchsorted(times, cuts + out_span)
+        is_starts = np.searchsorted(times, cuts - in_span)
+        bounds = [(int(a), int(b), int(c)) for a, b, c in zip(is_starts, oos_starts, oos_ends) if c > b]
+    return [(0 if anchored else is_start, oos_start, oos_start, oos_end) for is_start, oos_start, oos_end in bounds]
+
+
+def stitch_equity(curves: Iterable[Tuple[np.ndarray, np.ndarray]], initial_cash: float) -> pd.Series:
+    """
+    把各折样本外的净值曲线按收益率首尾相接：每一折都从 initial_cash 起步，
+    拼接时按上一折的期末净值等比缩放，得到一条连续复利的样本外净值曲线。
+    """
+    times, values = [], []
+    capital = initial_cash
+    for time, equity in curves:
+        if len(equity) == 0:
+            continue
+        scaled = equity * (capital / initial_cash)
+        times.append(time)
+        values.append(scaled)
+        capital = scaled[-1]
+    if not values:
+        return pd.Series(dtype=float, name='equity')
+    return pd.Series(np.concatenate(values), index=pd.to_datetime(np.concatenate(times), unit='s').rename('time'),
+                     name='equity')
+
+
+class WalkForwardOptimizer(ParameterOptimizer):
+    """
+    滚动前推（walk-forward）分析。
+    每一折先在样本内窗口上对全部参数组合做优化，再用最优参数回测紧随其后的样本外窗口，
+    最后把各折样本外净值曲线拼接成一条曲线并计算整体指标。
+    - 整段K线只放入一次共享内存，每个任务只取其中一段切片视图，不复制数据。
+    - 所有折的样本内任务一次性提交到同一个进程池；某一折的样本内任务全部完成后立即提交它的样本外任务，
+      各折之间互不等待。
+    - 样本外回测把之前的K线作为预热历史提供给策略（不交易、不计入净值曲线），
+      指标在样本外第一根K线上就已可用，交易和记录从样本外起点开始。
+    """
+    def __init__(self, strategy_class, symbol: str, timeframe: str, start_date: str, end_date: str,
+                 in_sample: Window, out_of_sample: Window, anchored: bool = False,
+                 initial_cash: float = 10000.0, max_workers: int = None, bars: np.ndarray = None,
+                 warmup: int = None, symbol_specs: dict = None):
+        """
+        :param in_sample: 样本内长度，整数为K线根数，字符串/Timedelta为时间跨度。
+        :param out_of_sample: 样本外长度，单位同上。
+        :param anchored: 是否使用起点固定的扩展样本内窗口。
+        :param warmup: 样本外回测前作为预热历史提供给策略的K线根数，默认为该折的整个样本内窗口。
+        """
+        super().__init__(strategy_class, symbol, timeframe, start_date, end_date, initial_cash, max_workers, bars,
+                         symbol_specs)
+        self.in_sample = in_sample
+        self.out_of_sample = out_of_sample
+        self.anchored = anchored
+        self.warmup = warmup
+        self.equity_curve = None
+        self.summary = None
+
+    def run(self, param_sets: Iterable[dict], sort_by: str = 'total_return', ascending: bool = False) -> pd.DataFrame:
+        """
+        运行滚动前推分析。
+        :param sort_by: 样本内选择最优参数所依据的指标。
+        :return: 每行一折的结果表，包含窗口起止时间、最优参数、样本内指标和样本外指标（oos_ 前缀）。
+                 拼接后的样本外净值曲线保存在 self.equity_curve，整体指标保存在 self.summary。
+        """
+        param_sets = list(param_sets)
+        times = self._load_bars()['time']
+        windows = walk_forward_windows(times, self.in_sample, self.out_of_sample, self.anchored)
+        if not windows:
+            raise ValueError("数据长度不足以切分出任何一个样本内/样本外窗口。")
+        common = (self.strategy_class, self.symbol, self.timeframe, self.start_date, self.end_date, self.initial_cash)
+
+        in_sample_rows = [[] for _ in windows]
+        oos_rows = [None] * len(windows)
+        with self._executor() as executor:
+            pending = {}
+            for fold, (is_start, is_end, _, _) in enumerate(windows):
+                for params in param_sets:
+                    pending[executor.submit(_run_single, *common, params, window=(is_start, is_end),
+                                           symbol_specs=self.symbol_specs)] = ('is', fold)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, fold = pending.pop(future)
+                    row = future.result()
+                    if stage == 'oos':
+                        oos_rows[fold] = row
+                        continue
+                    in_sample_rows[fold].append(row)
+                    if len(in_sample_rows[fold]) < len(param_sets):
+                        continue
+                    # 该折样本内优化完成，立即用最优参数回测样本外窗口
+                    best = self._select_best(in_sample_rows[fold], sort_by, ascending)
+                    if best is not None:
+                        params = {name: best[name] for name in param_sets[0]}
+                        is_start, _, oos_start, oos_end = windows[fold]
+                        prefix = is_start if self.warmup is None else max(0, oos_start - self.warmup)
+                        oos = executor.submit(_run_single, *common, params, window=(prefix, oos_end),
+                                              with_equity=True, warmup=oos_start - prefix,
+                                              symbol_specs=self.symbol_specs)
+                        pending[oos] = ('oos', fold)
+
+        folds = []
+        for fold, (is_start, is_end, oos_start, oos_end) in enumerate(windows):
+            row = {
+                'is_start': times[is_start], 'is_end': times[is_end - 1],
+                'oos_start': times[oos_start], 'oos_end': times[oos_end - 1],
+            }
+            best = self._select_best(in_sample_rows[fold], sort_by, ascending)
+            if best is not None:
+                row.update({name: best[name] for name in param_sets[0]})
+                row.update({f'is_{k}': v for k, v in best.items() if k not in param_sets[0] and k != 'error'})
+            oos = oos_rows[fold] or {}
+            row.update({f'oos_{k}': v for k, v in oos.items()
+                        if k not in param_sets[0] and k not in ('equity_time', 'equity')})
+            folds.append(row)
+
+        results = pd.DataFrame(folds)
+        for column in ('is_start', 'is_end', 'oos_start', 'oos_end'):
+            results[column] = pd.to_datetime(results[column], unit='s')
+        results.index = pd.RangeIndex(1, len(results) + 1, name='fold')
+
+        self.equity_curve = stitch_equity(
+            ((row['equity_time'], row['equity']) for row in oos_rows if row and row.get('error') is None),
+            self.initial_cash)
+        equity = self.equity_curve.to_numpy()
+        metrics = compute_metrics(equity, periods_per_year=PERIODS_PER_YEAR.get(self.timeframe.upper(), PERIODS_PER_YEAR['H1']))
+        final_equity = float(equity[-1]) if len(equity) else self.initial_cash
+        self.summary = {
+            'final_equity': final_equity,
+            'total_return': (final_equity / self.initial_cash - 1) * 100,
+            # 交易类指标按各折样本外结果汇总，其余指标基于拼接后的净值曲线
+            'n_trades': int(results['oos_n_trades'].fillna(0).sum()) if 'oos_n_trades' in results else 0,
+            **{k: metrics[k] for k in ('sharpe', 'sortino', 'max_drawdown', 'max_drawdown_duration')},
+        }
+        return results
+
+    @staticmethod
+    def _select_best(rows: list, sort_by: str, ascending: bool):
+        """从样本内结果中选出最优的一组，全部失败时返回None。"""
+        valid = [row for row in rows if row.get('error') is None and row.get(sort_by) is not None]
+        if not valid:
+            return None
+        key = lambda row: row[sort_by]
+        return min(valid, key=key) if ascending else max(valid, key=key)
@@ -1,31 +1,77 @@
 # data_manager.py
 
+import logging
+import numpy as np
 import pandas as pd
 import os
 from datetime import datetime, timedelta
-import MetaTrader5 as mt5
-import time
-import duckdb  # 导入 duckdb
 import re
 
 # 建议在 constants.py 中将 HDF5_FILE 更改为 DUCKDB_FILE
 # from constants import DUCKDB_FILE 
 # 为了方便，我们暂时在这里定义
 DUCKDB_FILE = 'data/market_data.duckdb'
+# 保存品种规格（point/digits/合约大小/手数限制/保证金货币）的表，每个品种一行
+SYMBOL_SPECS_TABLE = 'symbol_specs'
+# 记录每张K线表已同步覆盖的时间范围（半开区间），休市时段同样算作已覆盖
+SYNC_COVERAGE_TABLE = 'sync_coverage'
+# 本地没有数据时增量同步的起始日期
+DEFAULT_SYNC_START = datetime(2020, 1, 1)
+# 派生周期表的登记表：这些K线表由较小周期（通常是M1）的K线在库内聚合得到，而不是从MT5下载
+DERIVED_TIMEFRAMES_TABLE = 'derived_timeframes'
+_BUCKET_UNITS = {'M': 'minutes', 'H': 'hours', 'D': 'days'}
 
 from mt5_utils import _connect_mt5
+from mt5_types import RatesDTO
+from duckdb_pool import CONNECTION_POOL, DuckDBConnectionPool
+from data_sync import (SyncPipeline, SyncTask, coalesce_ranges, coverage_from_times, merge_ranges, subtract_ranges,
+                       timeframe_seconds)
+
+
+def _time_bucket_sql(timeframe_str, column):
+    """
+    返回把时间 column 归入 timeframe_str 周期K线开盘时间的SQL表达式（DuckDB time_bucket）。
+    周K线从周日开始（与MT5一致），月K线从每月1日开始。
+    """
+    tf = timeframe_str.upper()
+    try:
+        if tf.startswith('MN'):
+            return f"time_bucket(INTERVAL '{int(tf[2:] or 1)} months', {column})"
+        if tf.startswith('W'):
+            return f"time_bucket(INTERVAL '{7 * int(tf[1:] or 1)} days', {column}, TIMESTAMP '2000-01-02')"
+        return f"time_bucket(INTERVAL '{int(tf[1:] or 1)} {_BUCKET_UNITS[tf[0]]}', {column})"
+    except (KeyError, ValueError):
+        raise ValueError(f"不支持的K线周期: {timeframe_str}")
 
 class DataManager:
-    def __init__(self, data_path=DUCKDB_FILE):
-        """初始化数据管理器，指定DuckDB文件路径。"""
+    def __init__(self, data_path=DUCKDB_FILE, pool: DuckDBConnectionPool = None, verbose: bool = True):
+        """
+        初始化数据管理器，指定DuckDB文件路径。
+        :param pool: 可选，DuckDB连接池，默认使用进程内共享的 CONNECTION_POOL。
+                     同一进程中的多个 DataManager（包括指向不同文件的）共用连接和表名目录缓存。
+        :param verbose: 为False时不输出读取数据时的警告和错误（例如静默回测、参数优化的工作进程）。
+        """
         self.data_path = data_path
+        self.pool = pool if pool is not None else CONNECTION_POOL
+        self.verbose = verbose
+        self.logger = logging.getLogger("MT5Toolbox")
+        self.last_sync_stats = None  # 最近一次 sync_data() 各任务的进度指标（DataFrame）
         # 确保数据文件所在的目录存在
-        os.makedirs(os.path.dirname(self.data_path), exist_ok=True)
+        os.makedirs(os.path.dirname(self.data_path) or '.', exist_ok=True)
         # print(f"[DataManager] 使用 DuckDB 数据库: {self.data_path}")
 
+    def _log(self, level, message):
+        """写入应用日志（MT5Toolbox），verbose 为False时丢弃。"""
+        if self.verbose:
+            self.logger.log(level, f"[DataManager] {message}")
+
     def _get_connection(self):
-        """获取一个DuckDB连接。"""
-        return duckdb.connect(database=self.data_path, read_only=False)
+        """获取读写游标（上下文管理器），由连接池复用底层连接。"""
+        return self.pool.writer(self.data_path)
+
+    def _get_cursor(self):
+        """获取当前线程的只读游标，同一线程内重复使用，不需要关闭。"""
+        return self.pool.cursor(self.data_path)
 
     def _sanitize_name(self, name):
         """将 symbol 和 timeframe 转换为有效的SQL表名。"""
@@ -36,96 +82,64 @@ class DataManager:
         """从 symbol 和 timeframe 生成标准化的表名。"""
         return f"{self._sanitize_name(symbol)}_{self._sanitize_name(timeframe_str)}"
 
-    def sync_data(self, symbols, timeframes, mt5_config, log_queue, start_date_str=None, end_date_str=None):
+    def _create_rates_table(self, conn, table_name):
+        """创建K线表（已存在时不做任何事），列与MT5 copy_rates_* 返回的字段一致。"""
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                time TIMESTAMP PRIMARY KEY,
+                open DOUBLE,
+                high DOUBLE,
+                low DOUBLE,
+                close DOUBLE,
+                tick_volume BIGINT,
+                spread INT,
+                real_volume BIGINT
+            )
+        """)
+
+    def sync_data(self, symbols, timeframes, mt5_config, log_queue, start_date_str=None, end_date_str=None,
+                  queue_size=8, batch_rows=500_000, chunk_bars=100_000, derive_from=None):
         """
         同步多个交易品种和时间周期的数据到DuckDB。
+        先根据覆盖表确定每个品种/周期缺失的时间范围（见 _plan_sync()），只下载这些范围，再交给 SyncPipeline：
+        调用线程负责从MT5下载（自适应限速），后台线程把下载结果批量写入数据库，两者经有界队列并行。
+        各任务的进度指标保存在 self.last_sync_stats 中。
+        :param derive_from: 可选，例如 'M1'：只从MT5下载该周期，timeframes 中的其他周期在库内由它聚合得到
+                            （见 derive_timeframe()），并只对本次新写入的数据所在的周期增量刷新。
         """
         log_queue.put(f"[DataManager] 开始数据同步任务 (数据库: DuckDB)...")
-        
-        total_tasks = len(symbols) * len(timeframes)
-        completed_tasks = 0
-        
+
         ping, mt5_conn, err_code = _connect_mt5(mt5_config, log_queue, f"数据同步")
         if not mt5_conn:
             log_queue.put(f"[DataManager] 错误：无法连接到MT5进行数据同步。错误代码: {err_code}")
             return False
 
         try:
+            tasks = []
             with self._get_connection() as conn:
+                self._create_coverage_table(conn)
                 for symbol in symbols:
-                    for tf_str in timeframes:
-                        completed_tasks += 1
-                        log_queue.put(f"[DataManager] 正在处理 {symbol} - {tf_str}... (进度 {completed_tasks}/{total_tasks})")
-                        
+                    self._save_symbol_spec(conn, mt5_conn, symbol)
+                    for tf_str in ([derive_from] if derive_from else timeframes):
                         table_name = self._get_table_name(symbol, tf_str)
-                        
                         # 确保表存在
-                        conn.execute(f"""
-                            CREATE TABLE IF NOT EXISTS {table_name} (
-                                time TIMESTAMP PRIMARY KEY,
-                                open DOUBLE,
-                                high DOUBLE,
-                                low DOUBLE,
-                                close DOUBLE,
-                                tick_volume BIGINT,
-                                spread INT,
-                                real_volume BIGINT
-                            )
-                        """)
-                        
-                        # 确定下载的时间范围
-                        if start_date_str and end_date_str:
-                            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-                            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-                            log_queue.put(f"[DataManager] 使用指定时间范围: {start_date.date()} 到 {end_date.date()}")
-                        else:
-                            # 增量同步逻辑
-                            start_date = datetime(2020, 1, 1) # 默认的起始下载日期
-                            try:
-                                # 查找本地最新时间戳
-                                last_time_result = conn.execute(f"SELECT MAX(time) FROM {table_name}").fetchone()
-                                if last_time_result and last_time_result[0]:
-                                    last_time = last_time_result[0]
-                                    start_date = last_time + timedelta(minutes=1) # 从最后一条数据之后开始
-                                    log_queue.put(f"[DataManager] 本地最新数据时间: {last_time}，将从之后开始同步。")
-                                else:
-                                     log_queue.put(f"[DataManager] 本地没有找到 {table_name} 的数据，将从 {start_date.date()} 开始完整下载。")
-                            except Exception as e:
-                                log_queue.put(f"[DataManager] 查询本地数据时发生错误: {e}，将尝试完整下载。")
-                            
-                            end_date = datetime.now()
-                        
-                        if start_date >= end_date:
+                        self._create_rates_table(conn, table_name)
+                        ranges = self._plan_sync(conn, table_name, tf_str, start_date_str, end_date_str,
+                                                 chunk_bars, log_queue)
+                        if not ranges:
                             log_queue.put(f"[DataManager] {symbol} - {tf_str} 的数据已是最新，无需同步。")
-                            continue
+                        for start_date, end_date, open_ended in ranges:
+                            tasks.append(SyncTask(symbol, tf_str, table_name, start_date, end_date, open_ended))
 
-                        timeframe_mt5 = getattr(mt5, f"TIMEFRAME_{tf_str}")
-                        
-                        log_queue.put(f"[DataManager] 正在从MT5下载 {symbol} {tf_str} 数据...")
-                        rates = mt5_conn.copy_rates_range(symbol, timeframe_mt5, start_date, end_date)
-                        
-                        if rates is None or len(rates) == 0:
-                            log_queue.put(f"[DataManager] 未能获取 {symbol} 在 {tf_str} 的新数据。")
-                            continue
-
-                        data_df = pd.DataFrame(rates)
-                        data_df['time'] = pd.to_datetime(data_df['time'], unit='s')
-                        
-                        # 在写入DuckDB时，列名必须完全匹配
-                        # MT5返回 'tick_volume', 'spread', 'real_volume'
-                        # 确保我们的表结构和DataFrame列名一致
-                        data_df = data_df[['time', 'open', 'high', 'low', 'close', 'tick_volume', 'spread', 'real_volume']]
-
-                        # 使用 DuckDB 的高效方式插入数据，并自动处理重复（基于主键 'time'）
-                        conn.register('new_data_df', data_df)
-                        conn.execute(f"""
-                            INSERT INTO {table_name} 
-                            SELECT * FROM new_data_df
-                            ON CONFLICT(time) DO NOTHING
-                        """)
-                        
-                        log_queue.put(f"[DataManager] 成功同步并写入了 {len(data_df)} 条 {symbol} ({tf_str}) 的新数据。")
-                        time.sleep(0.5)
+            pipeline = SyncPipeline(mt5_conn, self._get_connection, log_queue, queue_size=queue_size,
+                                    batch_rows=batch_rows, chunk_bars=chunk_bars, coverage_table=SYNC_COVERAGE_TABLE)
+            pipeline.run(tasks)
+            self.last_sync_stats = pipeline.stats()
+            with self._get_connection() as conn:
+                for table_name in dict.fromkeys(task.table_name for task in tasks):
+                    self._compact_coverage(conn, table_name)
+                if derive_from:
+                    self._refresh_after_sync(conn, symbols, timeframes, derive_from, tasks, log_queue)
 
             log_queue.put("[DataManager] 所有数据同步任务完成。")
             return True
@@ -138,6 +152,231 @@ class DataManager:
             if mt5_conn:
                 mt5_conn.shutdown()
 
+    def _plan_sync(self, conn, table_name, tf_str, start_date_str, end_date_str, chunk_bars, log_queue):
+        """
+        确定需要下载的时间范围，返回 [(开始, 结束, 结束是否为“现在”)]，均为半开区间。
+        指定了起止日期时只补齐该范围内未覆盖的部分；否则从已覆盖范围的起点（没有时为 DEFAULT_SYNC_START）
+        增量同步到现在，中间的缺口一并补齐。相距较近的缺口合并为一次下载。
+        """
+        covered = self._load_coverage(conn, table_name, tf_str)
+        if start_date_str and end_date_str:
+            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+            log_queue.put(f"[DataManager] 使用指定时间范围: {start_date.date()} 到 {end_date.date()}")
+        else:
+            start_date = covered[0][0] if covered else DEFAULT_SYNC_START
+            end_date = datetime.now()
+            if covered:
+                log_queue.put(f"[DataManager] 本地数据已覆盖到 {covered[-1][1]}，将从之后开始同步。")
+            else:
+                log_queue.put(f"[DataManager] 本地没有找到 {table_name} 的数据，将从 {start_date.date()} 开始完整下载。")
+
+        missing = subtract_ranges(start_date, end_date, covered)
+        gaps = [r for r in missing if r[1] < end_date]
+        if gaps:
+            log_queue.put(f"[DataManager] {table_name} 在同步范围内有 {len(gaps)} 处缺口，将一并补齐。")
+        span = timedelta(seconds=timeframe_seconds(tf_str) * chunk_bars)
+        open_ended = not (start_date_str and end_date_str)
+        return [(start, end, open_ended and end == end_date) for start, end in coalesce_ranges(missing, span)]
+
+    def _create_coverage_table(self, conn):
+        """创建同步覆盖表（已存在时不做任何事）。"""
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SYNC_COVERAGE_TABLE} (
+                table_name VARCHAR,
+                start_time TIMESTAMP,
+                end_time TIMESTAMP
+            )
+        """)
+
+    def _load_coverage(self, conn, table_name, tf_str):
+        """
+        读取表的覆盖范围（已合并）。
+        表中有数据但还没有同步记录（本功能之前同步的数据）时，用缺口检测从数据推断覆盖范围并记录下来。
+        """
+        rows = conn.execute(f"SELECT start_time, end_time FROM {SYNC_COVERAGE_TABLE} WHERE table_name = ?",
+                            [table_name]).fetchall()
+        if rows:
+            return merge_ranges(rows)
+        times = conn.execute(f"SELECT time FROM {table_name} ORDER BY time").fetchnumpy()['time']
+        covered = coverage_from_times(times, tf_str)
+        if covered:
+            conn.executemany(f"INSERT INTO {SYNC_COVERAGE_TABLE} VALUES (?, ?, ?)",
+                             [(table_name, start, end) for start, end in covered])
+        return covered
+
+    def _compact_coverage(self, conn, table_name):
+        """把表的覆盖记录合并为最少的区间。"""
+        rows = conn.execute(f"SELECT start_time, end_time FROM {SYNC_COVERAGE_TABLE} WHERE table_name = ?",
+                            [table_name]).fetchall()
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(f"DELETE FROM {SYNC_COVERAGE_TABLE} WHERE table_name = ?", [table_name])
+        ranges = merge_ranges(rows)
+        if ranges:
+            conn.executemany(f"INSERT INTO {SYNC_COVERAGE_TABLE} VALUES (?, ?, ?)",
+                             [(table_name, start, end) for start, end in ranges])
+        conn.execute("COMMIT")
+
+    def _refresh_after_sync(self, conn, symbols, timeframes, source_tf, tasks, log_queue):
+        """同步 source_tf 之后刷新由它派生的周期，从本次最早写入的数据所在的周期开始重新聚合。"""
+        for symbol in symbols:
+            source_table = self._get_table_name(symbol, source_tf)
+            written = [task.start for task in tasks if task.table_name == source_table and task.rows_written]
+            since = min(written) if written else None
+            for tf_str in timeframes:
+                if tf_str == source_tf:
+                    continue
+                count = self._derive_timeframe(conn, symbol, tf_str, source_tf, since)
+                log_queue.put(f"[DataManager] 已由 {source_tf} 聚合更新 {symbol} ({tf_str}) 的 {count} 根K线。")
+
+    def _create_derived_table(self, conn):
+        """创建派生周期登记表（已存在时不做任何事）。"""
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {DERIVED_TIMEFRAMES_TABLE} (
+                table_name VARCHAR PRIMARY KEY,
+                symbol VARCHAR,
+                timeframe VARCHAR,
+                source_timeframe VARCHAR
+            )
+        """)
+
+    def derive_timeframe(self, symbol, timeframe_str, source_timeframe='M1', since=None):
+        """
+        在库内把 source_timeframe 的K线聚合为 timeframe_str 周期（time_bucket 分组，开盘价取第一根、
+        最高/最低取极值、收盘价和点差取最后一根、成交量求和），结果物化为普通的K线表，
+        get_data() 和回测与读取从MT5同步的数据完全一样，新增周期也不需要再访问终端。
+        再次调用时只重新聚合最后一根（可能尚未完整的）K线及之后的新周期；指定 since 时从包含该时间的周期
+        开始重新聚合（例如补齐了更早的缺口之后）。
+        :return: 写入（新增或更新）的K线数量。
+        """
+        with self._get_connection() as conn:
+            return self._derive_timeframe(conn, symbol, timeframe_str, source_timeframe, since)
+
+    def refresh_derived_timeframes(self, symbols=None):
+        """增量刷新所有（或指定品种的）派生周期表，返回 {表名: 写入的K线数量}。"""
+        if not os.path.exists(self.data_path) or not self.pool.has_table(self.data_path, DERIVED_TIMEFRAMES_TABLE):
+            return {}
+        with self._get_connection() as conn:
+            rows = conn.execute(f"SELECT table_name, symbol, timeframe, source_timeframe FROM {DERIVED_TIMEFRAMES_TABLE}").fetchall()
+            return {table_name: self._derive_timeframe(conn, symbol, tf_str, source_tf)
+                    for table_name, symbol, tf_str, source_tf in rows if symbols is None or symbol in symbols}
+
+    def _derive_timeframe(self, conn, symbol, timeframe_str, source_timeframe, since=None):
+        source_table = self._get_table_name(symbol, source_timeframe)
+        table_name = self._get_table_name(symbol, timeframe_str)
+        if timeframe_seconds(timeframe_str) <= timeframe_seconds(source_timeframe):
+            raise ValueError(f"只能由较小的周期聚合得到较大的周期: {source_timeframe} -> {timeframe_str}")
+        if not self.pool.has_table(self.data_path, source_table):
+            raise ValueError(f"没有找到 {source_table} 的数据，无法聚合出 {timeframe_str} 周期。")
+
+        self._create_derived_table(conn)
+        self._create_rates_table(conn, table_name)
+        # 新建的表在写游标退出前就可能被读取（例如 refresh_derived_timeframes 中的下一个周期），立即刷新表名目录
+        self.pool.tables(self.data_path, refresh=True)
+        registered = conn.execute(f"SELECT source_timeframe FROM {DERIVED_TIMEFRAMES_TABLE} WHERE table_name = ?",
+                                  [table_name]).fetchone()
+        last = conn.execute(f"SELECT MAX(time) FROM {table_name}").fetchone()[0]
+        if registered is None and last is not None:
+            raise ValueError(f"{table_name} 中已有从MT5同步的数据，不能用 {source_timeframe} 聚合的数据覆盖。")
+        if registered is not None and registered[0] != source_timeframe:
+            last = None  # 换了来源周期，全部重新聚合
+        conn.execute(f"INSERT OR REPLACE INTO {DERIVED_TIMEFRAMES_TABLE} VALUES (?, ?, ?, ?)",
+                     [table_name, symbol, timeframe_str, source_timeframe])
+
+        # 最后一根派生K线可能只聚合了部分数据，从它开始（或从 since 所在的周期开始）重新聚合
+        lower = last if since is None or last is None else min(last, since)
+        where, params = "", []
+        if lower is not None:
+            where, params = f"WHERE time >= {_time_bucket_sql(timeframe_str, 'CAST(? AS TIMESTAMP)')}", [lower]
+        return conn.execute(f"""
+            INSERT OR REPLACE INTO {table_name}
+            SELECT
+                bucket AS time,
+                arg_min(open, time),
+                MAX(high),
+                MIN(low),
+                arg_max(close, time),
+                SUM(tick_volume),
+                arg_max(spread, time),
+                SUM(real_volume)
+            FROM (
+                SELECT {_time_bucket_sql(timeframe_str, 'time')} AS bucket, *
+                FROM {source_table}
+                {where}
+            )
+            GROUP BY bucket
+        """, params).fetchone()[0]
+
+    def get_missing_ranges(self, symbol, timeframe_str, start_date, end_date):
+        """
+        返回 [start_date, end_date] 中尚未同步覆盖的时间范围（半开区间列表），供回测在开始前检查数据是否完整。
+        表没有同步记录时无法判断，返回None。
+        """
+        table_name = self._get_table_name(symbol, timeframe_str)
+        if not os.path.exists(self.data_path) or not self.pool.has_table(self.data_path, SYNC_COVERAGE_TABLE):
+            return None
+        if self.pool.has_table(self.data_path, DERIVED_TIMEFRAMES_TABLE):
+            # 派生周期的完整性取决于它的来源周期
+            derived = self._get_cursor().execute(
+                f"SELECT source_timeframe FROM {DERIVED_TIMEFRAMES_TABLE} WHERE table_name = ?", [table_name]).fetchone()
+            if derived is not None:
+                table_name = self._get_table_name(symbol, derived[0])
+        rows = self._get_cursor().execute(
+            f"SELECT start_time, end_time FROM {SYNC_COVERAGE_TABLE} WHERE table_name = ?", [table_name]).fetchall()
+        if not rows:
+            return None
+        start = pd.to_datetime(start_date).to_pydatetime()
+        # end_date 与 get_data() 一样包含在内
+        end = pd.to_datetime(end_date).to_pydatetime() + timedelta(seconds=1)
+        return subtract_ranges(start, end, merge_ranges(rows))
+
+    def _create_symbol_specs_table(self, conn):
+        """创建品种规格表（已存在时不做任何事）。"""
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SYMBOL_SPECS_TABLE} (
+                symbol VARCHAR PRIMARY KEY,
+                point DOUBLE,
+                digits INT,
+                contract_size DOUBLE,
+                volume_min DOUBLE,
+                volume_max DOUBLE,
+                volume_step DOUBLE,
+                margin_currency VARCHAR
+            )
+        """)
+
+    def _save_symbol_spec(self, conn, mt5_conn, symbol):
+        """把MT5的品种规格写入（或更新）规格表，供回测加载。"""
+        info = mt5_conn.symbol_info(symbol)
+        if info is None:
+            return
+        self._create_symbol_specs_table(conn)
+        conn.execute(f"INSERT OR REPLACE INTO {SYMBOL_SPECS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            symbol, info.point, info.digits, info.trade_contract_size,
+            info.volume_min, info.volume_max, info.volume_step, info.currency_margin,
+        ])
+
+    def get_symbol_specs(self, symbols=None):
+        """
+        读取已同步的品种规格。
+        :return: {symbol: 规格字段字典}；数据库或规格表不存在时返回空字典。
+        """
+        if not os.path.exists(self.data_path):
+            return {}
+        try:
+            if not self.pool.has_table(self.data_path, SYMBOL_SPECS_TABLE):
+                return {}
+            conn = self._get_cursor()
+            rows = conn.execute(f"SELECT * FROM {SYMBOL_SPECS_TABLE}").fetchall()
+            columns = [d[0] for d in conn.description]
+        except Exception as e:
+            self._log(logging.ERROR, f"读取品种规格时出错: {e}")
+            return {}
+        specs = {row[0]: dict(zip(columns[1:], row[1:])) for row in rows}
+        if symbols is not None:
+            specs = {s: specs[s] for s in symbols if s in specs}
+        return specs
+
     def get_data(self, symbol, timeframe_str, start_date, end_date):
         """
         从DuckDB文件中获取指定范围内的数据。
@@ -150,36 +389,93 @@ class DataManager:
             end_date = pd.to_datetime(end_date)
 
         try:
-            # 使用 'read_only=True' 可以允许多个进程同时读取
-            with duckdb.connect(database=self.data_path, read_only=True) as conn:
-                
-                # 1. 检查表是否存在
-                table_check = conn.execute(f"SELECT 1 FROM information_schema.tables WHERE table_name = '{table_name}'").fetchone()
-                if not table_check:
-                    print(f"[DataManager] 警告: 在数据库 '{self.data_path}' 中没有找到表 '{table_name}'。")
-                    return None
-                
-                # 2. 查询数据
-                # 使用参数化查询防止SQL注入
-                query = f"""
-                    SELECT * FROM {table_name} 
-                    WHERE time >= ? AND time <= ?
-                    ORDER BY time
-                """
-                data = conn.execute(query, [start_date, end_date]).fetch_df()
-                
-                if data.empty:
-                    print(f"[DataManager] 警告: 在指定日期范围 {start_date.date()} 到 {end_date.date()} 内没有找到 {table_name} 的数据。")
-                    return None
-                
-                # 3. 将 'time' 列设为索引，以匹配 backtest_engine 的期望
-                data.set_index('time', inplace=True)
-                return data
+            # 1. 检查表是否存在（使用连接池缓存的表名目录，不再每次查询 information_schema）
+            if not self.pool.has_table(self.data_path, table_name):
+                self._log(logging.WARNING, f"在数据库 '{self.data_path}' 中没有找到表 '{table_name}'。")
+                return None
+
+            # 2. 查询数据
+            # 使用参数化查询防止SQL注入；游标以只读方式打开，可以允许多个进程同时读取
+            query = f"""
+                SELECT * FROM {table_name} 
+                WHERE time >= ? AND time <= ?
+                ORDER BY time
+            """
+            data = self._get_cursor().execute(query, [start_date, end_date]).fetch_df()
+
+            if data.empty:
+                self._log(logging.WARNING, f"在指定日期范围 {start_date.date()} 到 {end_date.date()} 内没有找到 {table_name} 的数据。")
+                return None
+
+            # 3. 将 'time' 列设为索引，以匹配 backtest_engine 的期望
+            data.set_index('time', inplace=True)
+            return data
                 
         except Exception as e:
-            print(f"[DataManager] 从DuckDB文件中读取数据时出错: {e}")
+            self._log(logging.ERROR, f"从DuckDB文件中读取数据时出错: {e}")
             return None
 
+    def iter_data(self, symbol, timeframe_str, start_date, end_date, chunk_rows=100_000):
+        """
+        分块读取指定范围内的数据（与 get_data() 的范围相同），依次产出最多 chunk_rows 行的RatesDTO数组
+        （除最后一块外都正好是 chunk_rows 行），time 在SQL中转换为epoch秒，不经过pandas。
+        按键集分页：每页读取 time 大于上一页最后一行的前 chunk_rows 行。查询同时带一个时间上界，
+        使每页只扫描对应的一段数据（数据按时间顺序写入，DuckDB按行组的最小/最大值跳过其余数据）；
+        上界的跨度按数据密度估计，窗口内不足 chunk_rows 行时扩大窗口继续读取，凑满一块再产出。
+        分页不依赖K线周期，也可以读取没有固定周期的数据（例如tick）。
+        每页是一次独立的查询，生成器可以在任何线程中迭代（各线程使用自己的游标）。表不存在时不产出任何数据。
+        """
+        table_name = self._get_table_name(symbol, timeframe_str)
+        if not os.path.exists(self.data_path) or not self.pool.has_table(self.data_path, table_name):
+            return
+        first, last, count = self._get_cursor().execute(
+            f"SELECT epoch_us(MIN(time)), epoch_us(MAX(time)), COUNT(*) FROM {table_name} WHERE time >= ? AND time <= ?",
+            [pd.to_datetime(start_date), pd.to_datetime(end_date)]).fetchone()
+        if not count:
+            return
+        columns = ", ".join(["epoch_us(time) AS time"] + list(RatesDTO.names[1:]))
+        query = f"""
+            SELECT {columns} FROM {table_name}
+            WHERE time > make_timestamp(?) AND time <= make_timestamp(?)
+            ORDER BY time
+            LIMIT ?
+        """
+        # 按平均密度估计 chunk_rows 行对应的时间跨度（微秒）
+        span = max((last - first) * chunk_rows // count, 1)
+        lower = first - 1  # 不含
+        pending, buffered = [], 0
+        while lower < last:
+            upper = min(lower + span, last)
+            data = self._get_cursor().execute(query, [lower, upper, chunk_rows - buffered]).fetchnumpy()
+            n = len(data['time'])
+            if n == chunk_rows - buffered:
+                # 页满：下一页从本页最后一行之后开始，窗口跨度按本页的实际密度估计
+                times = data['time']
+                span = max((int(times[-1]) - lower) * chunk_rows // n, 1)
+                lower = int(times[-1])
+            else:
+                # 窗口内的数据已全部读出（包括空窗口，例如周末或数据开始之前），扩大窗口继续
+                lower = upper
+                span *= 2
+            if n:
+                bars = np.empty(n, dtype=RatesDTO)
+                for name in RatesDTO.names:
+                    bars[name] = data[name]
+                bars['time'] //= 1_000_000
+                pending.append(bars)
+                buffered += n
+            if buffered == chunk_rows or (lower >= last and buffered):
+                yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+                pending, buffered = [], 0
+
+    def count_data(self, symbol, timeframe_str, start_date, end_date):
+        """指定范围内的K线数量，表不存在时为0。"""
+        table_name = self._get_table_name(symbol, timeframe_str)
+        if not os.path.exists(self.data_path) or not self.pool.has_table(self.data_path, table_name):
+            return 0
+        return self._get_cursor().execute(f"SELECT COUNT(*) FROM {table_name} WHERE time >= ? AND time <= ?",
+                                          [pd.to_datetime(start_date), pd.to_datetime(end_date)]).fetchone()[0]
+
     def get_local_data_list(self):
         """扫描DuckDB，返回所有已存储数据集的列表。"""
         if not os.path.exists(self.data_path):
@@ -187,43 +483,46 @@ class DataManager:
         
         datasets = []
         try:
-            with duckdb.connect(database=self.data_path, read_only=True) as conn:
-                tables = conn.execute("SHOW TABLES").fetchall()
-                
-                for (table_name,) in tables:
-                    try:
-                        # 获取详细信息
-                        stats = conn.execute(f"""
-                            SELECT 
-                                COUNT(*), 
-                                MIN(time), 
-                                MAX(time) 
-                            FROM {table_name}
-                        """).fetchone()
-                        
-                        count, min_date, max_date = stats
-                        
-                        if count == 0:
-                            continue
-                            
-                        # 尝试从表名解析回 symbol 和 timeframe (这依赖于 _get_table_name 的逻辑)
-                        # 这是一个简单的假设，可能需要根据你的命名规则调整
-                        parts = table_name.rsplit('_', 1)
-                        symbol = parts[0]
-                        timeframe = parts[1] if len(parts) > 1 else 'UNKNOWN'
-                        
-                        datasets.append({
-                            'symbol': symbol, 
-                            'timeframe': timeframe,
-                            'count': count,
-                            'start_date': min_date.strftime('%Y-%m-%d'),
-                            'end_date': max_date.strftime('%Y-%m-%d')
-                        })
-                    except Exception as e:
-                        print(f"[DataManager] 无法获取 {table_name} 的详细信息: {e}")
+            conn = self._get_cursor()
+            # 列表用于界面展示，总是刷新一次表名目录以反映最新同步的结果
+            tables = sorted(self.pool.tables(self.data_path, refresh=True))
+
+            for table_name in tables:
+                if table_name in (SYMBOL_SPECS_TABLE, SYNC_COVERAGE_TABLE, DERIVED_TIMEFRAMES_TABLE):
+                    continue
+                try:
+                    # 获取详细信息
+                    stats = conn.execute(f"""
+                        SELECT 
+                            COUNT(*), 
+                            MIN(time), 
+                            MAX(time) 
+                        FROM {table_name}
+                    """).fetchone()
+                    
+                    count, min_date, max_date = stats
+                    
+                    if count == 0:
                         continue
+                        
+                    # 尝试从表名解析回 symbol 和 timeframe (这依赖于 _get_table_name 的逻辑)
+                    # 这是一个简单的假设，可能需要根据你的命名规则调整
+                    parts = table_name.rsplit('_', 1)
+                    symbol = parts[0]
+                    timeframe = parts[1] if len(parts) > 1 else 'UNKNOWN'
+                    
+                    datasets.append({
+                        'symbol': symbol, 
+                        'timeframe': timeframe,
+                        'count': count,
+                        'start_date': min_date.strftime('%Y-%m-%d'),
+                        'end_date': max_date.strftime('%Y-%m-%d')
+                    })
+                except Exception as e:
+                    self._log(logging.WARNING, f"无法获取 {table_name} 的详细信息: {e}")
+                    continue
 
         except Exception as e:
-            print(f"[DataManager] 扫描本地数据仓库时出错: {e}")
+            self._log(logging.ERROR, f"扫描本地数据仓库时出错: {e}")
         
         return sorted(datasets, key=lambda x: (x['symbol'], x['timeframe']))
\ No newline at end of file
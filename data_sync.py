@@ -0,0 +1,349 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Callable, ContextManager, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # 没有安装pyarrow时，DuckDB直接扫描NumPy数组
+    pa = None
+
+# K线表的列顺序，与 DataManager._create_rates_table() 一致
+RATE_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'tick_volume', 'spread', 'real_volume']
+# 写入时在SQL中把epoch秒转换为TIMESTAMP（make_timestamp 按微秒计，不受会话时区影响）
+_INSERT_COLUMNS = ", ".join(["make_timestamp(time * 1000000) AS time"] + RATE_COLUMNS[1:])
+
+_UNIT_SECONDS = {'M': 60, 'H': 3600, 'D': 86400, 'W': 604800, 'MN': 2592000}
+_DONE = object()
+
+
+def timeframe_seconds(timeframe: str) -> int:
+    """K线周期字符串对应的秒数：'M1' -> 60，'H4' -> 14400，'MN1' 按30天计。"""
+    unit = 'MN' if timeframe.upper().startswith('MN') else timeframe[0].upper()
+    return _UNIT_SECONDS[unit] * int(timeframe[len(unit):] or 1)
+
+
+class AdaptiveRateLimiter:
+    """
+    自适应限速，取代每个任务之后固定的 time.sleep(0.5)。
+    终端响应正常时请求间隔逐步缩短到 min_interval（默认不等待），
+    请求失败（终端繁忙、IPC超时等）时间隔按倍数延长到最多 max_interval，随后的请求据此退避。
+    """
+    def __init__(self, min_interval: float = 0.0, max_interval: float = 5.0, backoff: float = 0.1,
+                 factor: float = 2.0, decay: float = 0.5, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param backoff: 第一次失败后的请求间隔（秒）。
+        :param factor: 每次失败时间隔的放大倍数。
+        :param decay: 每次成功时间隔的缩小倍数，缩小到 backoff 的1/8以下时回到 min_interval。
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.factor = factor
+        self.decay = decay
+        self.interval = min_interval
+        self._sleep = sleep
+        self._clock = clock
+        self._last = None
+        self.waited = 0.0  # 累计等待时间（秒）
+
+    def wait(self):
+        """距离上一次请求不足当前间隔时等待，然后记录本次请求的时间。"""
+        if self.interval > 0 and self._last is not None:
+            remaining = self._last + self.interval - self._clock()
+            if remaining > 0:
+                self._sleep(remaining)
+                self.waited += remaining
+        self._last = self._clock()
+
+    def success(self):
+        interval = self.interval * self.decay
+        self.interval = interval if interval >= self.backoff / 8 else self.min_interval
+        self.interval = max(self.interval, self.min_interval)
+
+    def failure(self):
+        self.interval = min(self.max_interval, max(self.interval * self.factor, self.backoff))
+
+
+def find_gaps(times, timeframe: str) -> List[Tuple[datetime, datetime]]:
+    """
+    向量化的缺口检测：相邻两根K线的间隔大于周期长度处即为缺口。
+    :param times: 按时间升序的K线时间（datetime64 数组或可转换为它的序列）。
+    :return: 每个缺口中可能缺失的K线所在的半开区间 [上一根K线结束, 下一根K线开始)。
+             休市（周末、节假日）同样表现为缺口，是否真的缺数据要结合同步覆盖范围判断。
+    """
+    t = np.asarray(times, dtype='datetime64[s]')
+    step = np.timedelta64(timeframe_seconds(timeframe), 's')
+    idx = np.flatnonzero(np.diff(t) > step)
+    return list(zip((t[idx] + step).astype(datetime), t[idx + 1].astype(datetime)))
+
+
+def coverage_from_times(times, timeframe: str) -> List[Tuple[datetime, datetime]]:
+    """
+    根据已有数据推断覆盖范围（用于没有同步记录的旧表）：连续的K线段视为已覆盖，缺口视为未覆盖。
+    最后一根K线可能是同步时尚未收盘的K线，不计入覆盖范围，下次同步时重新下载。
+    """
+    t = np.asarray(times, dtype='datetime64[s]')
+    if len(t) == 0:
+        return []
+    return subtract_ranges(t[0].astype(datetime), t[-1].astype(datetime), find_gaps(t, timeframe))
+
+
+def merge_ranges(ranges) -> List[Tuple[datetime, datetime]]:
+    """合并重叠或相接的半开区间，返回按开始时间排序的结果。"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        elif start < end:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(start: datetime, end: datetime, covered) -> List[Tuple[datetime, datetime]]:
+    """[start, end) 中不被 covered（已合并的半开区间）覆盖的部分。"""
+    missing = []
+    for a, b in covered:
+        if b <= start or a >= end:
+            continue
+        if a > start:
+            missing.append((start, a))
+        start = max(start, b)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+def coalesce_ranges(ranges, max_span: timedelta) -> List[Tuple[datetime, datetime]]:
+    """
+    把相距较近的缺失区间合并成不超过 max_span 的下载区间（中间已有的数据会被重新下载并覆盖），
+    避免旧表中大量零散的小缺口各自发起一次请求。
+    """
+    windows = []
+    for start, end in ranges:
+        if windows and end - windows[-1][0] <= max_span:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((start, end))
+    return windows
+
+
+@dataclass
+class SyncTask:
+    """
+    一个品种/周期的同步任务及其进度指标。
+    下载范围是半开区间 [start, end)；open_ended 表示 end 是“现在”，最后一根K线可能尚未收盘，
+    不计入覆盖范围。
+    """
+    symbol: str
+    timeframe: str
+    table_name: str
+    start: datetime
+    end: datetime
+    open_ended: bool = False
+    rows_fetched: int = 0
+    rows_written: int = 0
+    chunks: int = 0
+    fetch_seconds: float = 0.0
+    write_seconds: float = 0.0
+    retries: int = 0
+    error: Optional[str] = None
+
+
+def rates_to_columns(chunks: List[np.ndarray]):
+    """
+    把同一张表的若干段MT5 K线结构化数组合并为按列存放的Arrow表，供DuckDB直接扫描；
+    未安装pyarrow时返回 {列名: NumPy数组}，DuckDB同样可以直接扫描。
+    每列只做一次合并/连续化复制，不经过pandas；time 保持为epoch秒，由写入语句转换。
+    """
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in RATE_COLUMNS}
+    return pa.table(columns) if pa is not None else columns
+
+
+class SyncPipeline:
+    """
+    流水线式的历史数据同步。
+    - 下载阶段在调用线程中运行（MT5接口不是线程安全的，只有这一个线程访问终端），
+      按 chunk_bars 根K线把每个任务的时间范围切成若干段依次下载，由 AdaptiveRateLimiter 控制请求节奏，
+      失败的请求按退避间隔重试。
+    - 写入阶段在单独的线程中运行，两个阶段之间是容量为 queue_size 的有界队列：
+      写入跟不上时下载阶段阻塞等待，内存占用不随数据量增长。
+    - 写入线程把队列中积压的数据合并到同一个事务中提交，单个事务最多 batch_rows 行；
+      写入比下载快时每段数据各自一个事务，不会为了凑批而等待。
+      数据以Arrow/NumPy列的形式交给DuckDB，不经过pandas（见 rates_to_columns()）。
+    - 每个任务记录下载/写入的行数、耗时和重试次数，结束时汇总吞吐量写入日志。
+    - 指定 coverage_table 时，每段成功下载的区间（包括没有数据的休市区间）与数据在同一个事务中
+      记入覆盖表，下载失败的区间不记录，下次同步时重新下载。
+    - 写入使用 INSERT OR REPLACE：上次同步时尚未收盘的K线被重新下载后会更新为最终值。
+    """
+    def __init__(self, mt5_conn, writer: Callable[[], ContextManager], log_queue, queue_size: int = 8,
+                 batch_rows: int = 500_000, chunk_bars: int = 100_000, max_retries: int = 5,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None, coverage_table: Optional[str] = None):
+        """
+        :param mt5_conn: MetaTrader5 模块（或接口相同的对象，例如测试用的假模块）。
+        :param writer: 无参可调用对象，返回一个产生DuckDB读写游标的上下文管理器（例如 DataManager._get_connection）。
+        :param log_queue: 日志队列，进度和统计信息以字符串形式放入。
+        :param coverage_table: 可选，记录同步覆盖范围的表（列: table_name, start_time, end_time），需已存在。
+        """
+        self.mt5 = mt5_conn
+        self.writer = writer
+        self.log_queue = log_queue
+        self.queue_size = queue_size
+        self.batch_rows = batch_rows
+        self.chunk_bars = chunk_bars
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.coverage_table = coverage_table
+        self.tasks: List[SyncTask] = []
+        self.elapsed = 0.0
+        self.transactions = 0
+        self._writer_error: Optional[BaseException] = None
+
+    def run(self, tasks: List[SyncTask]) -> List[SyncTask]:
+        """运行全部任务，返回带有进度指标的任务列表。写入阶段出错时抛出该异常。"""
+        self.tasks = list(tasks)
+        started = time.perf_counter()
+        pipe = queue.Queue(maxsize=self.queue_size)
+        writer = threading.Thread(target=self._write_stage, args=(pipe,), name='sync-writer', daemon=True)
+        writer.start()
+        try:
+            self._fetch_stage(pipe)
+        finally:
+            pipe.put(_DONE)
+            writer.join()
+            self.elapsed = time.perf_counter() - started
+        if self._writer_error is not None:
+            raise self._writer_error
+        self._report()
+        return self.tasks
+
+    def _windows(self, task: SyncTask):
+        """把任务的时间范围切成每段最多 chunk_bars 根K线的半开区间。"""
+        span = timedelta(seconds=timeframe_seconds(task.timeframe) * self.chunk_bars)
+        start = task.start
+        while start < task.end:
+            end = min(start + span, task.end)
+            yield start, end
+            start = end
+
+    def _fetch_stage(self, pipe: queue.Queue):
+        total = len(self.tasks)
+        for i, task in enumerate(self.tasks, 1):
+            if self._writer_error is not None:
+                return
+            self.log_queue.put(f"[DataManager] 正在下载 {task.symbol} - {task.timeframe}... (进度 {i}/{total})")
+            timeframe = getattr(self.mt5, f"TIMEFRAME_{task.timeframe}")
+            for start, end in self._windows(task):
+                # copy_rates_range 的结束时间是闭区间
+                rates = self._fetch(task, timeframe, start, end - timedelta(seconds=1))
+                if task.error is not None:
+                    break
+                if rates is not None and len(rates) == 0:
+                    rates = None
+                covered_end = end
+                if task.open_ended and end == task.end:
+                    # 最后一根K线可能尚未收盘：不计入覆盖范围，下次同步时重新下载并更新
+                    covered_end = np.datetime64(int(rates['time'][-1]), 's').astype(datetime) if rates is not None else start
+                if rates is not None:
+                    task.rows_fetched += len(rates)
+                    task.chunks += 1
+                elif self.coverage_table is None or covered_end <= start:
+                    continue
+                pipe.put((task, rates, start, covered_end))  # 写入阶段积压时在这里阻塞
+
+    def _fetch(self, task: SyncTask, timeframe: int, start: datetime, end: datetime) -> Optional[np.ndarray]:
+        """下载一段数据。返回None表示该区间没有数据；重试耗尽时在 task.error 中记录原因。"""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            began = time.perf_counter()
+            rates = self.mt5.copy_rates_range(task.symbol, timeframe, start, end)
+            task.fetch_seconds += time.perf_counter() - began
+            if rates is not None:
+                self.rate_limiter.success()
+                return rates
+            code, description = self.mt5.last_error()
+            if code >= 0:
+                # 请求成功但区间内没有数据（例如周末）
+                self.rate_limiter.success()
+                return None
+            # MT5的 RES_E_* 错误码均为负数：终端繁忙、超时、连接中断等，退避后重试
+            self.rate_limiter.failure()
+            if attempt < self.max_retries:
+                task.retries += 1
+        task.error = f"{description} (代码: {code})"
+        self.log_queue.put(f"[DataManager] 下载 {task.symbol} {task.timeframe} 失败，已重试 {task.retries} 次: {task.error}")
+        return None
+
+    def _write_stage(self, pipe: queue.Queue):
+        try:
+            with self.writer() as conn:
+                batch, rows = [], 0
+                while True:
+                    item = pipe.get()
+                    if item is _DONE:
+                        break
+                    batch.append(item)
+                    rows += len(item[1]) if item[1] is not None else 0
+                    if rows >= self.batch_rows or pipe.empty():
+                        self._flush(conn, batch)
+                        batch, rows = [], 0
+                self._flush(conn, batch)
+        except BaseException as e:
+            self._writer_error = e
+            # 继续取走队列中的数据，避免下载阶段阻塞在已满的队列上
+            while pipe.get() is not _DONE:
+                pass
+
+    def _flush(self, conn, batch: list):
+        """在一个事务中写入一批数据，同一任务的各段数据合并后用一条语句插入。"""
+        if not batch:
+            return
+        grouped = {}
+        coverage = []
+        for task, rates, start, covered_end in batch:
+            if rates is not None:
+                grouped.setdefault(id(task), (task, []))[1].append(rates)
+            if self.coverage_table is not None and start < covered_end:
+                coverage.append((task.table_name, start, covered_end))
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            for task, chunks in grouped.values():
+                began = time.perf_counter()
+                conn.register('new_rates', rates_to_columns(chunks))
+                written = conn.execute(f"""
+                    INSERT OR REPLACE INTO {task.table_name}
+                    SELECT {_INSERT_COLUMNS} FROM new_rates
+                """).fetchone()[0]
+                conn.unregister('new_rates')
+                task.rows_written += written
+                task.write_seconds += time.perf_counter() - began
+            if coverage:
+                conn.executemany(f"INSERT INTO {self.coverage_table} VALUES (?, ?, ?)", coverage)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.transactions += 1
+
+    def stats(self) -> pd.DataFrame:
+        """每行一个任务的进度指标。"""
+        return pd.DataFrame([asdict(task) for task in self.tasks])
+
+    def _report(self):
+        for task in self.tasks:
+            status = f"失败: {task.error}" if task.error else "完成"
+            self.log_queue.put(
+                f"[DataManager] {task.symbol} ({task.timeframe}) {status}：写入 {task.rows_written} 条数据"
+                f"（下载 {task.rows_fetched} 条，{task.chunks} 段，下载 {task.fetch_seconds:.2f}s，"
+                f"写入 {task.write_seconds:.2f}s，重试 {task.retries} 次）")
+        fetched = sum(task.rows_fetched for task in self.tasks)
+        rate = fetched / self.elapsed if self.elapsed else 0.0
+        self.log_queue.put(
+            f"[DataManager] 同步统计：{len(self.tasks)} 个任务，{fetched} 条数据，{self.transactions} 个写入事务，"
+            f"耗时 {self.elapsed:.2f}s（{rate:,.0f} 条/秒，限速等待 {self.rate_limiter.waited:.2f}s）")
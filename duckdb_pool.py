@@ -0,0 +1,117 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, FrozenSet, Optional, Tuple
+
+import duckdb
+
+
+class DuckDBConnectionPool:
+    """
+    进程级的DuckDB连接池，可同时管理多个数据库文件。
+    - 每个数据库文件只打开一个根连接，每个线程通过 cursor() 得到自己的游标（同一数据库实例上的独立连接），
+      之后在该线程中重复使用，不再为每次查询建立连接。
+    - 根连接默认以只读方式打开，多个进程可以同时读取；本进程第一次需要写入时（writer()）关闭只读连接，
+      改用读写方式重新打开，之后的读取也共用这个读写连接。
+      注意：DuckDB的文件锁使得本进程持有连接期间，其他进程无法写入该文件；需要让出文件时调用 close()。
+    - 每个文件的表名目录（catalogue）只查询一次并缓存；写入结束后失效，查不到的表名会先刷新一次目录再判定不存在。
+    - 在fork出的子进程中（例如优化器的工作进程）第一次使用时自动丢弃从父进程继承的连接。
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        # 绝对路径 -> (根连接, 是否只读)
+        self._roots: Dict[str, Tuple[duckdb.DuckDBPyConnection, bool]] = {}
+        # 绝对路径 -> 根连接的版本号；根连接被替换后，各线程缓存的旧游标随之失效
+        self._generations: Dict[str, int] = {}
+        self._catalogs: Dict[str, FrozenSet[str]] = {}
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            # 继承自父进程的连接不能在子进程中使用，也不应在这里关闭
+            self._pid = os.getpid()
+            self._roots.clear()
+            self._catalogs.clear()
+            self._local = threading.local()
+
+    def _root(self, key: str, read_only: bool) -> duckdb.DuckDBPyConnection:
+        """返回 key 的根连接，必要时打开或升级为读写连接。调用方需持有锁。"""
+        root = self._roots.get(key)
+        if root is not None and (read_only or not root[1]):
+            return root[0]
+        if root is not None:
+            self._close_root(key)
+        if read_only and not os.path.exists(key):
+            raise FileNotFoundError(f"DuckDB数据库文件不存在: {key}")
+        connection = duckdb.connect(database=key, read_only=read_only)
+        self._roots[key] = (connection, read_only)
+        self._generations[key] = self._generations.get(key, 0) + 1
+        return connection
+
+    def _close_root(self, key: str):
+        connection, _ = self._roots.pop(key)
+        self._catalogs.pop(key, None)
+        self._generations[key] = self._generations.get(key, 0) + 1
+        connection.close()
+
+    def cursor(self, path: str) -> duckdb.DuckDBPyConnection:
+        """返回当前线程在 path 上的游标，用于读取。同一线程重复调用返回同一个游标。"""
+        self._check_fork()
+        key = self._key(path)
+        cursors = getattr(self._local, 'cursors', None)
+        if cursors is None:
+            cursors = self._local.cursors = {}
+        cached = cursors.get(key)
+        if cached is not None and cached[0] == self._generations.get(key):
+            return cached[1]
+        with self._lock:
+            cursor = self._root(key, read_only=True).cursor()
+            cursors[key] = (self._generations[key], cursor)
+        return cursor
+
+    @contextmanager
+    def writer(self, path: str):
+        """
+        获取 path 上的读写游标（上下文管理器），语句按自动提交执行。
+        同一时间只有一个线程在写；退出时表名目录失效。
+        """
+        self._check_fork()
+        key = self._key(path)
+        with self._lock:
+            cursor = self._root(key, read_only=False).cursor()
+            try:
+                yield cursor
+            finally:
+                self._catalogs.pop(key, None)
+                cursor.close()
+
+    def tables(self, path: str, refresh: bool = False) -> FrozenSet[str]:
+        """返回 path 中的全部表名（缓存）。"""
+        key = self._key(path)
+        catalog = None if refresh else self._catalogs.get(key)
+        if catalog is None:
+            rows = self.cursor(path).execute("SELECT table_name FROM information_schema.tables").fetchall()
+            catalog = self._catalogs[key] = frozenset(name for (name,) in rows)
+        return catalog
+
+    def has_table(self, path: str, table_name: str) -> bool:
+        """表是否存在。先查缓存的目录，查不到时刷新一次，以发现其他连接新建的表。"""
+        return table_name in self.tables(path) or table_name in self.tables(path, refresh=True)
+
+    def close(self, path: Optional[str] = None):
+        """关闭 path（默认全部）的根连接，各线程缓存的游标随之失效，下次使用时重新打开。"""
+        self._check_fork()
+        with self._lock:
+            keys = [self._key(path)] if path is not None else list(self._roots)
+            for key in keys:
+                if key in self._roots:
+                    self._close_root(key)
+
+
+# 进程内所有 DataManager 默认共用的连接池
+CONNECTION_POOL = DuckDBConnectionPool()
@@ -58,7 +58,7 @@ class LiveTradingGateway(TradingGateway):
             )
         return None
 
-    def symbol_select(self, symbol: str, enable: bool) -> bool:
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
         """
         Selects a symbol in the MarketWatch window or removes a symbol from the window.
         """
@@ -109,7 +109,10 @@ class LiveTradingGateway(TradingGateway):
                 profit=p.profit,
                 type=p.type,
                 time=p.time,
-                magic=p.magic
+                magic=p.magic,
+                sl=p.sl,
+                tp=p.tp,
+                comment=p.comment
             ) for p in positions
         )
 
@@ -27,6 +27,15 @@ class SignalEvent(Event):
     direction: Literal['BUY', 'SELL', 'CLOSE']
     type: Literal['SIGNAL'] = 'SIGNAL'
     strength: float = 1.0  # 信号强度，可用于仓位管理
+    volume: Optional[float] = None  # 策略请求的手数，为None时由Portfolio决定
+    order_type: Literal['MKT', 'LMT', 'STP'] = 'MKT'
+    price: float = 0.0  # 对于LMT/STP订单的价格
+    order: int = 0  # 挂单的ticket
+    position: int = 0  # 要平仓的持仓ticket，0表示开新仓
+    sl: float = 0.0  # 新持仓的止损价，0表示不设置
+    tp: float = 0.0  # 新持仓的止盈价，0表示不设置
+    magic: int = 0
+    comment: str = ''
 
 @dataclass
 class OrderEvent(Event):
@@ -40,6 +49,12 @@ class OrderEvent(Event):
     quantity: float
     type: Literal['ORDER'] = 'ORDER'
     price: float = 0.0 # 对于LMT/STP订单的价格
+    order: int = 0  # 挂单的ticket
+    position: int = 0  # 要平仓的持仓ticket，0表示开新仓
+    sl: float = 0.0  # 新持仓的止损价，0表示不设置
+    tp: float = 0.0  # 新持仓的止盈价，0表示不设置
+    magic: int = 0
+    comment: str = ''
 
 @dataclass
 class FillEvent(Event):
@@ -53,4 +68,10 @@ class FillEvent(Event):
     fill_price: float
     type: Literal['FILL'] = 'FILL'
     commission: float = 0.0
-    slippage: float = 0.0
\ No newline at end of file
+    slippage: float = 0.0
+    order: int = 0  # 由挂单成交时为挂单ticket，新持仓沿用该ticket
+    position: int = 0  # 被平仓的持仓ticket，0表示开新仓
+    sl: float = 0.0
+    tp: float = 0.0
+    magic: int = 0
+    comment: str = ''
@@ -58,6 +58,9 @@ class PositionInfo:
     type: int # 0 for buy, 1 for sell
     time: int
     magic: int
+    sl: float = 0.0
+    tp: float = 0.0
+    comment: str = ''
 
 # MT5 K线数据的NumPy结构化数组类型定义
 # 这有助于确保DataHandler和回测引擎使用一致的数据格式
@@ -9,6 +9,16 @@ class Strategy(ABC):
     策略通过依赖注入的方式接收一个 `TradingGateway` 对象，
     从而实现与执行环境（实时或回测）的完全解耦。
     """
+    # 是否支持 VectorizedBacktester 的向量化回测。支持的策略设为 True 并实现
+    # generate_signals(rates)：只在K线收盘时决策、且不依赖止损止盈等盘中逻辑的策略可以实现。
+    #   rates: 整段回测数据的RatesDTO数组，可按字段名取出 open/high/low/close 等列。
+    #   返回与rates等长的数组，第i个元素是在第i根K线收盘后希望持有的仓位（手数，多正空负，0为空仓），
+    #   它将在第i+1根K线开盘时成交。
+    supports_vectorized = False
+    # generate_signals() 无法模拟的参数名（例如止损止盈点数）。其中任何一个取非零值时，
+    # VectorizedBacktester 改用事件驱动引擎回测，结果与 EventDrivenBacktester 一致。
+    vectorized_unsupported_params = ()
+
     def __init__(self, gateway: TradingGateway, symbol: str, timeframe: str, params: dict = None):
         self.gateway = gateway
         self.symbol = symbol
@@ -16,6 +26,11 @@ class Strategy(ABC):
         self.params = params if params is not None else {}
         self._init_mt5_constants()
 
+    @property
+    def verbose(self) -> bool:
+        """是否输出策略日志（由执行环境决定，静默回测时为False）。策略的 log() 应据此判断。"""
+        return getattr(self.gateway, 'verbose', True)
+
     def on_init(self):
         """在策略开始时调用，用于初始化。"""
         pass
@@ -32,6 +47,20 @@ class Strategy(ABC):
         """在策略结束时调用，用于清理。"""
         pass
 
+    def get_state(self) -> dict:
+        """
+        返回策略的运行状态，回测检查点会把它与账户状态一起保存（需可pickle）。
+        默认返回除网关、构造参数、MT5常量和方法之外的全部实例属性；
+        持有不可序列化对象（文件、连接等）的策略应重写此方法和 set_state()。
+        """
+        skip = {'gateway', 'symbol', 'timeframe', 'params'}
+        return {name: value for name, value in vars(self).items()
+                if name not in skip and not name.isupper() and not callable(value)}
+
+    def set_state(self, state: dict):
+        """从检查点恢复 get_state() 返回的状态。断点续跑时以此代替 on_init()。"""
+        vars(self).update(state)
+
     def _init_mt5_constants(self):
         """提供MT5常量以便策略代码兼容。"""
         # 在实际使用中，这些常量可以从一个单独的`constants.py`模块导入
@@ -39,8 +68,16 @@ class Strategy(ABC):
         # 订单类型
         self.ORDER_TYPE_BUY = 0
         self.ORDER_TYPE_SELL = 1
+        self.ORDER_TYPE_BUY_LIMIT = 2
+        self.ORDER_TYPE_SELL_LIMIT = 3
+        self.ORDER_TYPE_BUY_STOP = 4
+        self.ORDER_TYPE_SELL_STOP = 5
         # 交易操作
         self.TRADE_ACTION_DEAL = 1
+        self.TRADE_ACTION_PENDING = 5
+        self.TRADE_ACTION_SLTP = 6
+        self.TRADE_ACTION_MODIFY = 7
+        self.TRADE_ACTION_REMOVE = 8
         # 时间周期 (示例)
         self.TIMEFRAME_M1 = 1
         self.TIMEFRAME_H1 = 16385
@@ -205,4 +205,5 @@ class AdvancedMartingaleV2(Strategy):
 
     def log(self, message):
         """策略日志记录器"""
-        print(f"[{self.strategy_name}@{self.symbol}] {message}")
+        if self.verbose:
+            print(f"[{self.strategy_name}@{self.symbol}] {message}")
@@ -25,6 +25,9 @@ class DualMaCrossoverStrategy(Strategy):
         "stop_loss_pips":   {"label": "止损点数 (0为不止损)", "type": "int", "default": 100},
         "take_profit_pips": {"label": "止盈点数 (0为不止盈)", "type": "int", "default": 200},
     }
+    # 实现了 generate_signals()，可用 VectorizedBacktester 回测；止损止盈只能由事件驱动引擎模拟
+    supports_vectorized = True
+    vectorized_unsupported_params = ("stop_loss_pips", "take_profit_pips")
 
     def on_init(self):
         """策略初始化。"""
@@ -101,6 +104,41 @@ class DualMaCrossoverStrategy(Strategy):
                 self.log("无持仓，准备开立空单...")
                 self._open_position('sell')
 
+    def generate_signals(self, rates):
+        """
+        向量化版本的 check_and_trade()，供 VectorizedBacktester 使用。
+        与事件驱动逻辑一致：在第i根K线上比较第i-1和第i-2根K线的均线；
+        交叉时若持有反向仓位则只平仓，空仓时才按交叉方向开仓。
+        注意：这里不模拟止损止盈，设置了止损止盈时 VectorizedBacktester 改用事件驱动引擎。
+        """
+        close = pd.Series(rates['close'])
+        fast_ma = close.rolling(window=self.params['fast_ma_period']).mean().to_numpy()
+        slow_ma = close.rolling(window=self.params['slow_ma_period']).mean().to_numpy()
+
+        n = len(close)
+        last_fast, last_slow = np.full(n, np.nan), np.full(n, np.nan)
+        prev_fast, prev_slow = np.full(n, np.nan), np.full(n, np.nan)
+        last_fast[1:], last_slow[1:] = fast_ma[:-1], slow_ma[:-1]
+        prev_fast[2:], prev_slow[2:] = fast_ma[:-2], slow_ma[:-2]
+
+        golden = (prev_fast < prev_slow) & (last_fast > last_slow)
+        dead = (prev_fast > prev_slow) & (last_fast < last_slow)
+
+        # 仓位只在交叉处变化，状态机只需遍历交叉点
+        volume = self.params['trade_volume']
+        cross_idx = np.flatnonzero(golden | dead)
+        states = np.zeros(len(cross_idx))
+        state = 0.0
+        for k, i in enumerate(cross_idx):
+            if golden[i]:
+                state = 0.0 if state < 0 else volume
+            else:
+                state = 0.0 if state > 0 else -volume
+            states[k] = state
+
+        segment = np.searchsorted(cross_idx, np.arange(n), side='right') - 1
+        return np.where(segment >= 0, states[segment], 0.0)
+
     def _open_position(self, direction: str):
         """构建并发送开仓请求。"""
         tick = self.gateway.symbol_info_tick(self.symbol)
@@ -172,4 +210,5 @@ class DualMaCrossoverStrategy(Strategy):
         return tf_map.get(tf_str.upper())
         
     def log(self, message):
-        print(f"[{self.strategy_name} - {self.symbol}]: {message}")
\ No newline at end of file
+        if self.verbose:
+            print(f"[{self.strategy_name} - {self.symbol}]: {message}")
\ No newline at end of file
@@ -38,6 +38,7 @@ class OneClickWithStopsStrategy(Strategy):
         
         self.order_comment = f"OCS_{self.magic}"
         self.point = None
+        self.setup_done = False
 
     def on_init(self):
         """策略启动时，执行所有核心逻辑。"""
@@ -50,12 +51,17 @@ class OneClickWithStopsStrategy(Strategy):
         self.point = symbol_info.point
         self.grid_spacing = self.grid_spacing_pips * self.point
 
-        # 1. 执行初始开仓
+        # 回测开始时还没有任何K线，拿不到报价，一次性任务推迟到第一根K线执行
         tick = self.gateway.symbol_info_tick(self.symbol)
         if not tick:
-            self.log("获取当前价格失败，无法执行初始开仓。")
-            return False
-        
+            self.log("暂时无法获取当前价格，初始开仓和挂单将在收到第一根K线时执行。")
+            return True
+        return self._run_setup(tick)
+
+    def _run_setup(self, tick):
+        """执行初始开仓并放置网格挂单，只执行一次。"""
+        self.setup_done = True
+        # 1. 执行初始开仓
         initial_open_price = tick.ask
         self._execute_initial_order(initial_open_price)
         self.log(f"执行初始开仓：{self.symbol} {self.initial_volume}手，价格：{initial_open_price}")
@@ -67,8 +73,12 @@ class OneClickWithStopsStrategy(Strategy):
         return True
 
     def on_bar(self, event: MarketEvent):
-        """对于此策略，所有操作都在on_init中完成，on_bar无需操作。"""
-        pass
+        """所有操作都在启动时完成，on_bar只负责补做 on_init 中因缺少报价而推迟的一次性任务。"""
+        if self.setup_done or event.symbol != self.symbol:
+            return
+        tick = self.gateway.symbol_info_tick(self.symbol)
+        if tick:
+            self._run_setup(tick)
 
     def on_deinit(self):
         """策略停止时的清理工作。"""
@@ -138,4 +148,5 @@ class OneClickWithStopsStrategy(Strategy):
     def log(self, message):
         """策略日志记录器"""
         # 使用 print 或 logging，取决于项目配置
-        print(f"[{self.strategy_name}@{self.symbol}] {message}")
\ No newline at end of file
+        if self.verbose:
+            print(f"[{self.strategy_name}@{self.symbol}] {message}")
\ No newline at end of file
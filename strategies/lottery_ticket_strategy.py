@@ -2,7 +2,6 @@
 from models.strategy import Strategy
 from models.events import MarketEvent
 import random
-from datetime import datetime, timedelta
 
 class LotteryTicketStrategy(Strategy):
     """
@@ -66,7 +65,7 @@ class LotteryTicketStrategy(Strategy):
             self.log(f"订阅品种 {self.symbol} 失败。")
             return
 
-        account_info = self.gateway.get_account_info()
+        account_info = self.gateway.account_info()
         if not account_info:
             self.log("获取账户信息失败，无法开仓。")
             return
@@ -110,7 +109,7 @@ class LotteryTicketStrategy(Strategy):
                 initial_equity = float(comment_parts[1].split('=')[1])
         except (ValueError, IndexError):
             self.log(f"警告: 无法从订单 {position.ticket} 的备注中解析初始净值。")
-            account_info = self.gateway.get_account_info()
+            account_info = self.gateway.account_info()
             if account_info: initial_equity = account_info.balance
 
         if initial_equity > 0 and position.profit >= initial_equity * self.extreme_profit_multiplier:
@@ -119,8 +118,9 @@ class LotteryTicketStrategy(Strategy):
             self._close_trade(position)
             return
 
-        open_time = datetime.fromtimestamp(position.time)
-        if datetime.now() >= open_time + timedelta(minutes=self.holding_time_minutes):
+        # 用报价的服务器时间计时，实盘和回测中都与持仓的开仓时间在同一时间轴上
+        tick = self.gateway.symbol_info_tick(position.symbol)
+        if tick and tick.time - position.time >= self.holding_time_minutes * 60:
             self.log(f"持仓时间已到 ({self.holding_time_minutes}分钟)，正在平仓...")
             self._close_trade(position)
             return
@@ -147,12 +147,14 @@ class LotteryTicketStrategy(Strategy):
         self.gateway.order_send(request)
 
     def _calculate_max_volume(self):
-        account_info = self.gateway.get_account_info()
+        account_info = self.gateway.account_info()
         if not account_info: return 0.0
         
         margin_to_use = account_info.margin_free * (self.margin_usage_percent / 100.0)
         
-        margin_per_lot = self.gateway.order_calc_margin(self.ORDER_TYPE_BUY, self.symbol, 1.0)
+        tick = self.gateway.symbol_info_tick(self.symbol)
+        if not tick: return 0.0
+        margin_per_lot = self.gateway.order_calc_margin(self.ORDER_TYPE_BUY, self.symbol, 1.0, tick.ask)
         if margin_per_lot is None or margin_per_lot <= 0: return 0.0
 
         volume = margin_to_use / margin_per_lot
@@ -179,4 +181,5 @@ class LotteryTicketStrategy(Strategy):
         return None
 
     def log(self, message):
-        print(f"[{self.strategy_name}@{self.symbol}] {message}")
+        if self.verbose:
+            print(f"[{self.strategy_name}@{self.symbol}] {message}")
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from backtest_components import BarCursor
+
+
+def make_rates_frame(n: int = 5, seed: int = None) -> pd.DataFrame:
+    """
+    构造与DataManager.get_data()返回格式一致的H1 K线DataFrame（time为索引）。
+    不指定seed时收盘价每根递增0.0010，便于断言；指定seed时为随机游走。
+    """
+    index = pd.date_range('2023-01-02', periods=n, freq='h', name='time')
+    if seed is None:
+        close = 1.1000 + np.arange(n) * 0.0010
+        open_ = close - 0.0005
+    else:
+        rng = np.random.default_rng(seed)
+        close = 1.1000 + np.cumsum(rng.normal(0, 0.0010, n))
+        open_ = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({
+        'open': open_,
+        'high': np.maximum(open_, close) + 0.0005,
+        'low': np.minimum(open_, close) - 0.0005,
+        'close': close,
+        'tick_volume': np.arange(n) + 100,
+        'spread': 5,
+        'real_volume': 0,
+    }, index=index)
+
+
+def make_bars(n: int = 300, seed: int = 7) -> np.ndarray:
+    """构造一段随机游走的H1 K线，返回RatesDTO数组。"""
+    return BarCursor.from_dataframe(make_rates_frame(n, seed)).bars
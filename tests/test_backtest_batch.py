@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest_batch import MultiStrategyBacktester
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_SILENT
+from models.strategy import Strategy
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars
+
+
+class FailingStrategy(Strategy):
+    """第10根K线上抛出异常"""
+    strategy_params_config = {}
+    strategy_name = 'Failing'
+
+    def on_bar(self, event):
+        self.count = getattr(self, 'count', 0) + 1
+        if self.count == 10:
+            raise RuntimeError('boom')
+
+
+class TestMultiStrategyBacktester(unittest.TestCase):
+    """测试共享数据的多策略批量回测"""
+
+    def setUp(self):
+        self.bars = make_bars(600, seed=11)
+        self.variants = {
+            'fast': (DualMaCrossoverStrategy, {'fast_ma_period': 5, 'slow_ma_period': 20}),
+            'slow': (DualMaCrossoverStrategy, {'fast_ma_period': 10, 'slow_ma_period': 40}),
+        }
+
+    def test_matches_independent_runs(self):
+        batch = MultiStrategyBacktester(self.variants, 'EURUSD', 'H1', '2023-01-02', '2023-02-01', bars=self.bars)
+        results = batch.run()
+        self.assertEqual(list(results.index), ['fast', 'slow'])
+        for name, (strategy_class, params) in self.variants.items():
+            single = EventDrivenBacktester(strategy_class, 'EURUSD', 'H1', '2023-01-02', '2023-02-01', 10000.0,
+                                           params=params, bars=self.bars, verbosity=VERBOSITY_SILENT)
+            single.run_backtest()
+            self.assertAlmostEqual(results.loc[name, 'final_equity'], single.get_results()['final_equity'])
+            self.assertEqual(results.loc[name, 'n_trades'], single.get_results()['n_trades'])
+        self.assertIs(batch.backtesters['fast'].data_handler, batch.backtesters['slow'].data_handler)
+        curves = batch.get_equity_curves()
+        self.assertEqual(curves.shape, (600, 2))
+        self.assertFalse(np.allclose(curves['fast'], curves['slow']))
+
+    def test_failure_is_isolated(self):
+        strategies = dict(self.variants, broken=FailingStrategy)
+        results = MultiStrategyBacktester(strategies, 'EURUSD', 'H1', '2023-01-02', '2023-02-01',
+                                          bars=self.bars).run()
+        self.assertIn('boom', results.loc['broken', 'error'])
+        self.assertTrue(pd.isna(results.loc['fast', 'error']))
+        self.assertGreater(results.loc['fast', 'n_trades'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
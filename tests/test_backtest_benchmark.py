@@ -0,0 +1,55 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from backtest_benchmark import (BUNDLED_STRATEGIES, compare_results, load_results, run_benchmarks, save_results,
+                                synthetic_rates)
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_SILENT
+from fixtures import make_bars
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    """测试基准测试套件"""
+
+    def test_synthetic_rates_are_reproducible(self):
+        a, b = synthetic_rates(500, 'H1', seed=4), synthetic_rates(500, 'H1', seed=4)
+        self.assertTrue(a.equals(b))
+        self.assertTrue((a['high'] >= a[['open', 'close']].max(axis=1)).all())
+        self.assertEqual((a['time'].diff().dropna().dt.total_seconds() == 3600).sum(), 499)
+
+    def test_run_save_and_compare(self):
+        results = run_benchmarks(3000, 'M1', strategy_bars=300, repeat=1)
+        names = set(results['results'])
+        self.assertTrue({'data_load', 'bar_iteration', 'gateway.positions_get'} <= names)
+        for strategy_class in BUNDLED_STRATEGIES:
+            self.assertIn(f'strategy.{strategy_class.__name__}', names)
+        self.assertEqual(results['results']['data_load']['bars'], 3000)
+
+        path = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        save_results(results, path)
+        comparison = compare_results(load_results(path), results)
+        self.assertTrue((comparison['speedup'] == 1.0).all())
+        self.assertFalse(comparison['regression'].any())
+        with open(path, encoding='utf-8') as f:
+            self.assertIn('meta', json.load(f))
+
+
+class TestBundledStrategies(unittest.TestCase):
+    """内置策略都能在回测网关上完整运行并产生交易"""
+
+    def test_every_bundled_strategy_trades(self):
+        for strategy_class in BUNDLED_STRATEGIES:
+            with self.subTest(strategy=strategy_class.__name__):
+                random.seed(0)
+                backtester = EventDrivenBacktester(strategy_class, 'EURUSD', 'H1', '', '', 10000.0,
+                                                   bars=make_bars(500), verbosity=VERBOSITY_SILENT)
+                backtester.run_backtest()
+                opened = len(backtester.portfolio.trade_history) + len(backtester.portfolio.positions)
+                self.assertGreater(opened, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_SILENT
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars
+
+
+class TestCheckpointResume(unittest.TestCase):
+    """测试回测检查点的保存与续跑"""
+
+    def setUp(self):
+        self.bars = make_bars(1200, seed=3)
+        self.path = os.path.join(tempfile.mkdtemp(), 'dual_ma.ckpt')
+
+    def _backtester(self, bars):
+        return EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-02', '2023-03-01', 10000.0,
+                                     params={'fast_ma_period': 5, 'slow_ma_period': 20}, bars=bars,
+                                     verbosity=VERBOSITY_SILENT)
+
+    def test_resume_matches_full_run(self):
+        full = self._backtester(self.bars)
+        full.run_backtest()
+
+        first = self._backtester(self.bars[:700])
+        first.run_backtest(checkpoint=self.path)
+        # 之后数据追加了500根K线，续跑只处理新增部分
+        resumed = self._backtester(self.bars)
+        resumed.run_backtest(resume_from=self.path)
+
+        self.assertGreater(len(full.get_trades()), 0)
+        pd.testing.assert_frame_equal(resumed.get_trades(), full.get_trades())
+        np.testing.assert_allclose(resumed.get_equity_curve()['equity'], full.get_equity_curve()['equity'])
+        self.assertEqual(resumed.get_results(), full.get_results())
+
+    def test_rejects_mismatched_config(self):
+        self._backtester(self.bars[:300]).run_backtest(checkpoint=self.path)
+        other = EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-02', '2023-03-01', 5000.0,
+                                      bars=self.bars, verbosity=VERBOSITY_SILENT)
+        with self.assertRaises(ValueError):
+            other.run_backtest(resume_from=self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
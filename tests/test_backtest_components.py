@@ -1,11 +1,113 @@
 import unittest
 from unittest.mock import Mock, MagicMock
 from queue import Queue
+import numpy as np
 import pandas as pd
 
 # 导入需要测试的组件和事件
-from backtest_components import Portfolio, SimulatedExecutionHandler
+from backtest_components import BarCursor, DuckDBDataHandler, Portfolio, SimulatedExecutionHandler
 from events import SignalEvent, OrderEvent, FillEvent, MarketEvent
+from fixtures import make_rates_frame
+
+
+class TestBarCursor(unittest.TestCase):
+    """测试 BarCursor 列式游标"""
+
+    def test_from_dataframe_converts_time_to_epoch_seconds(self):
+        """测试：DataFrame的时间索引应被转换为MT5格式的Unix秒"""
+        cursor = BarCursor.from_dataframe(make_rates_frame(3))
+        self.assertEqual(cursor.length, 3)
+        self.assertEqual(int(cursor.bars['time'][0]), int(pd.Timestamp('2023-01-02').timestamp()))
+        self.assertEqual(int(cursor.bars['time'][1] - cursor.bars['time'][0]), 3600)
+
+    def test_advance_walks_bars_and_stops_at_end(self):
+        """测试：游标逐根前移，数据结束时返回False且位置不再变化"""
+        cursor = BarCursor.from_dataframe(make_rates_frame(2))
+        self.assertIsNone(cursor.current, "游标开始前不应有当前K线")
+
+        self.assertTrue(cursor.advance())
+        self.assertAlmostEqual(cursor.current['close'], 1.1000)
+        self.assertTrue(cursor.advance())
+        self.assertAlmostEqual(cursor.current['close'], 1.1010)
+        self.assertEqual(int(cursor.current['tick_volume']), 101)
+
+        self.assertFalse(cursor.advance())
+        self.assertEqual(cursor.position, 1)
+
+    def test_window_follows_copy_rates_from_pos_semantics(self):
+        """测试：window()以当前K线为0号位置，只返回游标之前（含）的数据"""
+        cursor = BarCursor.from_dataframe(make_rates_frame(5))
+        for _ in range(3):
+            cursor.advance()  # 当前K线为第3根 (索引2)
+
+        rates = cursor.window(0, 2)
+        np.testing.assert_allclose(rates['close'], [1.1010, 1.1020])
+
+        rates = cursor.window(1, 10)
+        np.testing.assert_allclose(rates['close'], [1.1000, 1.1010], err_msg="数量不足时只返回可用的K线，且不能包含未来数据")
+
+        self.assertIsNone(cursor.window(3, 1), "起始位置超出历史范围时应返回None")
+        self.assertIsNone(cursor.window(0, 0))
+
+    def test_window_is_read_only_view(self):
+        """测试：window()返回的是共享内存的只读视图"""
+        cursor = BarCursor.from_dataframe(make_rates_frame(5))
+        cursor.advance()
+        rates = cursor.window(0, 1)
+        self.assertTrue(np.shares_memory(rates, cursor.bars), "不应复制数据")
+        with self.assertRaises(ValueError):
+            rates['close'][0] = 0.0
+
+
+class TestDuckDBDataHandler(unittest.TestCase):
+    """测试多品种数据处理器的堆合并"""
+
+    def setUp(self):
+        self.events_queue = Queue()
+        eurusd = BarCursor.from_dataframe(make_rates_frame(4)).bars
+        # GBPUSD每两小时一根K线，且比EURUSD晚一小时开始
+        gbpusd_frame = make_rates_frame(2)
+        gbpusd_frame.index = pd.DatetimeIndex(['2023-01-02 01:00', '2023-01-02 03:00'], name='time')
+        gbpusd = BarCursor.from_dataframe(gbpusd_frame).bars
+        self.handler = DuckDBDataHandler(self.events_queue, ['EURUSD', 'GBPUSD'], 'H1', '2023-01-01', '2023-01-31',
+                                         bars={'EURUSD': eurusd, 'GBPUSD': gbpusd})
+
+    def test_market_events_are_in_global_time_order(self):
+        """测试：MarketEvent按时间顺序发出，时间相同时按品种顺序"""
+        emitted = []
+        while self.handler.update_bars():
+            event = self.events_queue.get()
+            emitted.append((event.time, event.symbol))
+
+        self.assertEqual(len(emitted), 6)
+        self.assertEqual(emitted, sorted(emitted, key=lambda e: (e[0], ['EURUSD', 'GBPUSD'].index(e[1]))))
+        self.assertEqual([symbol for _, symbol in emitted], ['EURUSD', 'EURUSD', 'GBPUSD', 'EURUSD', 'EURUSD', 'GBPUSD'])
+        self.assertFalse(self.handler.continue_backtest)
+
+    def test_latest_bar_of_other_symbol_is_never_ahead(self):
+        """测试：处理某个品种的事件时，其他品种的最新K线时间不晚于当前事件"""
+        self.assertIsNone(self.handler.get_latest_bar('GBPUSD'))
+        while self.handler.update_bars():
+            event = self.events_queue.get()
+            for symbol in ('EURUSD', 'GBPUSD'):
+                bar = self.handler.get_latest_bar(symbol)
+                if bar is not None:
+                    self.assertLessEqual(int(bar['time']), event.time)
+        self.assertIsNone(self.handler.get_latest_bar('USDJPY'))
+
+    def test_warmup_bars_are_history_only(self):
+        """测试：预热K线不产生市场事件，但可以通过 copy_rates_from_pos 回看"""
+        handler = DuckDBDataHandler(self.events_queue, ['EURUSD', 'GBPUSD'], 'H1', '2023-01-01', '2023-01-31',
+                                    bars={'EURUSD': self.handler.cursors['EURUSD'].bars,
+                                          'GBPUSD': self.handler.cursors['GBPUSD'].bars}, warmup_bars=2)
+        self.assertEqual(len(handler.get_rates_from_pos('EURUSD', 0, 10)), 2)
+        self.assertEqual(len(handler.get_rates_from_pos('GBPUSD', 0, 10)), 1, "预热结束前的其他品种K线同样只是历史")
+        emitted = []
+        while handler.update_bars():
+            event = self.events_queue.get()
+            emitted.append(event.symbol)
+        self.assertEqual(emitted, ['EURUSD', 'EURUSD', 'GBPUSD'])
+
 
 class TestPortfolio(unittest.TestCase):
     """测试 Portfolio 组件"""
@@ -37,9 +139,9 @@ class TestPortfolio(unittest.TestCase):
 
         # 检查现金和持仓状态
         self.assertEqual(self.portfolio.cash, self.initial_cash - 1.0, "现金应扣除手续费")
-        self.assertIn('EURUSD', self.portfolio.positions, "应创建EURUSD的持仓")
+        self.assertEqual(self.portfolio.positions.tickets('EURUSD'), [1], "应创建EURUSD的持仓")
         
-        position = self.portfolio.positions['EURUSD']
+        position = self.portfolio.positions.get(1)
         self.assertEqual(position['volume'], 0.1)
         self.assertEqual(position['price_open'], 1.1000)
         self.assertEqual(position['type'], 0, "持仓类型应为买入(0)")
@@ -66,6 +168,26 @@ class TestPortfolio(unittest.TestCase):
         self.assertAlmostEqual(self.portfolio.equity, expected_equity, places=2, msg="净值应反映浮动盈亏")
 
 
+    def test_hedged_positions_close_by_ticket(self):
+        """测试：同一品种可同时持有多空仓位，指定ticket的成交只平掉该持仓"""
+        self.mock_data_handler.get_latest_bar.return_value = {'time': 100, 'close': 1.1000}
+        self.portfolio.on_fill(FillEvent(symbol='EURUSD', direction='BUY', quantity=0.1, fill_price=1.1000, magic=7))
+        self.portfolio.on_fill(FillEvent(symbol='EURUSD', direction='SELL', quantity=0.2, fill_price=1.1000))
+        self.portfolio.on_fill(FillEvent(symbol='EURUSD', direction='BUY', quantity=0.3, fill_price=1.1000, magic=7))
+        self.assertEqual(len(self.portfolio.get_positions_info('EURUSD')), 3)
+        self.assertEqual([p['ticket'] for p in self.portfolio.get_positions_info(magic=7)], [1, 3])
+
+        self.mock_data_handler.get_latest_bar.return_value = {'time': 200, 'close': 1.1010}
+        self.portfolio.on_fill(FillEvent(symbol='EURUSD', direction='BUY', quantity=0.2, fill_price=1.1010, position=2))
+        self.assertEqual(self.portfolio.positions.tickets('EURUSD'), [1, 3])
+        self.assertAlmostEqual(self.portfolio.trade_history[-1]['profit'], -20.0)
+
+        # 两张多单一起盯市：(1.1020 - 1.1000) * 0.4 * 100000 = 80
+        self.mock_data_handler.get_latest_bar.return_value = {'time': 300, 'close': 1.1020}
+        self.portfolio.on_bar(MarketEvent(symbol='EURUSD', time=300))
+        self.assertAlmostEqual(self.portfolio.equity, self.initial_cash - 20.0 + 80.0)
+
+
 class TestSimulatedExecutionHandler(unittest.TestCase):
     """测试 SimulatedExecutionHandler 组件"""
 
@@ -77,7 +199,7 @@ class TestSimulatedExecutionHandler(unittest.TestCase):
     def test_execute_mkt_buy_order(self):
         """测试：执行一个市价买单"""
         # 模拟下一根K线的数据
-        next_bar = pd.Series({'open': 1.2000, 'close': 1.2050})
+        next_bar = pd.Series({'open': 1.2000, 'close': 1.2050, 'spread': 3})
         self.mock_data_handler.get_latest_bar.return_value = next_bar
 
         # 创建一个订单事件
@@ -89,9 +211,9 @@ class TestSimulatedExecutionHandler(unittest.TestCase):
         event = self.events_queue.get()
         self.assertIsInstance(event, FillEvent, "事件应为FillEvent类型")
 
-        # 检查成交价格是否正确（开盘价 + 滑点）
-        # 假设 point = 0.00001, slippage = 2 * 0.00001 = 0.00002
-        expected_price = 1.2000 + 0.00002
+        # 检查成交价格是否正确（买入按ask：开盘价 + 点差 + 滑点）
+        # GBPUSD 的 point = 0.00001, spread = 3 * 0.00001, slippage = 2 * 0.00001 = 0.00002
+        expected_price = 1.2000 + 0.00003 + 0.00002
         self.assertAlmostEqual(event.fill_price, expected_price, places=5)
         self.assertEqual(event.commission, 1.5, "手续费应正确")
         self.assertEqual(event.direction, 'BUY')
@@ -0,0 +1,77 @@
+import unittest
+
+from backtest_dispatcher import EventDispatcher, ThreadSafeEventDispatcher
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_SILENT
+from events import MarketEvent, SignalEvent, OrderEvent
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars
+
+
+class TestEventDispatcher(unittest.TestCase):
+    """测试单线程事件分发器"""
+
+    dispatcher_class = EventDispatcher
+
+    def setUp(self):
+        self.dispatcher = self.dispatcher_class()
+        self.handled = []
+
+    def test_dispatches_by_event_type(self):
+        """测试：事件按类型分发给注册的处理函数，未注册的类型被忽略"""
+        self.dispatcher.register(MarketEvent, lambda e: self.handled.append(('market', e.symbol)))
+        self.dispatcher.register(SignalEvent, lambda e: self.handled.append(('signal', e.direction)))
+
+        self.dispatcher.put(MarketEvent(symbol='EURUSD'))
+        self.dispatcher.put(SignalEvent(symbol='EURUSD', direction='BUY'))
+        self.dispatcher.put(OrderEvent(symbol='EURUSD', order_type='MKT', direction='BUY', quantity=0.1))
+        self.dispatcher.drain()
+
+        self.assertEqual(self.handled, [('market', 'EURUSD'), ('signal', 'BUY')])
+        self.assertTrue(self.dispatcher.empty())
+
+    def test_drain_processes_events_put_by_handlers(self):
+        """测试：处理函数产生的新事件在同一次drain中按先进先出顺序处理完"""
+        def on_signal(event):
+            self.handled.append('signal')
+            self.dispatcher.put(OrderEvent(symbol=event.symbol, order_type='MKT', direction=event.direction, quantity=0.1))
+
+        self.dispatcher.register(SignalEvent, on_signal)
+        self.dispatcher.register(OrderEvent, lambda e: self.handled.append('order'))
+        self.dispatcher.put(SignalEvent(symbol='EURUSD', direction='SELL'))
+        self.dispatcher.put(SignalEvent(symbol='EURUSD', direction='BUY'))
+        self.dispatcher.drain()
+
+        self.assertEqual(self.handled, ['signal', 'signal', 'order', 'order'])
+        self.assertTrue(self.dispatcher.empty())
+
+
+class TestThreadSafeEventDispatcher(TestEventDispatcher):
+    """线程安全分发器应与默认分发器行为一致"""
+
+    dispatcher_class = ThreadSafeEventDispatcher
+
+
+class TestBacktesterDispatcherSelection(unittest.TestCase):
+
+    def test_both_dispatchers_produce_identical_results(self):
+        bars = make_bars(800, seed=11)
+        results = []
+        for dispatcher in ('deque', 'queue'):
+            engine = EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-12-31',
+                                           10000.0, params={'fast_ma_period': 5}, bars=bars, dispatcher=dispatcher,
+                                           verbosity=VERBOSITY_SILENT)
+            engine.run_backtest()
+            results.append((engine.get_results(), engine.portfolio.trade_history))
+
+        self.assertEqual(results[0], results[1])
+        self.assertTrue(results[0][1], "测试数据应产生交易")
+
+    def test_unknown_dispatcher_is_rejected(self):
+        with self.assertRaises(ValueError):
+            EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-12-31', 10000.0,
+                                  bars=make_bars(10), dispatcher='redis', verbosity=VERBOSITY_SILENT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from backtest_benchmark import synthetic_rates
+from backtest_engine import EventDrivenBacktester
+from backtest_intrabar import OHLCPathModel, RandomWalkPathModel, SubBarReplayModel
+from backtest_ledger import INTRABAR_TP_FIRST
+from backtest_recorder import VERBOSITY_SILENT
+from data_manager import DataManager
+from duckdb_pool import DuckDBConnectionPool
+from models.strategy import Strategy
+from mt5_types import RatesDTO
+from fixtures import make_bars
+
+
+def make_ohlc(rows, start=0, step=3600):
+    bars = np.zeros(len(rows), dtype=RatesDTO)
+    bars['time'] = start + np.arange(len(rows)) * step
+    for name, values in zip(('open', 'high', 'low', 'close'), np.array(rows).T):
+        bars[name] = values
+    return bars
+
+
+class BracketStrategy(Strategy):
+    """在第一根K线上开一张带止损止盈的多单"""
+    strategy_params_config = {}
+    strategy_name = 'Bracket'
+
+    def on_bar(self, event):
+        if self.gateway.positions_get(symbol=self.symbol) or getattr(self, 'sent', False):
+            return
+        self.sent = True
+        self.gateway.order_send({'action': 1, 'symbol': self.symbol, 'volume': 0.1, 'type': 0,
+                                 'sl': 1.0950, 'tp': 1.1050})
+
+
+class TestIntrabarModels(unittest.TestCase):
+    """测试K线内价格路径模型"""
+
+    def test_ohlc_order(self):
+        bars = make_ohlc([[1.0, 1.2, 0.9, 1.1], [1.1, 1.2, 0.9, 1.0]])
+        model = OHLCPathModel()
+        np.testing.assert_allclose(model.path('X', bars, 0), [1.0, 0.9, 1.2, 1.1])  # 阳线先到最低价
+        np.testing.assert_allclose(model.path('X', bars, 1), [1.1, 1.2, 0.9, 1.0])  # 阴线先到最高价
+
+    def test_random_walk_hits_every_anchor(self):
+        bars = make_bars(300)
+        model = RandomWalkPathModel(steps=12, seed=1, chunk_size=64)
+        for i in (0, 63, 64, 299):
+            path = model.path('EURUSD', bars, i)
+            self.assertEqual(len(path), 13)
+            self.assertEqual(path[0], bars['open'][i])
+            self.assertEqual(path[-1], bars['close'][i])
+            self.assertEqual(path.max(), bars['high'][i])
+            self.assertEqual(path.min(), bars['low'][i])
+        again = RandomWalkPathModel(steps=12, seed=1, chunk_size=64).path('EURUSD', bars, 70)
+        np.testing.assert_array_equal(model.path('EURUSD', bars, 70), again, "相同种子应产生相同路径")
+
+    def test_sub_bar_replay(self):
+        bars = make_ohlc([[1.0, 1.2, 0.9, 1.1], [1.1, 1.3, 1.0, 1.2]], step=120)
+        subs = make_ohlc([[1.0, 1.2, 1.0, 1.15], [1.15, 1.15, 0.9, 1.1]], step=60)  # 只覆盖第一根K线
+        model = SubBarReplayModel({'X': subs})
+        np.testing.assert_allclose(model.path('X', bars, 0), [1.0, 1.0, 1.2, 1.15, 1.15, 1.15, 0.9, 1.1])
+        np.testing.assert_allclose(model.path('X', bars, 1), [1.1, 1.0, 1.3, 1.2], err_msg="没有小K线时退化为自身OHLC")
+
+    def test_sub_bar_replay_loads_one_window_per_chunk(self):
+        """测试：按块从DuckDB读取小K线，结果与一次性提供全部小K线相同"""
+        pool = DuckDBConnectionPool()
+        self.addCleanup(pool.close)
+        manager = DataManager(os.path.join(tempfile.mkdtemp(), 'subbars.duckdb'), pool=pool)
+        with manager._get_connection() as conn:
+            manager._create_rates_table(conn, 'EURUSD_M1')
+            conn.register('frame', synthetic_rates(3000, 'M1', seed=3, start='2023-01-04'))
+            conn.execute("INSERT INTO EURUSD_M1 SELECT * FROM frame")
+            conn.unregister('frame')
+        manager.derive_timeframe('EURUSD', 'H1')
+        load = lambda tf: np.concatenate(list(manager.iter_data('EURUSD', tf, '2023-01-01', '2023-02-01')))
+        bars, subs = load('H1'), load('M1')
+
+        streamed = SubBarReplayModel.from_data_manager('M1', manager, chunk_size=8)
+        windows = []
+        loader = streamed.loader
+        streamed.loader = lambda *args: windows.append(loader(*args)) or windows[-1]
+        in_memory = SubBarReplayModel({'EURUSD': subs}, chunk_size=8)
+        for i in range(len(bars)):
+            np.testing.assert_array_equal(streamed.path('EURUSD', bars, i), in_memory.path('EURUSD', bars, i))
+        self.assertEqual(len(windows), -(-len(bars) // 8))
+        self.assertLessEqual(max(len(w) for w in windows), 8 * 60, "每次只加载一块K线对应的小K线")
+
+
+class TestIntrabarEngine(unittest.TestCase):
+    """测试回测引擎沿K线内路径判定止损止盈的先后"""
+
+    def run_engine(self, third_bar, **kwargs):
+        bars = make_ohlc([[1.1, 1.1, 1.1, 1.1], [1.1, 1.1, 1.1, 1.1], third_bar])
+        engine = EventDrivenBacktester(BracketStrategy, 'EURUSD', 'H1', 'a', 'b', 10000.0, bars=bars,
+                                       verbosity=VERBOSITY_SILENT, **kwargs)
+        engine.run_backtest()
+        return engine.portfolio.trade_history[0]['price_close']
+
+    def test_path_decides_which_level_fills(self):
+        bearish = [1.1, 1.1060, 1.0940, 1.0960]  # 阴线：先到最高价，止盈先成交
+        self.assertAlmostEqual(self.run_engine(bearish), 1.0950 - 0.00002, msg="默认规则总是先止损")
+        self.assertAlmostEqual(self.run_engine(bearish, intrabar=OHLCPathModel()), 1.1050)
+        bullish = [1.1, 1.1060, 1.0940, 1.1040]  # 阳线：先到最低价，止损先成交
+        self.assertAlmostEqual(self.run_engine(bullish, intrabar=OHLCPathModel(), intrabar_rule=INTRABAR_TP_FIRST),
+                               1.0950 - 0.00002)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from backtest_ledger import PositionLedger, INTRABAR_TP_FIRST, INTRABAR_NEAREST
+
+
+class TestPositionLedger(unittest.TestCase):
+    """测试按ticket索引的持仓账本"""
+
+    def setUp(self):
+        self.ledger = PositionLedger(capacity=2)
+
+    def test_indexes_follow_open_and_close(self):
+        self.ledger.open(1, 'EURUSD', 0, 0.1, 1.1000, 0, magic=5)
+        self.ledger.open(2, 'GBPUSD', 1, 0.1, 1.3000, 0, magic=5)
+        self.ledger.open(3, 'EURUSD', 1, 0.2, 1.1010, 0, magic=9)  # 超出初始容量，自动扩容
+        self.assertEqual(self.ledger.tickets('EURUSD'), [1, 3])
+        self.assertEqual(self.ledger.tickets(magic=5), [1, 2])
+        self.assertEqual(self.ledger.tickets('EURUSD', 9), [3])
+
+        closed = self.ledger.close(1)
+        self.assertEqual(closed['volume'], 0.1)
+        self.assertNotIn(1, self.ledger)
+        self.assertEqual(self.ledger.tickets('EURUSD'), [3])
+        self.assertEqual(self.ledger.tickets(magic=5), [2])
+
+        # 平仓后的槽位被新持仓复用
+        self.ledger.open(4, 'EURUSD', 0, 0.1, 1.1000, 0)
+        self.assertEqual(len(self.ledger.ticket), 4)
+        self.assertEqual(self.ledger.get(4)['symbol'], 'EURUSD')
+
+    def test_mark_to_market_only_touches_symbol(self):
+        self.ledger.open(1, 'EURUSD', 0, 0.1, 1.1000, 0)
+        self.ledger.open(2, 'EURUSD', 1, 0.1, 1.1000, 0)
+        self.ledger.open(3, 'GBPUSD', 0, 1.0, 1.3000, 0)
+        self.ledger.mark_to_market('EURUSD', 1.1050)
+        self.assertAlmostEqual(self.ledger.get(1)['profit'], 50.0)
+        self.assertAlmostEqual(self.ledger.get(2)['profit'], -50.0)
+        self.assertEqual(self.ledger.get(3)['profit'], 0.0)
+        self.assertAlmostEqual(self.ledger.total_profit(), 0.0)
+
+        self.ledger.reduce(1, 0.05)
+        self.assertAlmostEqual(self.ledger.get(1)['profit'], 25.0)
+        self.ledger.close(3)
+        self.assertAlmostEqual(self.ledger.exposure(), 0.15 * 100000 * 1.1050)
+
+    def test_hit_stops(self):
+        """测试：止损止盈的向量化判定、跳空成交价和K线内先后规则"""
+        self.ledger.open(1, 'EURUSD', 0, 0.1, 1.1000, 0, sl=1.0950, tp=1.1100)  # 多单，两者都被触及
+        self.ledger.open(2, 'EURUSD', 1, 0.1, 1.1000, 0, sl=1.1030, tp=1.0900)  # 空单，开盘跳空越过止损
+        self.ledger.open(3, 'EURUSD', 0, 0.1, 1.1000, 0)                        # 未设置止损止盈
+        self.ledger.open(4, 'EURUSD', 1, 0.1, 1.1000, 0, sl=1.1200, tp=1.0960)  # 空单，只触及止盈
+
+        bar = dict(open_=1.1040, high=1.1120, low=1.0940)
+        tickets, prices, is_sl = self.ledger.hit_stops('EURUSD', **bar)
+        np.testing.assert_array_equal(tickets, [1, 2, 4])
+        np.testing.assert_allclose(prices, [1.0950, 1.1040, 1.0960])
+        np.testing.assert_array_equal(is_sl, [True, True, False])
+
+        _, prices, is_sl = self.ledger.hit_stops('EURUSD', **bar, rule=INTRABAR_TP_FIRST)
+        np.testing.assert_allclose(prices, [1.1100, 1.1040, 1.0960])
+        np.testing.assert_array_equal(is_sl, [False, True, False])
+
+        # 开盘价1.1040离止盈1.1100更近
+        _, _, is_sl = self.ledger.hit_stops('EURUSD', **bar, rule=INTRABAR_NEAREST)
+        np.testing.assert_array_equal(is_sl, [False, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest_components import BarCursor
+from backtest_engine import EventDrivenBacktester
+from backtest_metrics import compute_metrics, max_drawdown, trade_excursions
+from backtest_recorder import VERBOSITY_SILENT
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars, make_rates_frame
+
+
+class TestBacktestMetrics(unittest.TestCase):
+    """测试绩效指标计算"""
+
+    def test_max_drawdown_and_duration(self):
+        equity = np.array([100.0, 110.0, 99.0, 105.0, 110.0, 120.0, 108.0])
+        pct, duration = max_drawdown(equity)
+        self.assertAlmostEqual(pct, 10.0)
+        self.assertEqual(duration, 2, "110之后有两根K线处于回撤中，第三根恢复到110")
+
+    def test_trade_statistics(self):
+        trades = pd.DataFrame({'profit': [30.0, -10.0, 20.0, -20.0]})
+        metrics = compute_metrics(np.linspace(100, 120, 10), trades)
+        self.assertEqual(metrics['n_trades'], 4)
+        self.assertAlmostEqual(metrics['win_rate'], 50.0)
+        self.assertAlmostEqual(metrics['profit_factor'], 50.0 / 30.0)
+        self.assertEqual(metrics['max_drawdown'], 0.0)
+        self.assertGreater(metrics['sharpe'], 0)
+
+    def test_trade_excursions(self):
+        """测试：MAE/MFE只统计持仓区间内的K线"""
+        bars = BarCursor.from_dataframe(make_rates_frame(5)).bars  # 收盘价每根递增0.0010
+        times = bars['time']
+        trades = pd.DataFrame({
+            'type': [0, 1], 'volume': [1.0, 1.0], 'price_open': [1.1010, 1.1010],
+            'time_open': [times[1], times[1]], 'time_close': [times[3], times[3]],
+        })
+        mae, mfe = trade_excursions(trades, bars)
+        # 区间[1, 3]: 最低价 low[1]=1.1000，最高价 high[3]=1.1035
+        np.testing.assert_allclose(mae, [-100.0, -250.0], atol=1e-6)
+        np.testing.assert_allclose(mfe, [250.0, 100.0], atol=1e-6)
+
+    def test_engine_records_equity_history(self):
+        bars = make_bars(500)
+        engine = EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-12-31', 10000.0,
+                                       params={'fast_ma_period': 5, 'slow_ma_period': 20}, bars=bars,
+                                       verbosity=VERBOSITY_SILENT)
+        engine.run_backtest()
+        curve = engine.get_equity_curve()
+        self.assertEqual(len(curve), len(bars))
+        self.assertAlmostEqual(curve['equity'].iloc[-1], engine.get_results()['final_equity'])
+        trades = engine.get_trades()
+        self.assertTrue((trades['mae'] <= 0).all() and (trades['mfe'] >= 0).all())
+        self.assertIn('sharpe', engine.get_results())
+
+    def test_engine_excursions_use_symbol_contract_size(self):
+        """测试：非外汇品种的MAE/MFE按该品种的合约大小计算，与已实现盈亏同一量纲"""
+        bars = make_bars(500)
+        engine = EventDrivenBacktester(DualMaCrossoverStrategy, 'XAUUSD', 'H1', '2023-01-01', '2023-12-31', 10000.0,
+                                       params={'fast_ma_period': 5, 'slow_ma_period': 20}, bars=bars,
+                                       symbol_specs={}, verbosity=VERBOSITY_SILENT)
+        engine.run_backtest()
+        trades = engine.get_trades()
+        self.assertGreater(len(trades), 0)
+        self.assertTrue((trades['contract_size'] == 100).all())
+        mae, mfe = trade_excursions(trades.drop(columns='contract_size'), bars, contract_size=100)
+        np.testing.assert_allclose(trades['mae'], mae)
+        np.testing.assert_allclose(trades['mfe'], mfe)
+
+
+    def test_multi_symbol_metrics_match_single_symbol(self):
+        """测试：加载但不交易的其他品种不改变净值曲线和指标，每个时间点只记录一行"""
+        bars = make_bars(500)
+        params = {'fast_ma_period': 5, 'slow_ma_period': 20}
+
+        def run(**kwargs):
+            engine = EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-12-31',
+                                           10000.0, params=params, symbol_specs={}, verbosity=VERBOSITY_SILENT,
+                                           **kwargs)
+            engine.run_backtest()
+            return engine
+
+        single = run(bars=bars)
+        multi = run(bars={'EURUSD': bars, 'GBPUSD': make_bars(500, seed=8)}, extra_symbols=['GBPUSD'])
+        self.assertEqual(len(multi.portfolio.equity_history), len(bars), "按合并后的时间线预分配")
+        curve = multi.get_equity_curve()
+        self.assertTrue(curve.index.is_unique)
+        pd.testing.assert_frame_equal(curve, single.get_equity_curve())
+        self.assertEqual(multi.get_results(), single.get_results())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import EventDrivenBacktester
+from backtest_montecarlo import SHUFFLE, monte_carlo_backtest, monte_carlo_trades, summarize_monte_carlo
+from backtest_recorder import VERBOSITY_SILENT
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars
+
+
+class TestMonteCarlo(unittest.TestCase):
+    """测试交易重抽样的蒙特卡洛模拟"""
+
+    def setUp(self):
+        self.trades = pd.DataFrame({'profit': [100.0, -50.0, 200.0, -150.0, 80.0], 'volume': 0.1})
+
+    def test_shuffle_keeps_terminal_equity(self):
+        paths = monte_carlo_trades(self.trades, 1000.0, n_paths=500, method=SHUFFLE, seed=1, max_batch_elements=100)
+        np.testing.assert_allclose(paths['terminal_equity'], 1180.0)
+        # 最坏的顺序是两笔亏损连在一起：1000 -> 800，回撤20%
+        self.assertAlmostEqual(paths['max_drawdown'].max(), 200 / 1000 * 100, places=6)
+
+    def test_seed_is_reproducible_across_batches(self):
+        a = monte_carlo_trades(self.trades, 1000.0, n_paths=300, seed=3)
+        b = monte_carlo_trades(self.trades, 1000.0, n_paths=300, seed=3)
+        pd.testing.assert_frame_equal(a, b)
+
+    def test_ruin_probability_for_known_case(self):
+        # 一赢一输各半，初始资金只够亏一笔：第一笔亏损即爆仓，概率为50%
+        trades = pd.DataFrame({'profit': [1000.0, -1000.0]})
+        paths = monte_carlo_trades(trades, 1000.0, n_paths=20000, n_trades=1, ruin_fraction=0.0, seed=0)
+        summary = summarize_monte_carlo(paths, 1000.0)
+        self.assertAlmostEqual(summary['ruin_probability'], 50.0, delta=2.0)
+        self.assertEqual(summary['n_paths'], 20000)
+
+    def test_cost_perturbation_only_lowers_profit(self):
+        base = monte_carlo_trades(self.trades, 1000.0, n_paths=200, method=SHUFFLE, seed=5)
+        costly = monte_carlo_trades(self.trades, 1000.0, n_paths=200, method=SHUFFLE, seed=5,
+                                    slippage_points=5, spread_points=3)
+        self.assertTrue((costly['terminal_equity'] < base['terminal_equity']).all())
+        # 最多 (2*5+3) 点 * 0.1手 * 100000 * 0.00001 * 5笔
+        self.assertTrue((base['terminal_equity'] - costly['terminal_equity'] <= 13 * 1.0 * 5 + 1e-9).all())
+
+
+    def test_resamples_net_profit(self):
+        """测试：重抽样的是扣除手续费和隔夜利息后的净盈亏"""
+        trades = self.trades.assign(commission=-2.0, swap=[0.0, -1.0, 0.0, -3.0, 0.0])
+        paths = monte_carlo_trades(trades, 1000.0, n_paths=50, method=SHUFFLE, seed=1)
+        np.testing.assert_allclose(paths['terminal_equity'], 1180.0 - 10.0 - 4.0)
+
+    def test_backtest_paths_match_engine_balance(self):
+        """测试：不打乱盈亏时，模拟的期末净值与回测引擎的余额一致（尚未平仓的持仓只扣了开仓手续费）"""
+        engine = EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-12-31', 10000.0,
+                                       params={'fast_ma_period': 5, 'slow_ma_period': 20}, bars=make_bars(1000),
+                                       symbol_specs={}, verbosity=VERBOSITY_SILENT)
+        engine.run_backtest()
+        trades = engine.get_trades()
+        self.assertTrue((trades['commission'] < 0).all())
+        paths = monte_carlo_backtest(engine, n_paths=20, method=SHUFFLE, seed=0)
+        positions = engine.portfolio.positions
+        open_commission = sum(positions.get(ticket)['commission'] for ticket in positions)
+        np.testing.assert_allclose(paths['terminal_equity'], engine.portfolio.cash + open_commission)
+
+
+if __name__ == '__main__':
+    unittest.main()
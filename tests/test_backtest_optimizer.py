@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+import backtest_components
+import backtest_engine
+import backtest_optimizer
+from backtest_benchmark import write_synthetic_data
+from backtest_engine import EventDrivenBacktester
+from backtest_optimizer import ParameterOptimizer, grid_search_space, random_search_space
+from backtest_recorder import VERBOSITY_SILENT
+from data_manager import SYMBOL_SPECS_TABLE, DataManager
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars
+
+
+class TestSearchSpace(unittest.TestCase):
+    """测试参数空间生成"""
+
+    def test_grid_search_space_is_cartesian_product(self):
+        space = grid_search_space({'fast_ma_period': [5, 10], 'slow_ma_period': range(20, 50, 10)})
+        self.assertEqual(len(space), 6)
+        self.assertIn({'fast_ma_period': 10, 'slow_ma_period': 40}, space)
+
+    def test_random_search_space_respects_types_and_seed(self):
+        ranges = {'step_pips': (10, 50), 'lot_multiplier': (1.2, 3.0), 'max_levels': [5, 7]}
+        config = {'step_pips': {'type': 'int'}, 'lot_multiplier': {'type': 'float'}}
+        first = random_search_space(ranges, 20, config, seed=42)
+        second = random_search_space(ranges, 20, config, seed=42)
+
+        self.assertEqual(first, second, "相同种子应生成相同的参数组合")
+        for params in first:
+            self.assertIsInstance(params['step_pips'], int)
+            self.assertTrue(10 <= params['step_pips'] <= 50)
+            self.assertTrue(1.2 <= params['lot_multiplier'] <= 3.0)
+            self.assertIn(params['max_levels'], (5, 7))
+
+
+class TestParameterOptimizer(unittest.TestCase):
+    """测试并行参数优化器"""
+
+    def test_grid_returns_ranked_results(self):
+        """测试：每个参数组合都在工作进程中运行，并按总收益率排序"""
+        optimizer = ParameterOptimizer(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-02-01',
+                                       max_workers=2, bars=make_bars())
+        results = optimizer.grid(
+            {'fast_ma_period': [5, 10], 'slow_ma_period': [20, 30]},
+            constraint=lambda p: p['fast_ma_period'] < p['slow_ma_period'],
+        )
+
+        self.assertEqual(len(results), 4)
+        self.assertTrue(results['error'].isna().all(), results['error'].tolist())
+        self.assertTrue(results['total_return'].is_monotonic_decreasing)
+        self.assertEqual(results.index[0], 1)
+
+
+    def test_uses_synced_symbol_specs(self):
+        """测试：从DuckDB加载数据时，优化器与直接回测使用同样的已同步品种规格"""
+        path = os.path.join(tempfile.mkdtemp(), 'specs.duckdb')
+        write_synthetic_data(path, 'EURUSD', 'H1', 600, seed=3)
+        manager = DataManager(path)
+        with manager._get_connection() as conn:
+            conn.execute(f"UPDATE {SYMBOL_SPECS_TABLE} SET contract_size = 1000")
+        params = {'fast_ma_period': 5, 'slow_ma_period': 20}
+        factory = lambda **kwargs: DataManager(path, **kwargs)
+        with mock.patch.object(backtest_optimizer, 'DataManager', factory), \
+                mock.patch.object(backtest_engine, 'DataManager', factory), \
+                mock.patch.object(backtest_components, 'DataManager', factory):
+            optimizer = ParameterOptimizer(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2000-01-01', '2001-01-01',
+                                           max_workers=2)
+            results = optimizer.grid({name: [value] for name, value in params.items()})
+            direct = EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2000-01-01', '2001-01-01',
+                                           10000.0, params=params, verbosity=VERBOSITY_SILENT)
+            direct.run_backtest()
+
+        self.assertEqual(optimizer.symbol_specs['EURUSD']['contract_size'], 1000)
+        self.assertIsNone(results['error'].iloc[0])
+        self.assertNotEqual(direct.get_results()['final_equity'], 10000.0)
+        self.assertAlmostEqual(results['final_equity'].iloc[0], direct.get_results()['final_equity'])
+
+
+    def test_shared_memory_cleanup_is_silent(self):
+        """测试：各种进程启动方式下，优化结束释放共享内存时 resource_tracker 不输出任何错误"""
+        script = textwrap.dedent("""
+            import multiprocessing, sys
+            from backtest_optimizer import ParameterOptimizer
+            from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+            from fixtures import make_bars
+            if __name__ == '__main__':
+                multiprocessing.set_start_method(sys.argv[1])
+                ParameterOptimizer(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-02-01',
+                                   max_workers=2, bars=make_bars(200)).grid({'fast_ma_period': [5, 10]})
+        """)
+        path = os.path.join(tempfile.mkdtemp(), 'optimize.py')
+        with open(path, 'w') as f:
+            f.write(script)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        for method in multiprocessing.get_all_start_methods():
+            with self.subTest(start_method=method):
+                result = subprocess.run([sys.executable, path, method], capture_output=True, text=True, env=env,
+                                        timeout=120)
+                self.assertEqual(result.returncode, 0, result.stderr)
+                self.assertEqual(result.stderr, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from queue import Queue
+from unittest.mock import MagicMock
+
+from backtest_components import SimulatedExecutionHandler
+from backtest_gateway import BacktestTradingGateway, TRADE_ACTION_MODIFY, TRADE_RETCODE_DONE, TRADE_RETCODE_INVALID
+from backtest_ledger import PositionLedger
+from backtest_orders import PendingOrderBook
+from events import OrderEvent
+
+
+def make_order(ticket, direction, order_type, price, symbol='EURUSD'):
+    return OrderEvent(symbol=symbol, order_type=order_type, direction=direction, quantity=0.1, price=price, order=ticket)
+
+
+class TestPendingOrderBook(unittest.TestCase):
+    """测试挂单簿的触发规则"""
+
+    def setUp(self):
+        self.book = PendingOrderBook()
+        self.book.add(make_order(1, 'BUY', 'LMT', 1.0950))   # 跌到1.0950买入
+        self.book.add(make_order(2, 'BUY', 'LMT', 1.0900))
+        self.book.add(make_order(3, 'SELL', 'LMT', 1.1050))  # 涨到1.1050卖出
+        self.book.add(make_order(4, 'BUY', 'STP', 1.1100))   # 突破1.1100买入
+        self.book.add(make_order(5, 'SELL', 'STP', 1.0800))  # 跌破1.0800卖出
+        self.book.add(make_order(6, 'BUY', 'LMT', 1.0950, symbol='GBPUSD'))
+
+    def test_trigger_inside_bar_range(self):
+        triggered = self.book.trigger('EURUSD', high=1.1060, low=1.0940)
+        self.assertEqual(sorted(order.order for order in triggered), [1, 3])
+        self.assertEqual(len(self.book), 4)
+        self.assertEqual(self.book.trigger('EURUSD', high=1.1060, low=1.0940), [], "已触发的挂单不应重复触发")
+
+    def test_trigger_boundaries_and_remove(self):
+        self.assertIsNotNone(self.book.remove(2))
+        self.assertIsNone(self.book.remove(2))
+        triggered = self.book.trigger('EURUSD', high=1.1100, low=1.0800)
+        self.assertEqual(sorted(order.order for order in triggered), [1, 3, 4, 5], "挂单价等于最高/最低价时应触发")
+        self.assertEqual([order.order for order in self.book.orders()], [6])
+
+    def test_modify_reprices_order(self):
+        order = self.book.modify(1, 1.0850, sl=1.0800, tp=1.1000)
+        self.assertEqual((order.price, order.sl, order.tp), (1.0850, 1.0800, 1.1000))
+        self.assertIsNone(self.book.modify(99, 1.0))
+        # 原价格不再触发，新价格触发
+        self.assertEqual([o.order for o in self.book.trigger('EURUSD', high=1.0960, low=1.0940)], [])
+        self.assertEqual(sorted(o.order for o in self.book.trigger('EURUSD', high=1.0960, low=1.0850)), [1, 2])
+
+
+class TestPendingExecution(unittest.TestCase):
+    """测试执行处理器对挂单的成交价处理"""
+
+    def setUp(self):
+        self.events_queue = Queue()
+        self.data_handler = MagicMock()
+        self.handler = SimulatedExecutionHandler(self.events_queue, self.data_handler, slippage_points=2)
+
+    def test_limit_and_stop_fill_prices(self):
+        self.handler.execute_order(make_order(1, 'BUY', 'LMT', 1.0950))
+        self.handler.execute_order(make_order(2, 'BUY', 'STP', 1.1000))
+        self.handler.execute_order(make_order(3, 'SELL', 'LMT', 1.1005))
+        self.handler.execute_order(make_order(4, 'BUY', 'LMT', 1.0930))
+        self.assertTrue(self.events_queue.empty(), "挂单登记时不应成交")
+
+        # 点差10点：买单按 ask = bid + 0.0001 触发和成交，卖单按bid
+        # 开盘跳空到挂单价下方：买入限价按更优的开盘ask成交；买入止损按挂单价加滑点成交
+        self.data_handler.get_latest_bar.return_value = {'open': 1.0940, 'high': 1.1010, 'low': 1.0930, 'spread': 10}
+        self.handler.check_pending_orders('EURUSD')
+        fills = {fill.order: fill for fill in (self.events_queue.get() for _ in range(3))}
+        self.assertTrue(self.events_queue.empty())
+        self.assertAlmostEqual(fills[1].fill_price, 1.0941)
+        self.assertEqual(fills[1].slippage, 0.0)
+        self.assertAlmostEqual(fills[2].fill_price, 1.1000 + 0.00002)
+        self.assertAlmostEqual(fills[3].fill_price, 1.1005)
+        self.assertEqual([order.order for order in self.handler.order_book.orders()], [4],
+                         "bid最低价触及而ask最低价未触及时，买入限价不应成交")
+
+    def test_gateway_modify_pending_order(self):
+        """测试：TRADE_ACTION_MODIFY 修改挂单簿中的挂单价格"""
+        gateway = BacktestTradingGateway(self.events_queue, MagicMock(), self.data_handler, self.handler)
+        self.handler.execute_order(make_order(1, 'BUY', 'LMT', 1.0950))
+        result = gateway.order_send({'action': TRADE_ACTION_MODIFY, 'order': 1, 'price': 1.0900, 'tp': 1.1000})
+        self.assertEqual(result.retcode, TRADE_RETCODE_DONE)
+        self.assertEqual(gateway.order_send({'action': TRADE_ACTION_MODIFY, 'order': 2, 'price': 1.0}).retcode,
+                         TRADE_RETCODE_INVALID)
+
+        self.data_handler.get_latest_bar.return_value = {'open': 1.0940, 'high': 1.0960, 'low': 1.0920, 'spread': 0}
+        self.handler.check_pending_orders('EURUSD')
+        self.assertTrue(self.events_queue.empty(), "改价后原挂单价不应触发")
+        self.data_handler.get_latest_bar.return_value = {'open': 1.0920, 'high': 1.0930, 'low': 1.0890, 'spread': 0}
+        self.handler.check_pending_orders('EURUSD')
+        fill = self.events_queue.get()
+        self.assertEqual((fill.order, fill.fill_price, fill.tp), (1, 1.0900, 1.1000))
+
+    def test_check_stops_emits_closing_fills(self):
+        """测试：触及止损止盈的持仓生成反向平仓成交，止损计入滑点"""
+        ledger = PositionLedger()
+        ledger.open(1, 'EURUSD', 0, 0.1, 1.1000, 0, sl=1.0950)
+        ledger.open(2, 'EURUSD', 1, 0.2, 1.1000, 0, tp=1.0960)
+        ledger.open(3, 'EURUSD', 0, 0.1, 1.1000, 0, sl=1.0900)
+        ledger.open(4, 'EURUSD', 1, 0.1, 1.1000, 0, tp=1.0940)  # 空单按ask平仓，bid触及止盈价不够
+        self.data_handler.get_latest_bar.return_value = {'open': 1.1000, 'high': 1.1010, 'low': 1.0940, 'spread': 10}
+        self.handler.check_stops(ledger, 'EURUSD')
+
+        fills = [self.events_queue.get(), self.events_queue.get()]
+        self.assertTrue(self.events_queue.empty())
+        self.assertEqual([(f.position, f.direction, f.comment) for f in fills], [(1, 'SELL', 'sl'), (2, 'BUY', 'tp')])
+        self.assertAlmostEqual(fills[0].fill_price, 1.0950 - 0.00002)
+        self.assertAlmostEqual(fills[1].fill_price, 1.0960)
+        self.assertEqual(fills[1].quantity, 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from backtest_engine import EventDrivenBacktester
+from backtest_profiler import BacktestProfiler
+from backtest_recorder import VERBOSITY_SILENT
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars
+
+
+class TestBacktestProfiler(unittest.TestCase):
+    """测试回测性能剖析器"""
+
+    def _backtester(self, bars):
+        return EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-02', '2023-01-20', 10000.0,
+                                     params={'fast_ma_period': 5, 'slow_ma_period': 20}, bars=bars,
+                                     verbosity=VERBOSITY_SILENT)
+
+    def test_counts_and_report(self):
+        bars = make_bars(400)
+        plain = self._backtester(bars)
+        plain.run_backtest()
+
+        profiler = BacktestProfiler(strategy_profiler='cprofile')
+        backtester = profiler.attach(self._backtester(bars))
+        backtester.run_backtest()
+
+        self.assertEqual(backtester.get_results(), plain.get_results(), "计时包装不应改变回测结果")
+        self.assertEqual(profiler.bars, 400)
+        self.assertEqual(profiler.calls['data.update_bars'], 401)  # 最后一次调用返回False
+        self.assertEqual(profiler.calls['strategy.on_bar'], 400)
+        self.assertEqual(profiler.calls['portfolio.on_bar'], 400)
+        self.assertGreater(profiler.calls['gateway.copy_rates_from_pos'], 0)
+        self.assertGreater(profiler.calls['portfolio.on_fill'], 0)
+
+        components = profiler.components()
+        self.assertLessEqual(sum(components.values()), profiler.total_time * 1.001)
+        report = profiler.report()
+        self.assertIn('bars/sec', report)
+        self.assertIn('copy_rates_from_pos', report)
+        self.assertIn('check_and_trade', profiler.strategy_profile())
+
+    def test_rejects_unknown_profiler(self):
+        with self.assertRaises(ValueError):
+            BacktestProfiler(strategy_profiler='perf')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import EventRecorder, VERBOSITY_SILENT
+from data_manager import DataManager
+from duckdb_pool import DuckDBConnectionPool
+from events import MarketEvent, SignalEvent, OrderEvent, FillEvent
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars
+
+
+class TestEventRecorder(unittest.TestCase):
+    """测试结构化事件记录器"""
+
+    def test_records_trade_events_with_bar_time(self):
+        """测试：默认只记录信号/订单/成交，时间取自最近的市场事件"""
+        recorder = EventRecorder(capacity=1)
+        recorder.record(MarketEvent(symbol='EURUSD', time=1672531200))
+        recorder.record(SignalEvent(symbol='EURUSD', direction='BUY', volume=0.1))
+        recorder.record(OrderEvent(symbol='EURUSD', order_type='MKT', direction='BUY', quantity=0.1))
+        recorder.record(FillEvent(symbol='EURUSD', direction='BUY', quantity=0.1, fill_price=1.1002, commission=0.1))
+
+        self.assertEqual(len(recorder), 3, "容量不足时应自动扩容")
+        df = recorder.to_dataframe()
+        self.assertEqual(df['kind'].tolist(), ['SIGNAL', 'ORDER', 'FILL'])
+        self.assertTrue((df['time'] == pd.Timestamp('2023-01-01')).all())
+        self.assertEqual(df['symbol'].tolist(), ['EURUSD'] * 3)
+        self.assertAlmostEqual(df['price'].iloc[2], 1.1002)
+
+    def test_record_market_and_csv_export(self):
+        recorder = EventRecorder(record_market=True)
+        recorder.record(MarketEvent(symbol='EURUSD', time=1672531200))
+        recorder.record(MarketEvent(symbol='GBPUSD', time=1672534800))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'events.csv')
+            recorder.to_csv(path)
+            df = pd.read_csv(path)
+        self.assertEqual(df['kind'].tolist(), ['MARKET', 'MARKET'])
+        self.assertEqual(df['symbol'].tolist(), ['EURUSD', 'GBPUSD'])
+
+
+class TestBacktesterVerbosity(unittest.TestCase):
+
+    def test_silent_run_has_no_console_output_and_records_fills(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            engine = EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-12-31',
+                                           10000.0, params={'fast_ma_period': 5}, bars=make_bars(800, seed=11),
+                                           verbosity=VERBOSITY_SILENT)
+            engine.run_backtest()
+
+        self.assertEqual(stdout.getvalue(), "")
+        fills = engine.recorder.to_dataframe().query("kind == 'FILL'")
+        self.assertGreater(len(fills), 0)
+        self.assertGreaterEqual(len(fills), 2 * len(engine.portfolio.trade_history))
+        # 静默是通过标志传递的，不替换策略实例上的方法
+        self.assertNotIn('log', vars(engine.strategy))
+        self.assertFalse(engine.strategy.verbose)
+        self.assertFalse(engine.execution_handler.verbose)
+
+    def test_quiet_data_manager_does_not_log(self):
+        pool = DuckDBConnectionPool()
+        self.addCleanup(pool.close)
+        path = os.path.join(tempfile.mkdtemp(), 'empty.duckdb')
+        with self.assertNoLogs('MT5Toolbox'):
+            self.assertIsNone(DataManager(path, pool=pool, verbose=False).get_data('EURUSD', 'H1', '2023-01-01',
+                                                                                '2023-02-01'))
+        with self.assertLogs('MT5Toolbox', 'WARNING'):
+            DataManager(path, pool=pool).get_data('EURUSD', 'H1', '2023-01-01', '2023-02-01')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import backtest_components
+from backtest_benchmark import synthetic_rates, write_synthetic_data
+from backtest_components import ChunkPrefetcher, StreamingBarCursor
+from backtest_engine import EventDrivenBacktester
+from backtest_metrics import trade_excursions
+from backtest_recorder import VERBOSITY_SILENT
+from data_manager import DataManager
+from duckdb_pool import DuckDBConnectionPool
+from fixtures import make_bars
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+
+
+def chunked(bars, size):
+    return [bars[i:i + size] for i in range(0, len(bars), size)]
+
+
+class TestStreamingBarCursor(unittest.TestCase):
+    """测试分块加载的K线游标"""
+
+    def test_walks_all_chunks_with_bounded_window(self):
+        """测试：游标依次读完所有块，bars 只保留回看窗口和当前块"""
+        bars = make_bars(1000)
+        cursor = StreamingBarCursor(ChunkPrefetcher(chunked(bars, 100)), total=1000, lookback=10)
+        times = []
+        while cursor.advance():
+            times.append(int(cursor.current['time']))
+            self.assertLessEqual(cursor.length, 110)
+        self.assertEqual(times, bars['time'].tolist())
+        self.assertEqual(cursor.total, 1000)
+
+    def test_window_keeps_requested_lookback(self):
+        """测试：策略请求过的回看长度在之后的块中依然可用"""
+        bars = make_bars(1000)
+        cursor = StreamingBarCursor(chunked(bars, 100), total=1000, lookback=1)
+        for _ in range(60):
+            cursor.advance()
+        cursor.window(0, 50)
+        for i in range(60, 900):
+            cursor.advance()
+            np.testing.assert_array_equal(cursor.window(0, 50), bars[i - 49:i + 1])
+
+    def test_seek_reads_forward(self):
+        """测试：seek() 向前读取到检查点所在的块"""
+        bars = make_bars(500)
+        cursor = StreamingBarCursor(chunked(bars, 64), total=500)
+        self.assertTrue(cursor.seek(int(bars['time'][300])))
+        self.assertEqual(cursor.peek_time(), int(bars['time'][301]))
+        self.assertFalse(StreamingBarCursor(chunked(bars, 64), total=500).seek(int(bars['time'][300]) + 1))
+
+    def test_prefetch_error_is_raised_in_consumer(self):
+        """测试：后台读取出错时，异常在消费端抛出"""
+        def failing():
+            yield make_bars(10)
+            raise RuntimeError('boom')
+        chunks = ChunkPrefetcher(failing())
+        next(chunks)
+        with self.assertRaises(RuntimeError):
+            next(chunks)
+
+    def test_chunked_trade_excursions_match_single_array(self):
+        """测试：分块计算的MAE/MFE与整段数组一致"""
+        bars = make_bars(400)
+        rng = np.random.default_rng(3)
+        opens = rng.integers(0, 390, 50)
+        # 开平仓时间既有K线时间，也有K线内部的时间
+        trades = pd.DataFrame({
+            'type': rng.integers(0, 2, 50),
+            'volume': 0.1,
+            'price_open': bars['close'][opens],
+            'time_open': bars['time'][opens] + rng.integers(0, 3600, 50),
+            'time_close': bars['time'][opens + rng.integers(0, 10, 50)] + 60,
+        })
+        expected = trade_excursions(trades, bars)
+        for size in (1, 7, 64):
+            mae, mfe = trade_excursions(trades, chunked(bars, size))
+            np.testing.assert_allclose(mae, expected[0])
+            np.testing.assert_allclose(mfe, expected[1])
+
+
+class TestIterData(unittest.TestCase):
+    """测试按固定行数分块读取"""
+
+    def setUp(self):
+        self.pool = DuckDBConnectionPool()
+        self.manager = DataManager(os.path.join(tempfile.mkdtemp(), 'iter.duckdb'), pool=self.pool)
+        self.rates = synthetic_rates(5000, 'M15', seed=1)  # 含周末休市
+        # 没有固定周期的数据：相邻两行间隔1~30秒
+        self.ticks = synthetic_rates(3000, 'M1', seed=2)
+        self.ticks['time'] = pd.Timestamp('2023-01-02') + pd.to_timedelta(
+            np.cumsum(np.random.default_rng(2).integers(1, 31, 3000)), unit='s')
+        with self.manager._get_connection() as conn:
+            for table, frame in (('EURUSD_M15', self.rates), ('EURUSD_TICK', self.ticks)):
+                self.manager._create_rates_table(conn, table)
+                conn.register('frame', frame)
+                conn.execute(f"INSERT INTO {table} SELECT * FROM frame")
+                conn.unregister('frame')
+
+    def tearDown(self):
+        self.pool.close()
+
+    @staticmethod
+    def _epoch(frame):
+        return ((frame['time'] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).to_numpy()
+
+    def test_batches_have_fixed_row_count(self):
+        for timeframe, frame in (('M15', self.rates), ('TICK', self.ticks)):
+            with self.subTest(timeframe=timeframe):
+                # 起始日期远早于数据开始
+                chunks = list(self.manager.iter_data('EURUSD', timeframe, '2000-01-01', '2100-01-01', 700))
+                self.assertEqual([len(c) for c in chunks[:-1]], [700] * (len(chunks) - 1))
+                self.assertLessEqual(len(chunks[-1]), 700)
+                np.testing.assert_array_equal(np.concatenate(chunks)['time'], self._epoch(frame))
+                self.assertEqual(np.concatenate(chunks)['close'].tolist(), frame['close'].tolist())
+
+    def test_respects_date_range(self):
+        start, end = self.rates['time'].iloc[1000], self.rates['time'].iloc[3999]
+        chunks = list(self.manager.iter_data('EURUSD', 'M15', start, end, 512))
+        np.testing.assert_array_equal(np.concatenate(chunks)['time'], self._epoch(self.rates.iloc[1000:4000]))
+        self.assertEqual(list(self.manager.iter_data('EURUSD', 'M15', '1990-01-01', '1990-02-01', 512)), [])
+
+
+class TestStreamingBacktest(unittest.TestCase):
+    """流式回测与一次性加载的回测结果一致"""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'stream.duckdb')
+        self.pool = DuckDBConnectionPool()
+        with mock.patch('backtest_benchmark.DataManager', lambda path: DataManager(path, pool=self.pool)):
+            write_synthetic_data(self.path, 'EURUSD', 'H1', 3000, seed=5)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _run(self, **kwargs):
+        manager = lambda **kwargs: DataManager(self.path, pool=self.pool, **kwargs)
+        with mock.patch.object(backtest_components, 'DataManager', manager):
+            backtester = EventDrivenBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2000-01-01', '2001-01-01',
+                                               10000.0, symbol_specs={}, verbosity=VERBOSITY_SILENT, **kwargs)
+            backtester.run_backtest()
+            return backtester, backtester.get_trades()
+
+    def test_streaming_matches_in_memory(self):
+        full, full_trades = self._run()
+        stream, stream_trades = self._run(stream_chunk_rows=256)
+        self.assertEqual(stream.portfolio.history_size, 3000)
+        self.assertLessEqual(stream.data_handler.cursor.length, 256 + stream.data_handler.cursor.lookback)
+        pd.testing.assert_frame_equal(stream.get_equity_curve(), full.get_equity_curve())
+        self.assertGreater(len(full_trades), 0)
+        pd.testing.assert_frame_equal(stream_trades, full_trades)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from backtest_gateway import BacktestTradingGateway
+from backtest_symbols import SymbolSpec, SymbolSpecCache
+from fixtures import make_bars
+
+
+class TestSymbolSpecCache(unittest.TestCase):
+    """测试品种规格缓存和预计算的报价"""
+
+    def test_default_and_synced_specs(self):
+        self.assertEqual(SymbolSpec.default('USDJPY').point, 0.001)
+        self.assertEqual(SymbolSpec.default('XAUUSD').contract_size, 100)
+        self.assertEqual(SymbolSpec.default('EURUSD').margin_currency, 'EUR')
+
+        cache = SymbolSpecCache({'EURUSD': {'contract_size': 10000, 'volume_min': 0.1, 'digits': None}})
+        spec = cache.spec('EURUSD')
+        self.assertEqual((spec.contract_size, spec.volume_min, spec.digits), (10000, 0.1, 5), "缺失字段应使用推断值")
+        self.assertIs(cache.spec('EURUSD'), spec)
+
+    def test_symbol_info_is_cached(self):
+        cache = SymbolSpecCache()
+        info = cache.symbol_info('EURUSD', spread=5)
+        self.assertIs(cache.symbol_info('EURUSD', spread=7), info)
+        self.assertEqual(info.spread, 7)
+
+    def test_tick_uses_bar_spread(self):
+        bars = make_bars(10).copy()
+        bars['spread'] = np.arange(10)
+        cache = SymbolSpecCache()
+        cache.load_quotes('EURUSD', bars)
+        tick = cache.tick('EURUSD', bars, 4)
+        self.assertEqual(tick.bid, bars['close'][4])
+        self.assertAlmostEqual(tick.ask - tick.bid, 4 * 0.00001)
+        self.assertIs(cache.tick('EURUSD', bars, 4), tick, "同一根K线上应返回同一个报价对象")
+
+
+class TestOrderCalcMargin(unittest.TestCase):
+    """测试保证金按保证金货币换算为账户货币"""
+
+    def setUp(self):
+        closes = {'USDJPY': 150.0, 'GBPUSD': 1.25}
+        data_handler = MagicMock()
+        data_handler.get_latest_bar.side_effect = lambda symbol: ({'close': closes[symbol]} if symbol in closes
+                                                                  else None)
+        portfolio = MagicMock(leverage=100, symbol_specs=SymbolSpecCache({'US30': {'contract_size': 1.0,
+                                                                                   'margin_currency': 'USD'}}))
+        self.gateway = BacktestTradingGateway(MagicMock(), portfolio, data_handler)
+
+    def test_margin_in_account_currency(self):
+        margin = self.gateway.order_calc_margin
+        self.assertAlmostEqual(margin(0, 'EURUSD', 1.0, 1.1), 1100.0)    # EUR -> USD 按品种价格
+        self.assertAlmostEqual(margin(0, 'USDJPY', 1.0, 150.0), 1000.0)  # 保证金货币即账户货币
+        self.assertAlmostEqual(margin(0, 'EURJPY', 1.0, 160.0), 1000.0 * 160.0 / 150.0)  # EUR -> JPY -> USD
+        self.assertAlmostEqual(margin(0, 'EURGBP', 1.0, 0.85), 1000.0 * 0.85 * 1.25)
+        self.assertAlmostEqual(margin(0, 'XAUUSD', 1.0, 2000.0), 2000.0)
+        self.assertAlmostEqual(margin(0, 'US30', 2.0, 35000.0), 700.0)   # 差价合约按名义价值
+        self.assertIsNone(margin(0, 'EURCHF', 1.0, 0.95), "没有可用于换算的货币对")
+
+
+if __name__ == '__main__':
+    unittest.main()
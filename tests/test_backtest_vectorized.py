@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_SILENT
+from backtest_vectorized import VectorizedBacktester
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from strategies.eurusd_one_click_with_stops import OneClickWithStopsStrategy
+from fixtures import make_bars
+
+
+class TestVectorizedBacktester(unittest.TestCase):
+    """测试向量化回测引擎"""
+
+    # generate_signals() 不模拟止损止盈，关闭后才走真正的向量化计算
+    params = {'fast_ma_period': 5, 'slow_ma_period': 20, 'stop_loss_pips': 0, 'take_profit_pips': 0}
+
+    def test_parity_with_event_driven_engine(self):
+        """测试：DualMA策略在两个引擎中应产生完全相同的交易和最终净值"""
+        bars = make_bars(2000, seed=3)
+        config = dict(strategy_class=DualMaCrossoverStrategy, symbol='EURUSD', timeframe='H1',
+                      start_date='2023-01-01', end_date='2023-12-31', initial_cash=10000.0,
+                      params=self.params, bars=bars)
+
+        event_engine = EventDrivenBacktester(**config, verbosity=VERBOSITY_SILENT)
+        event_engine.run_backtest()
+        vector_engine = VectorizedBacktester(**config)
+        vector_engine.run_backtest()
+
+        columns = ['type', 'volume', 'price_open', 'price_close', 'time_open', 'time_close', 'profit', 'commission']
+        event_trades = pd.DataFrame(event_engine.portfolio.trade_history)[columns]
+        vector_trades = vector_engine.trades[columns]
+
+        self.assertGreater(len(event_trades), 10, "测试数据应产生足够多的交易")
+        pd.testing.assert_frame_equal(event_trades.reset_index(drop=True), vector_trades.reset_index(drop=True),
+                                      check_dtype=False, rtol=1e-9)
+        self.assertAlmostEqual(event_engine.get_results()['final_equity'],
+                               vector_engine.get_results()['final_equity'], places=6)
+
+    def test_parity_with_default_stops(self):
+        """测试：默认参数带止损止盈，向量化回测改用事件驱动引擎，结果与之完全一致"""
+        bars = make_bars(2000, seed=3)
+        config = dict(strategy_class=DualMaCrossoverStrategy, symbol='EURUSD', timeframe='H1',
+                      start_date='2023-01-01', end_date='2023-12-31', initial_cash=10000.0, bars=bars)
+
+        event_engine = EventDrivenBacktester(**config, verbosity=VERBOSITY_SILENT)
+        event_engine.run_backtest()
+        vector_engine = VectorizedBacktester(**config)
+        self.assertEqual(vector_engine.unsupported_params, ['stop_loss_pips', 'take_profit_pips'])
+        with self.assertLogs('MT5Toolbox', level='WARNING'):
+            results = vector_engine.run_backtest()
+
+        event_trades = pd.DataFrame(event_engine.portfolio.trade_history)
+        self.assertGreater(len(event_trades), 10)
+        pd.testing.assert_frame_equal(vector_engine.trades, event_trades)
+        self.assertEqual(results, event_engine.get_results())
+        np.testing.assert_array_equal(vector_engine.equity_curve, event_engine.get_equity_curve()['equity'])
+
+    def test_equity_curve_covers_every_bar(self):
+        bars = make_bars(500)
+        engine = VectorizedBacktester(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-12-31', 10000.0,
+                                      params=self.params, bars=bars)
+        engine.run_backtest()
+        self.assertEqual(len(engine.equity_curve), len(bars))
+        self.assertEqual(engine.equity_curve[0], 10000.0, "第一根K线不可能有成交")
+        self.assertTrue(np.isfinite(engine.equity_curve).all())
+
+    def test_strategy_without_generate_signals_is_rejected(self):
+        with self.assertRaises(TypeError):
+            VectorizedBacktester(OneClickWithStopsStrategy, 'EURUSD', 'M1', '2023-01-01', '2023-12-31', 10000.0,
+                                 bars=make_bars(10))
+        # 只有 generate_signals() 而没有声明支持时同样拒绝
+        opted_out = type('OptedOut', (DualMaCrossoverStrategy,), {'supports_vectorized': False})
+        with self.assertRaises(TypeError):
+            VectorizedBacktester(opted_out, 'EURUSD', 'M1', '2023-01-01', '2023-12-31', 10000.0, bars=make_bars(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+from backtest_engine import EventDrivenBacktester
+from backtest_recorder import VERBOSITY_SILENT
+from backtest_walkforward import WalkForwardOptimizer, stitch_equity, walk_forward_windows
+from models.strategy import Strategy
+from strategies.dual_ma_crossover_strategy import DualMaCrossoverStrategy
+from fixtures import make_bars
+
+
+class HistoryProbeStrategy(Strategy):
+    """记录每根K线上可以回看的K线数量"""
+    strategy_params_config = {}
+    strategy_name = 'HistoryProbe'
+
+    def on_init(self):
+        self.visible = []
+
+    def on_bar(self, event):
+        self.visible.append(len(self.gateway.copy_rates_from_pos(self.symbol, self.timeframe, 0, 1000)))
+
+
+class TestWalkForwardWindows(unittest.TestCase):
+    """测试样本内/样本外窗口切分"""
+
+    def test_rolling_and_anchored_windows(self):
+        times = np.arange(10) * 3600
+        self.assertEqual(walk_forward_windows(times, 4, 3), [(0, 4, 4, 7), (3, 7, 7, 10)])
+        self.assertEqual(walk_forward_windows(times, 4, 3, anchored=True), [(0, 4, 4, 7), (0, 7, 7, 10)])
+
+    def test_time_based_windows(self):
+        times = np.arange(48) * 3600
+        windows = walk_forward_windows(times, '12h', '12h')
+        self.assertEqual(windows, [(0, 12, 12, 24), (12, 24, 24, 36), (24, 36, 36, 48)])
+
+    def test_stitch_compounds_folds(self):
+        curve = stitch_equity([(np.array([0, 1]), np.array([100.0, 110.0])),
+                               (np.array([2, 3]), np.array([100.0, 90.0]))], 100.0)
+        np.testing.assert_allclose(curve.to_numpy(), [100.0, 110.0, 110.0, 99.0])
+
+
+class TestWalkForwardOptimizer(unittest.TestCase):
+    """测试并行滚动前推分析"""
+
+    def test_run_stitches_out_of_sample_equity(self):
+        bars = make_bars(1200, seed=5)
+        optimizer = WalkForwardOptimizer(DualMaCrossoverStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-03-01',
+                                         in_sample=400, out_of_sample=200, max_workers=2, bars=bars)
+        folds = optimizer.grid({'fast_ma_period': [5, 10], 'slow_ma_period': [20, 40]})
+
+        self.assertEqual(len(folds), 4)
+        self.assertTrue(folds['oos_error'].isna().all())
+        self.assertTrue({'fast_ma_period', 'is_total_return', 'oos_total_return'} <= set(folds.columns))
+        self.assertEqual(len(optimizer.equity_curve), 800, "拼接后的曲线应覆盖全部样本外K线")
+        self.assertTrue(optimizer.equity_curve.index.is_monotonic_increasing)
+        self.assertAlmostEqual(optimizer.summary['final_equity'], optimizer.equity_curve.iloc[-1])
+        np.testing.assert_array_equal(optimizer.equity_curve.index.to_numpy().astype('datetime64[s]').astype(np.int64),
+                                      bars['time'][400:])
+
+    def test_out_of_sample_starts_with_warmed_up_history(self):
+        """测试：样本外回测能回看之前的K线，但交易和净值记录从样本外起点开始"""
+        bars = make_bars(300, seed=5)
+        backtester = EventDrivenBacktester(HistoryProbeStrategy, 'EURUSD', 'H1', '2023-01-01', '2023-03-01', 10000.0,
+                                           bars=bars, verbosity=VERBOSITY_SILENT, warmup_bars=200)
+        backtester.run_backtest()
+        self.assertEqual(backtester.strategy.visible[0], 201)
+        self.assertEqual(len(backtester.strategy.visible), 100)
+        n = backtester.portfolio.history_size
+        np.testing.assert_array_equal(backtester.portfolio.time_history[:n], bars['time'][200:])
+
+
+if __name__ == '__main__':
+    unittest.main()
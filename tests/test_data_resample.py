@@ -0,0 +1,105 @@
+import os
+import queue
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import pandas as pd
+
+import data_manager
+from backtest_benchmark import synthetic_rates
+from data_manager import DataManager
+from duckdb_pool import DuckDBConnectionPool
+from test_data_sync import FakeMT5
+
+AGGREGATIONS = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'tick_volume': 'sum',
+                'spread': 'last', 'real_volume': 'sum'}
+
+
+class TestDeriveTimeframe(unittest.TestCase):
+    """测试由M1在库内聚合出更大周期"""
+
+    def setUp(self):
+        self.pool = DuckDBConnectionPool()
+        self.manager = DataManager(os.path.join(tempfile.mkdtemp(), 'resample.duckdb'), pool=self.pool)
+        # 从周三开始，覆盖一个周末
+        self.m1 = synthetic_rates(12000, 'M1', seed=2, start='2023-01-04 00:00')
+        self._insert(self.m1.iloc[:9000])
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _insert(self, frame):
+        with self.manager._get_connection() as conn:
+            self.manager._create_rates_table(conn, 'EURUSD_M1')
+            conn.register('frame', frame)
+            conn.execute("INSERT OR REPLACE INTO EURUSD_M1 SELECT * FROM frame")
+            conn.unregister('frame')
+
+    def _expected(self, frame, rule):
+        return frame.set_index('time').resample(rule).agg(AGGREGATIONS).dropna().astype(frame.dtypes.drop('time'))
+
+    def _derived(self, timeframe):
+        data = self.manager.get_data('EURUSD', timeframe, '2023-01-01', '2023-02-01')
+        return data.astype(self.m1.dtypes.drop('time'))
+
+    def test_matches_pandas_resample(self):
+        for timeframe, rule in (('M15', '15min'), ('H1', 'h'), ('H4', '4h'), ('D1', 'D'),
+                                ('W1', 'W-SAT')):
+            with self.subTest(timeframe=timeframe):
+                self.manager.derive_timeframe('EURUSD', timeframe)
+                expected = self._expected(self.m1.iloc[:9000], rule)
+                if timeframe == 'W1':
+                    # pandas按周末标记周期，MT5的周K线以周日开盘时间标记
+                    expected.index = expected.index - pd.Timedelta(days=6)
+                pd.testing.assert_frame_equal(self._derived(timeframe), expected, check_names=False,
+                                              check_freq=False, check_index_type=False)
+
+    def test_incremental_refresh_only_touches_new_buckets(self):
+        self.manager.derive_timeframe('EURUSD', 'H1')
+        self._insert(self.m1.iloc[9000:])
+        # 原来最后一根H1只有部分分钟，重新聚合它及之后的新周期
+        written = self.manager.refresh_derived_timeframes()['EURUSD_H1']
+        self.assertEqual(written, 200 - 150 + 1)
+        pd.testing.assert_frame_equal(self._derived('H1'), self._expected(self.m1, 'h'), check_names=False,
+                                      check_freq=False, check_index_type=False)
+        self.assertEqual([d['timeframe'] for d in self.manager.get_local_data_list()], ['H1', 'M1'])
+
+    def test_refuses_to_overwrite_synced_table(self):
+        with self.manager._get_connection() as conn:
+            self.manager._create_rates_table(conn, 'EURUSD_H1')
+            conn.execute("INSERT INTO EURUSD_H1 VALUES ('2023-01-04', 1, 1, 1, 1, 1, 1, 1)")
+        with self.assertRaises(ValueError):
+            self.manager.derive_timeframe('EURUSD', 'H1')
+        with self.assertRaises(ValueError):
+            self.manager.derive_timeframe('EURUSD', 'M1', source_timeframe='H1')
+
+    def test_uses_pool_catalogue(self):
+        """测试：来源表通过连接池的表名目录检查，派生出的新表立即出现在目录中"""
+        with self.assertRaises(ValueError):
+            self.manager.derive_timeframe('GBPUSD', 'H1')
+        with self.manager._get_connection() as conn:
+            self.assertNotIn('EURUSD_H4', self.pool.tables(self.manager.data_path))
+            self.manager._derive_timeframe(conn, 'EURUSD', 'H4', 'M1')
+            # 写游标退出之前，缓存的目录中已经有新表
+            catalogue = self.pool.tables(self.manager.data_path)
+        self.assertTrue({'EURUSD_H4', data_manager.DERIVED_TIMEFRAMES_TABLE} <= catalogue)
+
+    def test_sync_downloads_only_the_source_timeframe(self):
+        fake = FakeMT5()
+        log = queue.Queue()
+        with mock.patch.object(data_manager, '_connect_mt5', return_value=(1.0, fake, 1)):
+            self.assertTrue(self.manager.sync_data(['GBPUSD'], ['M1', 'H1', 'H4'], {}, log, '2023-01-02', '2023-01-04',
+                                                   derive_from='M1'))
+        self.assertEqual({call[1] for call in fake.calls}, {FakeMT5.TIMEFRAME_M1})
+        self.assertEqual(len(self.manager.get_data('GBPUSD', 'H1', '2023-01-01', '2023-01-05')), 48)
+        self.assertEqual(len(self.manager.get_data('GBPUSD', 'H4', '2023-01-01', '2023-01-05')), 12)
+        # 派生周期的完整性按来源周期的同步覆盖范围判断
+        self.assertEqual(self.manager.get_missing_ranges('GBPUSD', 'H4', '2023-01-02', '2023-01-03'), [])
+        self.assertEqual(self.manager.get_missing_ranges('GBPUSD', 'H4', '2023-01-02', '2023-01-04'),
+                         [(datetime(2023, 1, 4), datetime(2023, 1, 4, 0, 0, 1))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+import calendar
+import os
+import queue
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+import data_manager
+import data_sync
+from data_manager import DataManager
+from data_sync import (AdaptiveRateLimiter, SyncPipeline, SyncTask, coverage_from_times, find_gaps, merge_ranges,
+                       subtract_ranges, timeframe_seconds)
+from duckdb_pool import DuckDBConnectionPool
+
+RATE_DTYPE = [('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+              ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8')]
+
+
+class FakeMT5:
+    """接口与 MetaTrader5 模块相同的假终端：每个周期整点都有一根K线，可以让前几次请求失败。"""
+    TIMEFRAME_M1 = 1
+    TIMEFRAME_H1 = 16385
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self._error = (1, 'Success')
+        self.closed = False
+
+    def copy_rates_range(self, symbol, timeframe, start, end):
+        self.calls.append((symbol, timeframe, start, end))
+        if self.failures:
+            self.failures -= 1
+            self._error = (-10005, 'IPC timeout')
+            return None
+        self._error = (1, 'Success')
+        step = 3600 if timeframe == self.TIMEFRAME_H1 else 60
+        first = -(-calendar.timegm(start.timetuple()) // step) * step
+        times = np.arange(first, calendar.timegm(end.timetuple()) + 1, step)
+        rates = np.zeros(len(times), dtype=RATE_DTYPE)
+        rates['time'] = times
+        rates['open'] = rates['high'] = rates['low'] = rates['close'] = 1.1
+        return rates
+
+    def last_error(self):
+        return self._error
+
+    def symbol_info(self, symbol):
+        return SimpleNamespace(point=0.00001, digits=5, trade_contract_size=100000.0, volume_min=0.01,
+                               volume_max=100.0, volume_step=0.01, currency_margin='EUR')
+
+    def shutdown(self):
+        self.closed = True
+
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+    """测试自适应限速"""
+
+    def test_backs_off_on_failure_and_recovers(self):
+        now = [0.0]
+        sleeps = []
+        limiter = AdaptiveRateLimiter(backoff=0.1, max_interval=0.5, sleep=sleeps.append, clock=lambda: now[0])
+        limiter.wait()
+        limiter.wait()
+        self.assertEqual(sleeps, [])  # 没有失败时不等待
+        for _ in range(5):
+            limiter.failure()
+        self.assertEqual(limiter.interval, 0.5)
+        limiter.wait()
+        self.assertEqual(sleeps, [0.5])
+        for _ in range(6):
+            limiter.success()
+        self.assertEqual(limiter.interval, 0.0)
+
+    def test_timeframe_seconds(self):
+        self.assertEqual(timeframe_seconds('M15'), 900)
+        self.assertEqual(timeframe_seconds('H4'), 14400)
+        self.assertEqual(timeframe_seconds('MN1'), 2592000)
+
+
+class TestSyncPipeline(unittest.TestCase):
+    """测试下载/写入流水线"""
+
+    def setUp(self):
+        self.pool = DuckDBConnectionPool()
+        self.manager = DataManager(os.path.join(tempfile.mkdtemp(), 'sync.duckdb'), pool=self.pool)
+        self.log = queue.Queue()
+        with self.manager._get_connection() as conn:
+            for table in ('EURUSD_M1', 'GBPUSD_H1'):
+                self.manager._create_rates_table(conn, table)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _count(self, table):
+        return self.manager._get_cursor().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_chunks_batches_and_metrics(self):
+        tasks = [SyncTask('EURUSD', 'M1', 'EURUSD_M1', datetime(2023, 1, 2), datetime(2023, 1, 3)),
+                 SyncTask('GBPUSD', 'H1', 'GBPUSD_H1', datetime(2023, 1, 2), datetime(2023, 1, 9))]
+        fake = FakeMT5()
+        pipeline = SyncPipeline(fake, self.manager._get_connection, self.log, queue_size=2,
+                                batch_rows=1000, chunk_bars=100)
+        pipeline.run(tasks)
+        self.assertEqual(self._count('EURUSD_M1'), 1440)
+        self.assertEqual(self._count('GBPUSD_H1'), 168)
+        self.assertEqual([t.rows_written for t in tasks], [1440, 168])
+        self.assertEqual(tasks[0].chunks, 15)  # 1440根M1分成每段最多100根
+        self.assertEqual(len(fake.calls), 15 + 2)
+        stats = pipeline.stats()
+        self.assertEqual(list(stats['rows_fetched']), [1440, 168])
+        self.assertTrue(stats['error'].isna().all())
+
+        # 再次同步同一范围时已有的行被替换，不会重复
+        again = [SyncTask('GBPUSD', 'H1', 'GBPUSD_H1', datetime(2023, 1, 2), datetime(2023, 1, 9))]
+        SyncPipeline(FakeMT5(), self.manager._get_connection, self.log).run(again)
+        self.assertEqual(again[0].rows_written, 168)
+        self.assertEqual(self._count('GBPUSD_H1'), 168)
+
+    def test_retries_transient_errors(self):
+        limiter = AdaptiveRateLimiter(backoff=0.001, max_interval=0.002)
+        tasks = [SyncTask('GBPUSD', 'H1', 'GBPUSD_H1', datetime(2023, 1, 2), datetime(2023, 1, 3))]
+        SyncPipeline(FakeMT5(failures=3), self.manager._get_connection, self.log, rate_limiter=limiter).run(tasks)
+        self.assertEqual((tasks[0].retries, tasks[0].rows_written), (3, 24))
+
+        failing = [SyncTask('GBPUSD', 'H1', 'GBPUSD_H1', datetime(2023, 2, 1), datetime(2023, 2, 2))]
+        SyncPipeline(FakeMT5(failures=100), self.manager._get_connection, self.log, max_retries=2,
+                     rate_limiter=limiter).run(failing)
+        self.assertIn('IPC timeout', failing[0].error)
+        self.assertEqual(failing[0].rows_written, 0)
+
+    def test_bulk_ingest_with_and_without_arrow(self):
+        for table, arrow in (('EURUSD_M1', data_sync.pa), ('GBPUSD_H1', None)):
+            with self.subTest(arrow=arrow is not None), mock.patch.object(data_sync, 'pa', arrow):
+                task = SyncTask('X', 'H1', table, datetime(2023, 1, 2, 0, 30), datetime(2023, 1, 2, 3, 30))
+                SyncPipeline(FakeMT5(), self.manager._get_connection, self.log).run([task])
+                rows = self.manager._get_cursor().execute(f"SELECT time, close FROM {table} ORDER BY time").fetchall()
+                self.assertEqual([row[0] for row in rows],
+                                 [datetime(2023, 1, 2, 1), datetime(2023, 1, 2, 2), datetime(2023, 1, 2, 3)])
+                self.assertEqual(rows[0][1], 1.1)
+
+    def test_sync_data_with_fake_terminal(self):
+        fake = FakeMT5()
+        with mock.patch.object(data_manager, '_connect_mt5', return_value=(1.0, fake, 1)):
+            ok = self.manager.sync_data(['EURUSD'], ['H1'], {}, self.log, '2023-01-02', '2023-01-04')
+        self.assertTrue(ok)
+        self.assertTrue(fake.closed)
+        self.assertEqual(self._count('EURUSD_H1'), 48)
+        self.assertEqual(self.manager.get_symbol_specs()['EURUSD']['digits'], 5)
+        self.assertEqual(int(self.manager.last_sync_stats['rows_written'].sum()), 48)
+
+
+class TestSyncCoverage(unittest.TestCase):
+    """测试同步覆盖范围与缺口检测"""
+
+    def setUp(self):
+        self.pool = DuckDBConnectionPool()
+        self.manager = DataManager(os.path.join(tempfile.mkdtemp(), 'coverage.duckdb'), pool=self.pool)
+        self.log = queue.Queue()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_range_helpers(self):
+        times = np.array(['2023-01-02T00', '2023-01-02T01', '2023-01-02T04', '2023-01-02T05'], dtype='datetime64[s]')
+        self.assertEqual(find_gaps(times, 'H1'), [(datetime(2023, 1, 2, 2), datetime(2023, 1, 2, 4))])
+        self.assertEqual(coverage_from_times(times, 'H1'), [(datetime(2023, 1, 2, 0), datetime(2023, 1, 2, 2)),
+                                                            (datetime(2023, 1, 2, 4), datetime(2023, 1, 2, 5))])
+        covered = merge_ranges([(datetime(2023, 1, 3), datetime(2023, 1, 4)), (datetime(2023, 1, 1), datetime(2023, 1, 2)),
+                                (datetime(2023, 1, 2), datetime(2023, 1, 2, 12))])
+        self.assertEqual(covered, [(datetime(2023, 1, 1), datetime(2023, 1, 2, 12)),
+                                   (datetime(2023, 1, 3), datetime(2023, 1, 4))])
+        self.assertEqual(subtract_ranges(datetime(2023, 1, 2), datetime(2023, 1, 5), covered),
+                         [(datetime(2023, 1, 2, 12), datetime(2023, 1, 3)), (datetime(2023, 1, 4), datetime(2023, 1, 5))])
+
+    def _sync(self, fake, *dates):
+        with mock.patch.object(data_manager, '_connect_mt5', return_value=(1.0, fake, 1)):
+            self.assertTrue(self.manager.sync_data(['EURUSD'], ['H1'], {}, self.log, *dates))
+
+    def _coverage(self):
+        return self.manager._get_cursor().execute(
+            "SELECT start_time, end_time FROM sync_coverage WHERE table_name = 'EURUSD_H1'").fetchall()
+
+    def test_resync_fetches_only_missing_ranges(self):
+        self._sync(FakeMT5(), '2023-01-02', '2023-01-04')
+        self.assertEqual(self._coverage(), [(datetime(2023, 1, 2), datetime(2023, 1, 4))])
+        # 覆盖范围内不再下载，只补齐之后的部分
+        fake = FakeMT5()
+        self._sync(fake, '2023-01-02', '2023-01-06')
+        self.assertEqual([call[2:] for call in fake.calls], [(datetime(2023, 1, 4), datetime(2023, 1, 5, 23, 59, 59))])
+        self.assertEqual(self._coverage(), [(datetime(2023, 1, 2), datetime(2023, 1, 6))])
+        self.assertEqual(self.manager.get_missing_ranges('EURUSD', 'H1', '2023-01-03', '2023-01-05'), [])
+        self.assertEqual(self.manager.get_missing_ranges('EURUSD', 'H1', '2023-01-05', '2023-01-07'),
+                         [(datetime(2023, 1, 6), datetime(2023, 1, 7, 0, 0, 1))])
+        self.assertIsNone(self.manager.get_missing_ranges('GBPUSD', 'H1', '2023-01-05', '2023-01-07'))
+
+    def test_legacy_table_gaps_are_filled_incrementally(self):
+        # 没有同步记录的旧表：从数据推断覆盖范围，缺口和之后的数据一并补齐
+        bars = FakeMT5().copy_rates_range('EURUSD', FakeMT5.TIMEFRAME_H1, datetime(2026, 1, 5), datetime(2026, 1, 8))
+        bars = bars[(bars['time'] < calendar.timegm((2026, 1, 6, 0, 0, 0))) | (bars['time'] >= calendar.timegm((2026, 1, 7, 0, 0, 0)))]
+        with self.manager._get_connection() as conn:
+            self.manager._create_rates_table(conn, 'EURUSD_H1')
+            conn.register('bars', data_sync.rates_to_columns([bars]))
+            conn.execute(f"INSERT INTO EURUSD_H1 SELECT {data_sync._INSERT_COLUMNS} FROM bars")
+        fake = FakeMT5()
+        self._sync(fake)
+        self.assertEqual(fake.calls[0][2], datetime(2026, 1, 6))
+        times = self.manager._get_cursor().execute("SELECT time FROM EURUSD_H1 ORDER BY time").fetchnumpy()['time']
+        self.assertEqual(find_gaps(times, 'H1'), [])
+        # 最后一根K线可能尚未收盘，不计入覆盖范围；下次同步从它开始重新下载
+        (start, end), = self._coverage()
+        self.assertEqual((start, end), (datetime(2026, 1, 5), times[-1].astype('datetime64[s]').astype(datetime)))
+        fake = FakeMT5()
+        self._sync(fake)
+        self.assertEqual(fake.calls[0][2], end)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from data_manager import DataManager
+from duckdb_pool import DuckDBConnectionPool
+from fixtures import make_rates_frame
+
+
+class TestDuckDBConnectionPool(unittest.TestCase):
+    """测试DuckDB连接池"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'a.duckdb')
+        self.pool = DuckDBConnectionPool()
+        with self.pool.writer(self.path) as conn:
+            conn.execute("CREATE TABLE t (x INT)")
+            conn.execute("INSERT INTO t VALUES (1), (2)")
+        self.pool.close()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_cursor_is_reused_per_thread(self):
+        cursor = self.pool.cursor(self.path)
+        self.assertIs(self.pool.cursor(self.path), cursor)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.pool.cursor(self.path)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], cursor)
+        self.assertEqual(cursor.execute("SELECT SUM(x) FROM t").fetchone()[0], 3)
+
+    def test_writer_upgrades_read_only_root(self):
+        self.assertTrue(self.pool.has_table(self.path, 't'))
+        self.assertFalse(self.pool.has_table(self.path, 'u'))
+        with self.pool.writer(self.path) as conn:
+            conn.execute("CREATE TABLE u (y INT)")
+        # 旧的只读游标失效，表名目录在写入后刷新
+        self.assertTrue(self.pool.has_table(self.path, 'u'))
+        self.assertEqual(self.pool.cursor(self.path).execute("SELECT COUNT(*) FROM t").fetchone()[0], 2)
+
+    def test_several_files(self):
+        other = os.path.join(self.dir, 'b.duckdb')
+        with self.pool.writer(other) as conn:
+            conn.execute("CREATE TABLE v (z INT)")
+        self.assertEqual(self.pool.tables(self.path), frozenset({'t'}))
+        self.assertEqual(self.pool.tables(other), frozenset({'v'}))
+
+    def test_data_manager_reads_through_pool(self):
+        manager = DataManager(self.path, pool=self.pool)
+        frame = make_rates_frame(24).reset_index()
+        with manager._get_connection() as conn:
+            manager._create_rates_table(conn, 'EURUSD_H1')
+            conn.register('frame', frame)
+            conn.execute("INSERT INTO EURUSD_H1 SELECT * FROM frame")
+        data = manager.get_data('EURUSD', 'H1', '2023-01-02', '2023-01-03')
+        self.assertEqual(len(data), 24)
+        self.assertEqual(manager.get_data('EURUSD', 'H1', '2023-01-02 05:00', '2023-01-02 06:00').index.size, 2)
+        self.assertEqual([d['symbol'] for d in manager.get_local_data_list()], ['EURUSD'])
+        self.assertIsNone(manager.get_data('GBPUSD', 'H1', '2023-01-02', '2023-01-03'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,8 @@ class TradingGateway(ABC):
     交易接口的抽象基类，定义了策略与执行环境（实时或回测）交互的统一契约。
     所有方法签名和返回类型都力求与 MetaTrader5 官方库兼容。
     """
+    # 执行环境是否需要策略输出日志，策略通过 Strategy.verbose 读取；静默回测（例如参数优化）时为False
+    verbose = True
 
     @abstractmethod
     def initialize(self, **kwargs) -> bool:
@@ -43,6 +45,14 @@ class TradingGateway(ABC):
         """
         pass
 
+    @abstractmethod
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        """
+        在市场报价中显示（或隐藏）交易品种，成功返回True。
+        在回测中，只有已加载数据的品种才能被选中。
+        """
+        pass
+
     @abstractmethod
     def symbol_info_tick(self, symbol: str) -> Optional[Tick]:
         """
@@ -67,10 +77,11 @@ class TradingGateway(ABC):
         pass
 
     @abstractmethod
-    def positions_get(self, symbol: Optional[str] = None) -> Tuple[Position, ...]:
+    def positions_get(self, symbol: Optional[str] = None, magic: Optional[int] = None) -> Tuple[Position, ...]:
         """
         获取当前持仓。
         :param symbol: 如果指定，则只返回该品种的持仓。
+        :param magic: 如果指定，则只返回该魔术号的持仓。
         :return: 一个包含 PositionInfo 实例的元组。
         """
         pass